@@ -0,0 +1,76 @@
+"""Database handle caching and Client setup."""
+import threading
+
+from mongo_pool import MongoPool
+
+from .fakes import FakeClient, make_config
+
+
+class GetDatabase(object):
+    params = [10, 1000]
+    param_names = ['clusters']
+
+    def setup(self, clusters):
+        config, literals, dynamic = make_config(clusters)
+        self.pool = MongoPool(config, connection_class=FakeClient)
+        self.name = literals[-1]
+        self.pool[self.name]
+
+    def time_hot_getattr(self, clusters):
+        getattr(self.pool, self.name)
+
+    def time_hot_getitem(self, clusters):
+        self.pool[self.name]
+
+    def time_cold_getitem(self, clusters):
+        # Routing, Client lookup and a new database handle.
+        self.pool._databases.clear()
+        self.pool[self.name]
+
+
+class Disconnect(object):
+    params = [1000, 10000]
+    param_names = ['databases']
+    # Every call needs a freshly filled cache.
+    number = 1
+    repeat = 20
+
+    def setup(self, databases):
+        config, _, _ = make_config(100)
+        self.pool = MongoPool(config, connection_class=FakeClient,
+                              database_cache_size=databases)
+        for index in range(databases):
+            self.pool['logs99_%d' % index]
+
+    def time_disconnect(self, databases):
+        self.pool._disconnect()
+
+
+class FirstAccessContention(object):
+    """Threads hitting a cold pool at once."""
+    params = [(8, 1), (8, 8), (64, 1), (64, 64)]
+    param_names = ['threads', 'databases']
+    number = 1
+    repeat = 20
+
+    def setup(self, threads_databases):
+        threads, databases = threads_databases
+        config, _, _ = make_config(10)
+        self.pool = MongoPool(config, connection_class=FakeClient)
+        names = ['logs9_%d' % (index % databases)
+                 for index in range(threads)]
+        barrier = threading.Event()
+
+        def access(name):
+            barrier.wait()
+            self.pool[name]
+        self.barrier = barrier
+        self.threads = [threading.Thread(target=access, args=(name,))
+                        for name in names]
+        for thread in self.threads:
+            thread.start()
+
+    def time_first_access(self, threads_databases):
+        self.barrier.set()
+        for thread in self.threads:
+            thread.join()
@@ -0,0 +1,59 @@
+"""Minimal stand-ins for pymongo Clients.
+
+They do no I/O and next to no work, so that benchmarks measure the pool
+rather than the Client (MagicMock alone would dominate every timing).
+"""
+
+
+class FakeCommand(object):
+    def command(self, *args, **kwargs):
+        return {'ok': 1}
+
+
+class FakeDatabase(object):
+    def __init__(self, client, name):
+        self.client = client
+        self.name = name
+
+    def __getitem__(self, name):
+        return (self.name, name)
+
+    __getattr__ = __getitem__
+
+
+class FakeClient(object):
+    """Takes the keyword arguments of pymongo.MongoClient."""
+
+    def __init__(self, **options):
+        self.options = options
+        self.admin = FakeCommand()
+        self.closed = False
+
+    def __getitem__(self, name):
+        return FakeDatabase(self, name)
+
+    def close(self):
+        self.closed = True
+
+
+def make_config(clusters, regex_ratio=0.5):
+    """Builds a config of clusters clusters, a regex_ratio share of which
+    have a regexp dbpath and the others a list of literal names.
+
+    Returns:
+        A (config, literal names, regexp-matched names) tuple.
+    """
+    config = []
+    literals = []
+    dynamic = []
+    regex_count = int(clusters * regex_ratio)
+    for index in range(clusters):
+        cfg = {'host': 'mongo%d.example.com' % index, 'port': 27017}
+        if index < clusters - regex_count:
+            cfg['dbpath'] = ['db%d_a' % index, 'db%d_b' % index]
+            literals.append('db%d_a' % index)
+        else:
+            cfg['dbpath'] = 'logs%d_.*' % index
+            dynamic.append('logs%d_2014' % index)
+        config.append({'cluster%d' % index: cfg})
+    return config, literals, dynamic
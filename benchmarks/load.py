@@ -0,0 +1,161 @@
+"""Drives concurrent traffic through a MongoPool of simulated clusters.
+
+Every thread picks a random tenant database, which the pool routes to one
+of the clusters, and runs a find_one or an insert_one on it. Clusters are
+served by mongo_pool.simulation, so no MongoDB is needed, and the numbers
+reflect the pool's routing, caching, client sharing, admission control and
+connection pools under load.
+
+    python -m benchmarks.load --threads 64 --clusters 8 --latency-ms 2
+    python -m benchmarks.load --pool-size 5 --max-concurrency 4 --warmup
+    python -m benchmarks.load --failure-rate 0.01 --slow-cluster-ms 50
+"""
+import argparse
+from collections import Counter
+import random
+import threading
+import time
+
+from mongo_pool import MongoPool
+from mongo_pool.simulation import Simulation, lognormal
+
+_clock = getattr(time, 'perf_counter', time.time)
+
+
+def make_config(clusters, max_concurrency=None, max_queue=None):
+    config = []
+    for index in range(clusters):
+        cfg = {'host': 'sim%d.example.com' % index, 'port': 27017,
+               'dbpath': 'tenant%d_.*' % index}
+        if max_concurrency:
+            cfg['max_concurrency'] = max_concurrency
+            if max_queue is not None:
+                cfg['max_queue'] = max_queue
+        config.append({'cluster%d' % index: cfg})
+    return config
+
+
+def percentile(ordered, fraction):
+    if not ordered:
+        return 0.0
+    return ordered[min(int(len(ordered) * fraction), len(ordered) - 1)]
+
+
+def run(pool, clusters, tenants, threads, duration, read_ratio, seed=None):
+    """Runs the workload for duration seconds.
+
+    Returns:
+        A (sorted latencies in seconds, Counter of error names, elapsed
+        seconds) tuple.
+    """
+    deadline = _clock() + duration
+    latencies = []
+    errors = Counter()
+    lock = threading.Lock()
+
+    def worker(index):
+        rng = random.Random(None if seed is None else seed + index)
+        mine = []
+        failed = Counter()
+        while _clock() < deadline:
+            dbname = 'tenant%d_%d' % (rng.randrange(clusters),
+                                      rng.randrange(tenants))
+            start = _clock()
+            try:
+                events = pool[dbname].events
+                if rng.random() < read_ratio:
+                    events.find_one({'_id': rng.randrange(1000)})
+                else:
+                    events.insert_one({'type': 'click'})
+            except Exception as e:
+                failed[type(e).__name__] += 1
+            else:
+                mine.append(_clock() - start)
+        with lock:
+            latencies.extend(mine)
+            errors.update(failed)
+
+    workers = [threading.Thread(target=worker, args=(index,))
+               for index in range(threads)]
+    start = _clock()
+    for thread in workers:
+        thread.start()
+    for thread in workers:
+        thread.join()
+    return sorted(latencies), errors, _clock() - start
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--clusters', type=int, default=4)
+    parser.add_argument('--tenants', type=int, default=100,
+                        help='databases per cluster')
+    parser.add_argument('--threads', type=int, default=32)
+    parser.add_argument('--duration', type=float, default=5,
+                        help='seconds')
+    parser.add_argument('--read-ratio', type=float, default=0.9)
+    parser.add_argument('--latency-ms', type=float, default=2,
+                        help='median operation latency')
+    parser.add_argument('--sigma', type=float, default=0.5,
+                        help='spread of the log-normal latencies')
+    parser.add_argument('--connect-ms', type=float, default=20)
+    parser.add_argument('--pool-size', type=int, default=None,
+                        help='connections per client, maxPoolSize if unset')
+    parser.add_argument('--failure-rate', type=float, default=0)
+    parser.add_argument('--timeout-rate', type=float, default=0)
+    parser.add_argument('--slow-cluster-ms', type=float, default=None,
+                        help='median latency of cluster0, to see one slow '
+                             'cluster affect the others')
+    parser.add_argument('--max-concurrency', type=int, default=None)
+    parser.add_argument('--max-queue', type=int, default=None)
+    parser.add_argument('--warmup', action='store_true',
+                        help='connect to all clusters before the run')
+    parser.add_argument('--seed', type=int, default=None)
+    args = parser.parse_args(argv)
+
+    config = make_config(args.clusters, args.max_concurrency, args.max_queue)
+    default = {'latency_ms': lognormal(args.latency_ms, args.sigma),
+               'connect_ms': args.connect_ms, 'pool_size': args.pool_size,
+               'failure_rate': args.failure_rate,
+               'timeout_rate': args.timeout_rate, 'timeout_ms': 1000}
+    settings = {}
+    if args.slow_cluster_ms:
+        settings['cluster0'] = {'latency_ms': lognormal(args.slow_cluster_ms,
+                                                        args.sigma)}
+    simulation = Simulation(config, settings, default=default,
+                            seed=args.seed)
+    pool = MongoPool(config, connection_class=simulation)
+
+    if args.warmup:
+        start = _clock()
+        pool.warmup()
+        print('warmup: %.1fms' % ((_clock() - start) * 1000))
+
+    latencies, errors, elapsed = run(pool, args.clusters, args.tenants,
+                                     args.threads, args.duration,
+                                     args.read_ratio, args.seed)
+    operations = len(latencies) + sum(errors.values())
+    print('operations: %d in %.1fs, %.0f ops/s' % (
+        operations, elapsed, operations / elapsed))
+    print('latency ms: p50 %.2f  p90 %.2f  p99 %.2f  p99.9 %.2f  max %.2f' %
+          tuple(percentile(latencies, fraction) * 1000
+                for fraction in (0.5, 0.9, 0.99, 0.999, 1)))
+    for name, number in errors.most_common():
+        print('errors: %s %d' % (name, number))
+
+    print('%-10s %8s %8s %8s %10s %8s' % ('cluster', 'ops', 'conns',
+                                          'waits', 'wait ms', 'in use'))
+    for label, stats in sorted(simulation.stats().items()):
+        print('%-10s %8d %8d %8d %10.1f %8d' % (
+            label, stats['operations'], stats['connections'],
+            stats['checkout_waits'], stats['checkout_wait_ms'],
+            stats['max_in_use']))
+    limits = pool.stats().get('limits')
+    if limits:
+        rejected = sum(limit['rejected'] for limit in limits.values())
+        timed_out = sum(limit['timed_out'] for limit in limits.values())
+        print('admission: %d rejected, %d timed out' % (rejected, timed_out))
+
+
+if __name__ == '__main__':
+    main()
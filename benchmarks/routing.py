@@ -0,0 +1,33 @@
+"""Database name to cluster matching."""
+from itertools import count
+
+from mongo_pool import MongoPool
+
+from .fakes import FakeClient, make_config
+
+
+class MatchDbname(object):
+    params = [10, 100, 1000]
+    param_names = ['clusters']
+
+    def setup(self, clusters):
+        config, self.literals, self.dynamic = make_config(clusters)
+        self.pool = MongoPool(config, connection_class=FakeClient)
+        # Names of the last clusters, the worst case for a linear scan.
+        self.literal = self.literals[-1]
+        self.regexp = self.dynamic[-1]
+        self.prefix = self.regexp[:-len('2014')]
+        self.counter = count()
+
+    def time_literal(self, clusters):
+        self.pool._match_dbname(self.literal)
+
+    def time_regexp_memoized(self, clusters):
+        self.pool._match_dbname(self.regexp)
+
+    def time_regexp_unseen(self, clusters):
+        # A new name every time, so the memo never helps.
+        self.pool._match_dbname('%s%d' % (self.prefix, next(self.counter)))
+
+    def time_parse_config(self, clusters):
+        MongoPool(make_config(clusters)[0], connection_class=FakeClient)
@@ -0,0 +1,188 @@
+"""Runs the benchmarks and records their results.
+
+Benchmarks follow asv's conventions: classes in the modules of this package
+with time_* methods, optional params/param_names, setup/teardown called
+before/after every repeat, and optional number/repeat attributes. track_*
+methods return the seconds they measured themselves. No live server is
+needed, Clients are replaced by the fakes of benchmarks.fakes.
+
+A class may also have a budget, in seconds per call, or a {param -> seconds}
+dict. Benchmarks whose min exceeds their budget are reported and make the
+runner exit with status 1.
+
+    python -m benchmarks.run                       # all, saved per commit
+    python -m benchmarks.run -k Disconnect --quick
+    python -m benchmarks.run --compare benchmarks/results/<old commit>.json
+
+Results are saved to benchmarks/results/<commit>.json (see --output), as
+the min and median seconds per call of every benchmark.
+"""
+import argparse
+import importlib
+import json
+import os
+import platform
+import subprocess
+import sys
+import time
+
+MODULES = ('routing', 'databases', 'startup')
+RESULTS = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'results')
+
+_clock = getattr(time, 'perf_counter', time.time)
+
+
+def _git_commit():
+    try:
+        return subprocess.check_output(
+            ['git', 'rev-parse', '--short', 'HEAD'],
+            stderr=subprocess.STDOUT).decode('ascii').strip()
+    except (OSError, subprocess.CalledProcessError):
+        return 'unknown'
+
+
+def discover(pattern=None):
+    """Yields (name, class, method name, params) for every benchmark."""
+    for module_name in MODULES:
+        module = importlib.import_module('benchmarks.' + module_name)
+        for class_name in sorted(dir(module)):
+            cls = getattr(module, class_name)
+            if not isinstance(cls, type) or cls.__module__ != module.__name__:
+                continue
+            params = getattr(cls, 'params', [None])
+            for method in sorted(dir(cls)):
+                if not method.startswith(('time_', 'track_')):
+                    continue
+                for param in params:
+                    name = '%s.%s.%s' % (module_name, class_name, method)
+                    if param is not None:
+                        name = '%s(%s)' % (name, param)
+                    if pattern is None or pattern in name:
+                        yield name, cls, method, param
+
+
+def _run_once(cls, method, param, number):
+    """Runs setup, number calls and teardown, timing the calls only."""
+    args = () if param is None else (param,)
+    benchmark = cls()
+    if hasattr(benchmark, 'setup'):
+        benchmark.setup(*args)
+    function = getattr(benchmark, method)
+    start = _clock()
+    for _ in range(number):
+        function(*args)
+    elapsed = _clock() - start
+    if hasattr(benchmark, 'teardown'):
+        benchmark.teardown(*args)
+    return elapsed
+
+
+def _track_once(cls, method, param):
+    args = () if param is None else (param,)
+    benchmark = cls()
+    if hasattr(benchmark, 'setup'):
+        benchmark.setup(*args)
+    seconds = getattr(benchmark, method)(*args)
+    if hasattr(benchmark, 'teardown'):
+        benchmark.teardown(*args)
+    return seconds
+
+
+def measure(cls, method, param, repeat=None, min_time=0.05):
+    """Returns the sorted list of seconds per call over repeat runs."""
+    if method.startswith('track_'):
+        repeat = repeat or getattr(cls, 'repeat', 5)
+        return sorted(_track_once(cls, method, param)
+                      for _ in range(repeat)), 1
+
+    number = getattr(cls, 'number', None)
+    if number is None:
+        # Calibrate like timeit.autorange, so each run lasts min_time.
+        number = 1
+        while _run_once(cls, method, param, number) < min_time:
+            number *= 10
+    repeat = repeat or getattr(cls, 'repeat', 5)
+    return sorted(_run_once(cls, method, param, number) / number
+                  for _ in range(repeat)), number
+
+
+def budget(cls, param):
+    """Returns the budget of a benchmark in seconds, or None."""
+    limit = getattr(cls, 'budget', None)
+    if isinstance(limit, dict):
+        limit = limit.get(param)
+    return limit
+
+
+def _format(seconds):
+    for unit, scale in (('s', 1), ('ms', 1e3), ('us', 1e6)):
+        if seconds * scale >= 1:
+            return '%.2f%s' % (seconds * scale, unit)
+    return '%.0fns' % (seconds * 1e9)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('-k', dest='pattern',
+                        help='only run benchmarks whose name contains this')
+    parser.add_argument('--quick', action='store_true',
+                        help='a single short run per benchmark')
+    parser.add_argument('--output',
+                        help='where to save the results, "-" not to save')
+    parser.add_argument('--compare', metavar='RESULTS',
+                        help='results file to compare against')
+    args = parser.parse_args(argv)
+
+    baseline = {}
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)['results']
+
+    print('%-60s %10s %10s' % ('benchmark', 'min', 'median'))
+    results = {}
+    over_budget = []
+    for name, cls, method, param in discover(args.pattern):
+        if args.quick:
+            times, number = measure(cls, method, param, repeat=1,
+                                    min_time=0.005)
+        else:
+            times, number = measure(cls, method, param)
+        result = {'min': times[0], 'median': times[len(times) // 2],
+                  'number': number, 'repeat': len(times)}
+        results[name] = result
+
+        line = '%-60s %10s %10s' % (name, _format(result['min']),
+                                    _format(result['median']))
+        if name in baseline:
+            ratio = result['min'] / baseline[name]['min']
+            line += '  x%.2f' % ratio
+        limit = budget(cls, param)
+        if limit is not None and result['min'] > limit:
+            over_budget.append(name)
+            line += '  OVER BUDGET (%s)' % _format(limit)
+        print(line)
+        sys.stdout.flush()
+
+    commit = _git_commit()
+    output = args.output
+    if output is None:
+        if not os.path.isdir(RESULTS):
+            os.makedirs(RESULTS)
+        output = os.path.join(RESULTS, '%s.json' % commit)
+    if output != '-':
+        with open(output, 'w') as f:
+            json.dump({'commit': commit,
+                       'python': platform.python_version(),
+                       'machine': platform.node(),
+                       'date': time.strftime('%Y-%m-%dT%H:%M:%S'),
+                       'results': results}, f, indent=2, sort_keys=True)
+        print('Results saved to %s' % output)
+
+    if over_budget:
+        print('%d benchmark(s) over budget' % len(over_budget))
+        return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
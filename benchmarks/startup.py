@@ -0,0 +1,52 @@
+"""Cold start: importing the package and building a pool.
+
+Short-lived processes (cron jobs, CLI tools, serverless handlers) pay for
+both on every run, so these benchmarks have a budget, see benchmarks.run.
+"""
+import re
+import subprocess
+import sys
+
+from mongo_pool import MongoPool
+
+from .fakes import FakeClient, make_config
+
+_IMPORT = '''
+import time
+start = time.perf_counter() if hasattr(time, 'perf_counter') else time.time()
+import mongo_pool
+end = time.perf_counter() if hasattr(time, 'perf_counter') else time.time()
+print(repr(end - start))
+'''
+
+
+class Import(object):
+    repeat = 5
+    # Seconds.
+    budget = 0.05
+
+    def track_import(self):
+        # A fresh interpreter, so nothing is imported yet.
+        output = subprocess.check_output([sys.executable, '-c', _IMPORT])
+        return float(output.decode('ascii').strip())
+
+
+class Construct(object):
+    params = [10, 100, 1000]
+    param_names = ['clusters']
+    # Seconds per param.
+    budget = {10: 0.001, 100: 0.01, 1000: 0.1}
+
+    def setup(self, clusters):
+        self.config, self.literals, _ = make_config(clusters)
+
+    def time_construct(self, clusters):
+        # Compiled patterns are cached by re, which a new process does not
+        # have.
+        re.purge()
+        MongoPool(self.config, connection_class=FakeClient)
+
+    def time_construct_and_route(self, clusters):
+        re.purge()
+        pool = MongoPool(self.config, connection_class=FakeClient)
+        pool[self.literals[-1]]
@@ -1,15 +1,60 @@
 from .mongo_pool import MongoPool
-from pkg_resources import get_distribution, DistributionNotFound
 import os.path
+import sys
 
 __all__ = ['mongo_pool']
 
-try:
-    _dist = get_distribution('mongo-pool')
-    if not __file__.startswith(os.path.join(_dist.location, 'mongo_pool')):
+
+def _get_version():
+    """Returns the installed version of the package.
+
+    importlib.metadata is used where available, since pkg_resources takes
+    longer to import than the package itself.
+    """
+    try:
+        from importlib.metadata import distribution, PackageNotFoundError
+    except ImportError:
+        try:
+            from importlib_metadata import distribution, PackageNotFoundError
+        except ImportError:
+            distribution = None
+    if distribution is None:
+        from pkg_resources import get_distribution, DistributionNotFound
+        try:
+            dist = get_distribution('mongo-pool')
+        except DistributionNotFound:
+            return None
+        location, version = dist.location, dist.version
+    else:
+        try:
+            dist = distribution('mongo-pool')
+        except PackageNotFoundError:
+            return None
+        location = str(dist.locate_file(''))
+        version = dist.version
+    if not __file__.startswith(os.path.join(location, 'mongo_pool')):
         # not installed, but there is another version that *is*
-        raise DistributionNotFound
-except DistributionNotFound:
-    __version__ = 'Please install this project with setup.py'
+        return None
+    return version
+
+
+def _load(name):
+    if name == '__version__':
+        return _get_version() or 'Please install this project with setup.py'
+    # async generators are needed by the asyncio pool.
+    if name == 'AsyncMongoPool' and sys.version_info >= (3, 6):
+        from .aio import AsyncMongoPool
+        return AsyncMongoPool
+    raise AttributeError('module %r has no attribute %r' % (__name__, name))
+
+
+if sys.version_info >= (3, 7):
+    # __version__ and AsyncMongoPool are only looked up when used.
+    def __getattr__(name):
+        value = _load(name)
+        globals()[name] = value
+        return value
 else:
-    __version__ = _dist.version
+    __version__ = _load('__version__')
+    if sys.version_info >= (3, 6):
+        AsyncMongoPool = _load('AsyncMongoPool')
@@ -0,0 +1,199 @@
+import threading
+
+from pymongo.collection import Collection
+from pymongo.command_cursor import CommandCursor
+from pymongo.cursor import Cursor
+from pymongo.database import Database
+from pymongo.errors import ConnectionFailure
+
+from .cache import _clock
+
+
+class ClusterSaturated(ConnectionFailure):
+    """Raised when an operation is not admitted by a cluster's Limiter."""
+
+
+class Limiter(object):
+    """Bounds the number of concurrent operations on a cluster.
+
+    At most max_concurrency operations run at once. Up to max_queue more
+    wait for their turn, for at most queue_timeout seconds, and operations
+    beyond that are rejected right away with ClusterSaturated.
+    """
+
+    def __init__(self, label, max_concurrency, max_queue=None,
+                 queue_timeout=None):
+        """
+        Args:
+            label: the label of the cluster, for error messages.
+            max_concurrency: the maximum number of running operations.
+            max_queue: the maximum number of waiting operations,
+                max_concurrency by default.
+            queue_timeout: seconds an operation waits for its turn, None to
+                wait as long as needed.
+        """
+        if max_queue is None:
+            max_queue = max_concurrency
+        self.label = label
+        self.max_concurrency = max_concurrency
+        self.max_queue = max_queue
+        self.queue_timeout = queue_timeout
+        self.in_flight = 0
+        self.queued = 0
+        self.admitted = 0
+        self.rejected = 0
+        self.timed_out = 0
+        self._condition = threading.Condition()
+
+    def acquire(self):
+        """Wait for a free slot.
+
+        Raises:
+            ClusterSaturated: the queue is full or queue_timeout elapsed.
+        """
+        with self._condition:
+            if self.in_flight >= self.max_concurrency:
+                if self.queued >= self.max_queue:
+                    self.rejected += 1
+                    raise ClusterSaturated('Cluster %s is saturated.' %
+                                           self.label)
+                self._wait()
+            self.in_flight += 1
+            self.admitted += 1
+
+    def _wait(self):
+        deadline = None
+        if self.queue_timeout is not None:
+            deadline = _clock() + self.queue_timeout
+        self.queued += 1
+        try:
+            while self.in_flight >= self.max_concurrency:
+                remaining = None
+                if deadline is not None:
+                    remaining = deadline - _clock()
+                    if remaining <= 0:
+                        self.timed_out += 1
+                        raise ClusterSaturated(
+                            'Timed out waiting for cluster %s.' % self.label)
+                self._condition.wait(remaining)
+        finally:
+            self.queued -= 1
+
+    def release(self):
+        with self._condition:
+            self.in_flight -= 1
+            self._condition.notify()
+
+    def __enter__(self):
+        self.acquire()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.release()
+
+    def stats(self):
+        with self._condition:
+            return {'in_flight': self.in_flight,
+                    'queued': self.queued,
+                    'admitted': self.admitted,
+                    'rejected': self.rejected,
+                    'timed_out': self.timed_out,
+                    'max_concurrency': self.max_concurrency,
+                    'max_queue': self.max_queue}
+
+
+class _Limited(object):
+    """Runs the methods of a pymongo object under a Limiter.
+
+    Databases, Collections and cursors obtained through the object are
+    limited as well. Other attributes are returned as they are.
+    """
+    __slots__ = ('_target', '_limiter')
+
+    def __init__(self, target, limiter):
+        self._target = target
+        self._limiter = limiter
+
+    def __getattr__(self, name):
+        value = getattr(self._target, name)
+        # Collections are callable, so check for them first.
+        if isinstance(value, _LIMITED_TYPES) or not callable(value):
+            return limit(value, self._limiter)
+        limiter = self._limiter
+
+        def call(*args, **kwargs):
+            with limiter:
+                result = value(*args, **kwargs)
+            return limit(result, limiter)
+        return call
+
+    def __getitem__(self, key):
+        return limit(self._target[key], self._limiter)
+
+    def __eq__(self, other):
+        if isinstance(other, _Limited):
+            other = other._target
+        return self._target == other
+
+    def __ne__(self, other):
+        return not self == other
+
+    def __hash__(self):
+        return hash(self._target)
+
+    def __repr__(self):
+        return 'Limited(%r)' % (self._target,)
+
+
+class LimitedCursor(_Limited):
+    """A cursor fetching each document under a Limiter.
+
+    The slot is only held while a document (and, when the current batch is
+    exhausted, the next batch) is fetched, not for the cursor's lifetime.
+    """
+    __slots__ = ()
+
+    def __iter__(self):
+        return self
+
+    def next(self):
+        with self._limiter:
+            return next(self._target)
+
+    __next__ = next
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self._target.close()
+
+
+# The classes wrapped by limit, see register_types.
+_OBJECT_TYPES = (Database, Collection)
+_CURSOR_TYPES = (Cursor, CommandCursor)
+_LIMITED_TYPES = _OBJECT_TYPES + _CURSOR_TYPES
+
+
+def register_types(objects=(), cursors=()):
+    """Makes limit wrap other classes than pymongo's.
+
+    Args:
+        objects: Database and Collection-like classes.
+        cursors: cursor classes, whose documents are fetched with next.
+    """
+    global _OBJECT_TYPES, _CURSOR_TYPES, _LIMITED_TYPES
+    _OBJECT_TYPES += tuple(cls for cls in objects
+                           if cls not in _OBJECT_TYPES)
+    _CURSOR_TYPES += tuple(cls for cls in cursors
+                           if cls not in _CURSOR_TYPES)
+    _LIMITED_TYPES = _OBJECT_TYPES + _CURSOR_TYPES
+
+
+def limit(value, limiter):
+    """Wraps Databases, Collections and cursors to run under limiter."""
+    if isinstance(value, _CURSOR_TYPES):
+        return LimitedCursor(value, limiter)
+    if isinstance(value, _OBJECT_TYPES):
+        return _Limited(value, limiter)
+    return value
@@ -0,0 +1,381 @@
+"""asyncio counterpart of MongoPool, see AsyncMongoPool.
+
+This module needs python 3.6 or later, and motor unless another connection
+class is given.
+"""
+import asyncio
+import heapq
+import inspect
+import re
+
+from .cache import LRUCache, _clock
+from .clients import client_key
+from .fanout import SortKey, normalize_sort
+from .mongo_pool import MongoPool
+from .routing import Router
+
+
+async def _maybe_await(value):
+    # Motor returns futures where pymongo-like fakes may not.
+    if inspect.isawaitable(value):
+        value = await value
+    return value
+
+
+class AsyncMongoPool(object):
+    """Routes database names to clusters like MongoPool, with async Clients.
+
+    The configuration and routing are the same as MongoPool's. Clients are
+    created lazily, once per cluster even when many coroutines ask for the
+    same cluster at once, and clusters with identical connection parameters
+    share a Client. Everything runs on the event loop, no thread pool is
+    involved.
+
+        pool = AsyncMongoPool(config)
+        db = await pool.get_database('analytics')
+        await db.events.insert_one({'type': 'click'})
+        ...
+        await pool.aclose()
+
+    Databases are returned by get_database rather than by attribute access,
+    since creating a Client may have to wait. The admission control and
+    hedging options of the configuration are not used.
+    """
+
+    # Configuration handling and routing are shared with MongoPool.
+    _parse_configs = MongoPool._parse_configs
+    _parse_dbpath = staticmethod(MongoPool._parse_dbpath)
+    _get_read_preference = staticmethod(MongoPool._get_read_preference)
+    _client_options = MongoPool._client_options
+    _clusters = MongoPool._clusters
+    _get_cluster_config = MongoPool._get_cluster_config
+    _match_dbname = MongoPool._match_dbname
+
+    def __init__(self, config, network_timeout=None, connection_class=None,
+                 j=False, database_cache_size=1000, client_options=None):
+        """
+        Args:
+            config: the list of cluster configurations, see MongoPool.
+            network_timeout: socketTimeoutMS of the Clients.
+            connection_class: the async Client class, or a coroutine function
+                returning a Client. motor's AsyncIOMotorClient by default.
+            j: journaling for the Clients.
+            database_cache_size: the maximum number of cached databases.
+            client_options: pool-wide client tuning options, see MongoPool.
+
+        Raises:
+            TypeError: a fault in the configurations is found
+            ValueError: an invalid value is found in the configurations
+            ImportError: motor is not installed and no connection_class is
+                given.
+        """
+        self._network_timeout = network_timeout
+        MongoPool._validate_client_options(client_options or {})
+        self._client_options_defaults = dict(client_options or {})
+        MongoPool._validate_config(config)
+        self._router = Router(self._parse_configs(config))
+        self._databases = LRUCache(max_size=database_cache_size)
+        # { client key -> Client }, for clusters sharing a Client.
+        self._connections = {}
+        self._instrumentation = None
+        self.j = j
+
+        if connection_class is None:
+            try:
+                from motor.motor_asyncio import AsyncIOMotorClient
+            except ImportError:
+                raise ImportError('AsyncMongoPool needs motor, install it '
+                                  'or pass a connection_class')
+            connection_class = AsyncIOMotorClient
+        self._connection_class = connection_class
+
+    async def get_cluster(self, label):
+        """Returns the Client of a cluster.
+
+        Raises:
+            AttributeError: there is no cluster with the given label in the
+                config
+        """
+        return await self._get_connection(self._get_cluster_config(label))
+
+    async def get_database(self, name):
+        """Returns the database with the given name, from its cluster.
+
+        Raises:
+            Exception: the database does not match any cluster.
+        """
+        database = self._databases.get(name)
+        if database is None:
+            cluster = self._match_dbname(name)
+            connection = await self._get_connection(cluster)
+            database = connection[name]
+            self._databases.set(name, database)
+        return database
+
+    async def _get_connection(self, cluster):
+        connection = cluster.get('connection')
+        if connection is not None:
+            return connection
+
+        # asyncio locks are created lazily, since they belong to the event
+        # loop running when they are first used on older pythons.
+        lock = cluster.get('async_lock')
+        if lock is None:
+            lock = cluster['async_lock'] = asyncio.Lock()
+        async with lock:
+            connection = cluster.get('connection')
+            if connection is None:
+                options = self._client_options(cluster)
+                key = client_key(options)
+                connection = self._connections.get(key)
+                if connection is None:
+                    connection = await _maybe_await(
+                        self._connection_class(**options))
+                    # Another cluster with the same key may have created
+                    # its Client meanwhile.
+                    shared = self._connections.setdefault(key, connection)
+                    if shared is not connection:
+                        await _maybe_await(connection.close())
+                        connection = shared
+                cluster['connection'] = connection
+        return connection
+
+    async def warmup(self, labels=None, dbnames=None, timeout=None,
+                     ping=True):
+        """Connect to clusters ahead of time, concurrently.
+
+        Args:
+            labels: labels of the clusters to connect to. If neither labels
+                nor dbnames are given, all clusters are warmed up.
+            dbnames: database names whose clusters are connected to. They are
+                also added to the database cache.
+            timeout: seconds to wait for all clusters, None to wait forever.
+            ping: whether to run a ping command to make sure that the cluster
+                is actually reachable.
+
+        Returns:
+            A {label -> {'seconds': float, 'error': Exception or None}} dict.
+            Clusters that did not finish in time have an asyncio.TimeoutError
+            as error and None as seconds.
+        """
+        if labels is None and dbnames is None:
+            selected = list(self._clusters)
+        else:
+            selected = [self._get_cluster_config(label)
+                        for label in labels or []]
+            selected.extend(self._match_dbname(dbname)
+                            for dbname in dbnames or [])
+        clusters = {}
+        for cluster in selected:
+            clusters.setdefault(cluster['label'], cluster)
+
+        async def connect(cluster):
+            start = _clock()
+            error = None
+            try:
+                connection = await self._get_connection(cluster)
+                if ping:
+                    await _maybe_await(connection.admin.command('ping'))
+            except Exception as e:
+                error = e
+            return {'seconds': _clock() - start, 'error': error}
+
+        tasks = dict((label, asyncio.ensure_future(connect(cluster)))
+                     for label, cluster in clusters.items())
+        results = {}
+        if tasks:
+            await asyncio.wait(list(tasks.values()), timeout=timeout)
+        for label, task in tasks.items():
+            if task.done():
+                results[label] = task.result()
+            else:
+                task.cancel()
+                results[label] = {'seconds': None,
+                                  'error': asyncio.TimeoutError()}
+
+        for dbname in dbnames or []:
+            if results[self._match_dbname(dbname)['label']]['error'] is None:
+                await self.get_database(dbname)
+        return results
+
+    async def find_databases(self, db_pattern, labels=None):
+        """Lists the databases matching a dbpath-like pattern which are
+        routed to the cluster they were found on.
+
+        Args:
+            db_pattern: a dbpath-like pattern.
+            labels: only list databases on the clusters with these labels.
+
+        Returns:
+            The sorted list of database names.
+        """
+        pattern = re.compile(self._parse_dbpath(db_pattern))
+        clusters = self._clusters
+        if labels is not None:
+            clusters = [self._get_cluster_config(label) for label in labels]
+
+        # Clusters sharing a Client are listed once.
+        connections = {}
+        owners = {}
+        for cluster in clusters:
+            connection = await self._get_connection(cluster)
+            connections[id(connection)] = connection
+            owners.setdefault(id(connection), set()).add(cluster['label'])
+
+        keys = list(connections)
+        listed = await asyncio.gather(*[
+            _maybe_await(connections[key].list_database_names())
+            for key in keys])
+        dbnames = []
+        for key, names in zip(keys, listed):
+            for name in names:
+                if not pattern.match(name):
+                    continue
+                cluster = self._router.match(name)
+                if cluster is not None and cluster['label'] in owners[key]:
+                    dbnames.append(name)
+        return sorted(dbnames)
+
+    async def fanout(self, db_pattern, collection, filter=None, sort=None,
+                     projection=None, limit=None, batch_size=100,
+                     labels=None):
+        """Query a collection in many databases concurrently.
+
+        The async counterpart of MongoPool.fanout: documents are yielded as
+        soon as any database returns them or, when a sort is given, merged so
+        that they come out globally sorted. At most max(batch_size, 1) * 2
+        documents per database are buffered.
+
+            async for comment in pool.fanout('comments_2014.*', 'comments',
+                                             sort='created_at'):
+                ...
+
+        Args:
+            db_pattern: a dbpath-like pattern, matched against the database
+                names listed on the clusters, or an explicit list of database
+                names.
+            collection: the name of the collection to query.
+            filter, projection: passed to find.
+            sort: a key name or a list of (key, direction) pairs.
+            limit: the maximum number of documents returned overall.
+            batch_size: the number of documents fetched at once per database.
+            labels: only list databases on the clusters with these labels.
+        """
+        if isinstance(db_pattern, list):
+            dbnames = db_pattern
+        else:
+            dbnames = await self.find_databases(db_pattern, labels)
+        sort = normalize_sort(sort)
+
+        cursors = []
+        for dbname in dbnames:
+            database = await self.get_database(dbname)
+            cursors.append(database[collection].find(
+                filter, projection, sort=sort, limit=limit or 0,
+                batch_size=batch_size))
+
+        if sort:
+            documents = _iterate_sorted(cursors, sort)
+        else:
+            documents = _iterate_unordered(cursors, batch_size)
+        count = 0
+        try:
+            async for document in documents:
+                yield document
+                count += 1
+                if limit and count >= limit:
+                    break
+        finally:
+            await documents.aclose()
+            for cursor in cursors:
+                await _maybe_await(cursor.close())
+
+    async def aclose(self):
+        """Close all Clients. The pool connects again if it is used later.
+        """
+        connections, self._connections = self._connections, {}
+        for cluster in self._clusters:
+            cluster.pop('connection', None)
+        self._databases.clear()
+        for connection in connections.values():
+            await _maybe_await(connection.close())
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc_info):
+        await self.aclose()
+
+
+class _Failed(object):
+    """Carries the error of a cursor through the queue of documents."""
+
+    def __init__(self, error):
+        self.error = error
+
+
+async def _iterate_unordered(cursors, batch_size):
+    """Yields the documents of cursors as soon as any of them has some.
+
+    Each cursor has at most max(batch_size, 1) * 2 documents waiting, so
+    that a fast database can't take the buffer of the others.
+    """
+    done = object()
+    # (slots of the cursor, document), or (None, done or a _Failed)
+    queue = asyncio.Queue()
+
+    async def consume(cursor):
+        slots = asyncio.Semaphore(max(batch_size, 1) * 2)
+        try:
+            async for document in cursor:
+                await slots.acquire()
+                queue.put_nowait((slots, document))
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            queue.put_nowait((None, _Failed(e)))
+        else:
+            queue.put_nowait((None, done))
+
+    tasks = [asyncio.ensure_future(consume(cursor)) for cursor in cursors]
+    try:
+        running = len(tasks)
+        while running:
+            slots, document = await queue.get()
+            if slots is not None:
+                slots.release()
+            if document is done:
+                running -= 1
+            elif isinstance(document, _Failed):
+                raise document.error
+            else:
+                yield document
+    finally:
+        for task in tasks:
+            task.cancel()
+
+
+async def _iterate_sorted(cursors, sort):
+    """K-way merges the documents of cursors, each sorted by sort."""
+    async def first(iterator):
+        try:
+            return [await iterator.__anext__()]
+        except StopAsyncIteration:
+            return []
+
+    iterators = [cursor.__aiter__() for cursor in cursors]
+    heads = await asyncio.gather(*[first(iterator)
+                                   for iterator in iterators])
+    heap = [(SortKey(head[0], sort), index, head[0])
+            for index, head in enumerate(heads) if head]
+    heapq.heapify(heap)
+
+    while heap:
+        _, index, document = heap[0]
+        yield document
+        following = await first(iterators[index])
+        if following:
+            heapq.heapreplace(
+                heap, (SortKey(following[0], sort), index, following[0]))
+        else:
+            heapq.heappop(heap)
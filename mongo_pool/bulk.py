@@ -0,0 +1,126 @@
+from collections import OrderedDict
+from concurrent import futures
+
+from pymongo.errors import BulkWriteError
+
+# Counters of pymongo's bulk_api_result which are summed per namespace.
+_COUNTERS = ('nInserted', 'nMatched', 'nModified', 'nRemoved', 'nUpserted')
+
+
+class BulkRouter(object):
+    """Groups write operations by cluster and namespace and sends them in
+    unordered bulk_write batches.
+
+    Operations are pymongo write models (InsertOne, UpdateOne, ...). Each
+    cluster is written to by its own thread, so a handful of batches replace
+    one round trip per operation.
+
+        router = pool.bulk_router(batch_size=500)
+        for event in events:
+            router.add('events_%s' % event['tenant'], 'events',
+                       InsertOne(event))
+        results = router.execute()
+
+    Since batches are unordered, operations on the same namespace may be
+    applied in any order.
+    """
+
+    def __init__(self, pool, batch_size=1000, workers=8):
+        """
+        Args:
+            pool: the MongoPool routing the databases.
+            batch_size: the maximum number of operations per bulk_write.
+            workers: the maximum number of clusters written to at once.
+        """
+        if batch_size < 1:
+            raise ValueError('batch_size must be a positive number')
+        self._pool = pool
+        self._batch_size = batch_size
+        self._workers = workers
+        # label -> {(dbname, collection) -> [operations]}
+        self._operations = OrderedDict()
+
+    def __len__(self):
+        return sum(len(operations)
+                   for namespaces in self._operations.values()
+                   for operations in namespaces.values())
+
+    def add(self, dbname, collection, operation):
+        """Queue an operation.
+
+        Raises:
+            Exception: the database does not match any cluster.
+        """
+        label = self._pool._match_dbname(dbname)['label']
+        namespaces = self._operations.setdefault(label, OrderedDict())
+        namespaces.setdefault((dbname, collection), []).append(operation)
+
+    def extend(self, operations):
+        """Queue an iterable of (dbname, collection, operation) tuples."""
+        for dbname, collection, operation in operations:
+            self.add(dbname, collection, operation)
+
+    def execute(self):
+        """Send all queued operations and clear the queue.
+
+        Returns:
+            A {(dbname, collection) -> result} dict. Each result holds the
+            summed nInserted, nMatched, nModified, nRemoved and nUpserted
+            counters, the writeErrors (whose index is the position of the
+            operation among the ones queued for the namespace) and
+            writeConcernErrors reported by the server, and errors, the list
+            of other exceptions raised while resolving the namespace (e.g.
+            ClusterUnavailable) or writing.
+        """
+        operations, self._operations = self._operations, OrderedDict()
+        if not operations:
+            return {}
+
+        results = {}
+        executor = futures.ThreadPoolExecutor(
+            max_workers=max(1, min(self._workers, len(operations))))
+        try:
+            for namespaces in executor.map(self._write_cluster,
+                                           operations.values()):
+                results.update(namespaces)
+        finally:
+            executor.shutdown(wait=True)
+        return results
+
+    def _write_cluster(self, namespaces):
+        results = {}
+        for (dbname, collection), operations in namespaces.items():
+            result = dict((counter, 0) for counter in _COUNTERS)
+            result.update(writeErrors=[], writeConcernErrors=[], errors=[])
+            results[(dbname, collection)] = result
+
+            try:
+                target = self._pool[dbname][collection]
+            except Exception as e:
+                # e.g. ClusterUnavailable, which must not lose the results
+                # of the other namespaces.
+                result['errors'].append(e)
+                continue
+            for offset in range(0, len(operations), self._batch_size):
+                batch = operations[offset:offset + self._batch_size]
+                try:
+                    details = target.bulk_write(batch,
+                                                ordered=False).bulk_api_result
+                except BulkWriteError as e:
+                    details = e.details
+                except Exception as e:
+                    result['errors'].append(e)
+                    continue
+                self._merge(result, details, offset)
+        return results
+
+    @staticmethod
+    def _merge(result, details, offset):
+        for counter in _COUNTERS:
+            result[counter] += details.get(counter, 0)
+        for error in details.get('writeErrors', []):
+            error = dict(error)
+            error['index'] = error.get('index', 0) + offset
+            result['writeErrors'].append(error)
+        result['writeConcernErrors'].extend(
+            details.get('writeConcernErrors', []))
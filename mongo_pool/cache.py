@@ -0,0 +1,140 @@
+from collections import OrderedDict
+import threading
+import time
+
+# time.monotonic is not available on python 2.
+_clock = getattr(time, 'monotonic', time.time)
+
+
+class LRUCache(object):
+    """A size and age bounded mapping with least recently used eviction.
+
+    Lookups, insertions and evictions are all O(1). Entries older than ttl
+    seconds are dropped when they are next looked up. The cache is safe to
+    share between threads.
+    """
+
+    def __init__(self, max_size=None, ttl=None, on_evict=None):
+        """
+        Args:
+            max_size: maximum number of entries, None for no limit.
+            ttl: number of seconds an entry is kept, None for no limit.
+            on_evict: optional callable, called with the key and the value of
+                every entry evicted because of max_size or ttl.
+        """
+        if max_size is not None and max_size < 1:
+            raise ValueError('max_size must be a positive number')
+        if ttl is not None and ttl <= 0:
+            raise ValueError('ttl must be a positive number')
+
+        self.max_size = max_size
+        self.ttl = ttl
+        self.on_evict = on_evict
+        # key -> (value, expiration time)
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def __len__(self):
+        return len(self._entries)
+
+    def __contains__(self, key):
+        return key in self._entries
+
+    def get(self, key, default=None):
+        """Returns the value stored for key and marks it as recently used."""
+        with self._lock:
+            entry = self._entries.pop(key, None)
+            if entry is None:
+                self.misses += 1
+                return default
+
+            value, expires = entry
+            expired = expires is not None and expires <= _clock()
+            if expired:
+                self.evictions += 1
+                self.misses += 1
+            else:
+                self._entries[key] = entry
+                self.hits += 1
+
+        if not expired:
+            return value
+        if self.on_evict is not None:
+            self.on_evict(key, value)
+        return default
+
+    def set(self, key, value, ttl=None):
+        """Stores value for key, evicting the least recently used entries.
+
+        Args:
+            key, value: the entry.
+            ttl: number of seconds this entry is kept, instead of the cache's
+                ttl.
+        """
+        ttl = ttl or self.ttl
+        expires = None
+        if ttl is not None:
+            expires = _clock() + ttl
+
+        evicted = []
+        with self._lock:
+            self._entries.pop(key, None)
+            self._entries[key] = (value, expires)
+            if self.max_size is not None:
+                while len(self._entries) > self.max_size:
+                    evicted.append(self._entries.popitem(last=False))
+                    self.evictions += 1
+
+        if self.on_evict is not None:
+            for evicted_key, (evicted_value, _) in evicted:
+                self.on_evict(evicted_key, evicted_value)
+
+    def items(self):
+        """Returns a list of the (key, value) pairs, without touching them."""
+        with self._lock:
+            return [(key, value) for key, (value, _) in self._entries.items()]
+
+    def pop(self, key, default=None):
+        """Removes key and returns its value."""
+        with self._lock:
+            entry = self._entries.pop(key, None)
+        if entry is None:
+            return default
+        return entry[0]
+
+    def discard_if(self, predicate):
+        """Removes every entry for which predicate(key, value) is true.
+
+        Returns:
+            The list of removed keys.
+        """
+        with self._lock:
+            removed = [key for key, (value, _) in self._entries.items()
+                       if predicate(key, value)]
+            for key in removed:
+                del self._entries[key]
+        return removed
+
+    def clear(self):
+        """Removes all entries.
+
+        Returns:
+            The list of removed (key, value) pairs.
+        """
+        with self._lock:
+            removed = [(key, value)
+                       for key, (value, _) in self._entries.items()]
+            self._entries.clear()
+        return removed
+
+    def stats(self):
+        """Returns a dict with the size and the counters of the cache."""
+        with self._lock:
+            return {'size': len(self._entries),
+                    'max_size': self.max_size,
+                    'hits': self.hits,
+                    'misses': self.misses,
+                    'evictions': self.evictions}
@@ -0,0 +1,88 @@
+import threading
+
+
+def client_key(params):
+    """Builds a hashable key out of the parameters used to create a Client.
+
+    Clients built with equal keys are interchangeable. Host lists are sorted,
+    since the order of the seeds doesn't matter, and unhashable values (such
+    as read preferences) are represented by their repr.
+    """
+    def freeze(name, value):
+        if name == 'host':
+            if not isinstance(value, list):
+                value = [value]
+            return tuple(sorted(value))
+        if isinstance(value, dict):
+            return tuple(sorted((k, freeze(k, v)) for k, v in value.items()))
+        if isinstance(value, (list, tuple)):
+            return tuple(freeze(None, v) for v in value)
+        try:
+            hash(value)
+        except TypeError:
+            return repr(value)
+        return value
+
+    return freeze(None, params)
+
+
+class ClientRegistry(object):
+    """Shares Clients between clusters with identical connection parameters.
+
+    Every cluster using a Client holds a reference to it. Clients are created
+    once per key, even under concurrent access, and closed when the last
+    reference is released.
+    """
+
+    def __init__(self):
+        # key -> {'client', 'refs', 'lock'}
+        self._entries = {}
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def acquire(self, key, create):
+        """Returns the Client for key, creating it with create() if needed.
+
+        Args:
+            key: a key built by client_key.
+            create: a callable returning a new Client.
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                entry = {'client': None, 'refs': 0, 'lock': threading.Lock()}
+                self._entries[key] = entry
+            entry['refs'] += 1
+
+        # Only the creation of this key's Client is serialized, other keys
+        # can be connected to in parallel.
+        with entry['lock']:
+            if entry['client'] is None:
+                try:
+                    entry['client'] = create()
+                except Exception:
+                    self.release(key)
+                    raise
+        return entry['client']
+
+    def release(self, key, close=True):
+        """Drops a reference to the Client for key, closing it if unused.
+
+        Args:
+            key: a key built by client_key.
+            close: whether to close the Client once unused. Otherwise it is
+                only forgotten, and left to whoever still holds it.
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return
+            entry['refs'] -= 1
+            if entry['refs'] > 0:
+                return
+            del self._entries[key]
+
+        if close and entry['client'] is not None:
+            entry['client'].close()
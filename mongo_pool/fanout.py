@@ -0,0 +1,251 @@
+from concurrent import futures
+from datetime import datetime
+from itertools import islice
+import heapq
+import numbers
+import re
+
+from bson.binary import Binary
+from bson.decimal128 import Decimal128
+from bson.max_key import MaxKey
+from bson.min_key import MinKey
+from bson.objectid import ObjectId
+from bson.regex import Regex
+from bson.timestamp import Timestamp
+import pymongo
+import six
+
+
+class BatchSource(object):
+    """Reads a cursor one batch at a time on an executor.
+
+    The next batch is fetched in the background while the current one is
+    consumed, so at most two batches per source are held in memory. Fetches
+    of a source never overlap, since cursors are not thread-safe.
+    """
+
+    def __init__(self, executor, cursor, batch_size):
+        self.cursor = cursor
+        self._executor = executor
+        self._batch_size = batch_size
+        self.future = executor.submit(self._fetch)
+
+    def _fetch(self):
+        return list(islice(self.cursor, self._batch_size))
+
+    def next_batch(self):
+        """Waits for the pending batch and starts fetching the next one.
+
+        Returns:
+            A list of documents, empty once the cursor is exhausted.
+        """
+        batch = self.future.result()
+        if batch:
+            self.future = self._executor.submit(self._fetch)
+        else:
+            self.future = None
+        return batch
+
+    def close(self):
+        if self.future is not None:
+            self.future.cancel()
+            self.future = None
+
+
+def iterate_unordered(sources):
+    """Yields documents from sources as soon as any batch is available."""
+    pending = dict((source.future, source) for source in sources)
+    while pending:
+        done, _ = futures.wait(pending, return_when=futures.FIRST_COMPLETED)
+        for future in done:
+            source = pending.pop(future)
+            batch = source.next_batch()
+            if batch:
+                pending[source.future] = source
+            for document in batch:
+                yield document
+
+
+def iterate_sorted(sources, sort):
+    """K-way merges the documents of sources, each sorted by sort."""
+    def documents(source):
+        while True:
+            batch = source.next_batch()
+            if not batch:
+                return
+            for document in batch:
+                yield document
+
+    heap = []
+    iterators = [documents(source) for source in sources]
+    for index, iterator in enumerate(iterators):
+        for document in islice(iterator, 1):
+            heap.append((SortKey(document, sort), index, document))
+    heapq.heapify(heap)
+
+    while heap:
+        _, index, document = heap[0]
+        yield document
+        for following in islice(iterators[index], 1):
+            heapq.heapreplace(
+                heap, (SortKey(following, sort), index, following))
+            break
+        else:
+            heapq.heappop(heap)
+
+
+def _lookup(document, path):
+    for part in path.split('.'):
+        if not isinstance(document, dict):
+            return None
+        document = document.get(part)
+    return document
+
+
+# Ranks of the BSON types, in the order MongoDB compares them. Empty arrays
+# sort before null.
+(_MIN_KEY, _EMPTY_ARRAY, _NULL, _NUMBER, _STRING, _OBJECT, _ARRAY, _BINARY,
+ _OBJECT_ID, _BOOLEAN, _DATE, _TIMESTAMP, _REGEX, _MAX_KEY) = range(14)
+
+_PATTERN = type(re.compile(''))
+
+
+def _comparable(value):
+    """Returns a key ordering values as MongoDB does: by BSON type first,
+    then by value. Missing values are None and sort with null."""
+    if value is None:
+        return (_NULL,)
+    if isinstance(value, bool):
+        return (_BOOLEAN, value)
+    if isinstance(value, numbers.Number):
+        return (_NUMBER, value)
+    if isinstance(value, Decimal128):
+        return (_NUMBER, value.to_decimal())
+    # Binary before strings, since Python 2 strings are bytes.
+    if isinstance(value, Binary):
+        return (_BINARY, len(value), value.subtype, bytes(value))
+    if isinstance(value, six.string_types):
+        return (_STRING, value)
+    if isinstance(value, six.binary_type):
+        return (_BINARY, len(value), 0, value)
+    if isinstance(value, dict):
+        # Field by field: the type of the value, the name, then the value.
+        fields = []
+        for key, item in value.items():
+            item = _comparable(item)
+            fields.append((item[0], key, item))
+        return (_OBJECT, fields)
+    if isinstance(value, (list, tuple)):
+        return (_ARRAY, [_comparable(item) for item in value])
+    if isinstance(value, ObjectId):
+        return (_OBJECT_ID, value)
+    if isinstance(value, datetime):
+        return (_DATE, value)
+    if isinstance(value, Timestamp):
+        return (_TIMESTAMP, value)
+    if isinstance(value, (Regex, _PATTERN)):
+        return (_REGEX, value.pattern, value.flags)
+    if isinstance(value, MinKey):
+        return (_MIN_KEY,)
+    if isinstance(value, MaxKey):
+        return (_MAX_KEY,)
+    # Unknown types come last, by name rather than failing.
+    return (_MAX_KEY + 1, type(value).__name__, value)
+
+
+def _sort_value(value, direction):
+    """Returns the comparable value a document is sorted by.
+
+    Like in MongoDB, arrays sort by their smallest element in ascending
+    sorts, and by their largest one in descending sorts.
+    """
+    if not isinstance(value, list):
+        return _comparable(value)
+    if not value:
+        return (_EMPTY_ARRAY,)
+    items = [_comparable(item) for item in value]
+    if direction == pymongo.DESCENDING:
+        return max(items)
+    return min(items)
+
+
+class SortKey(object):
+    """Orders documents according to a pymongo sort specification."""
+    __slots__ = ('_values', '_directions')
+
+    def __init__(self, document, sort):
+        self._values = [_sort_value(_lookup(document, key), direction)
+                        for key, direction in sort]
+        self._directions = [direction for _, direction in sort]
+
+    def __lt__(self, other):
+        for mine, theirs, direction in zip(self._values, other._values,
+                                           self._directions):
+            if mine == theirs:
+                continue
+            if direction == pymongo.DESCENDING:
+                return theirs < mine
+            return mine < theirs
+        return False
+
+
+def normalize_sort(sort):
+    """Turns a field name or a list of (key, direction) into a list."""
+    if sort is None:
+        return None
+    if isinstance(sort, (list, tuple)) and sort and isinstance(
+            sort[0], (list, tuple)):
+        return [tuple(item) for item in sort]
+    return [(sort, pymongo.ASCENDING)]
+
+
+def stream_cursors(cursors, batch_size, workers, sort=None):
+    """Reads cursors concurrently and streams their documents.
+
+    Args:
+        cursors: an iterable of cursors, opened as they are taken from it.
+        batch_size: the number of documents fetched from a cursor at once.
+        workers: the number of threads fetching batches.
+        sort: a normalized sort followed by every cursor, whose documents
+            are then merged in that order. Otherwise documents are yielded
+            as their batches arrive.
+    """
+    executor = futures.ThreadPoolExecutor(max_workers=workers)
+    sources = []
+    try:
+        for cursor in cursors:
+            sources.append(BatchSource(executor, cursor, batch_size))
+
+        if sort:
+            documents = iterate_sorted(sources, sort)
+        else:
+            documents = iterate_unordered(sources)
+        for document in documents:
+            yield document
+    finally:
+        for source in sources:
+            source.close()
+        # Let fetches which already started finish before closing cursors.
+        executor.shutdown(wait=True)
+        for source in sources:
+            source.cursor.close()
+
+
+def fanout(pool, dbnames, collection, filter=None, sort=None,
+           projection=None, limit=None, batch_size=100, workers=8):
+    """Runs a find on many databases concurrently and streams the results.
+
+    See MongoPool.fanout.
+    """
+    sort = normalize_sort(sort)
+    cursors = (pool[dbname][collection].find(filter, projection, sort=sort,
+                                             limit=limit or 0,
+                                             batch_size=batch_size)
+               for dbname in dbnames)
+    documents = stream_cursors(cursors, batch_size, workers, sort)
+    try:
+        for document in islice(documents, limit or None):
+            yield document
+    finally:
+        # Stops the fetches once the limit is reached.
+        documents.close()
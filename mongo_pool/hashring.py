@@ -0,0 +1,58 @@
+import bisect
+import hashlib
+
+
+def _hash(key):
+    # Python's hash() is salted per process, placement must not be.
+    return int(hashlib.md5(key.encode('utf-8')).hexdigest()[:16], 16)
+
+
+class HashRing(object):
+    """Consistent hashing of names over weighted members.
+
+    Each member gets vnodes * weight points on the ring, placed by hashing
+    its key, and a name belongs to the member owning the first point after
+    the hash of the name. Placement only depends on the member keys and
+    weights, so it is the same in every process, and adding a member only
+    moves names to that member.
+    """
+
+    def __init__(self, members, vnodes=160):
+        """
+        Args:
+            members: list of (key, weight, value) tuples. get returns the
+                value of the member owning a name.
+            vnodes: number of points of a member of weight 1.
+        """
+        if not members:
+            raise ValueError('A hash ring needs at least one member')
+        points = []
+        for key, weight, value in members:
+            for index in range(max(1, int(round(vnodes * weight)))):
+                points.append((_hash('%s#%d' % (key, index)), key, value))
+        points.sort(key=lambda point: point[:2])
+
+        self.members = members
+        self.vnodes = vnodes
+        self._hashes = [point[0] for point in points]
+        self._values = [point[2] for point in points]
+
+    def get(self, name):
+        """Returns the value of the member owning name."""
+        index = bisect.bisect(self._hashes, _hash(name))
+        if index == len(self._hashes):
+            index = 0
+        return self._values[index]
+
+    def moves(self, other, names):
+        """Returns which names are placed differently on another ring.
+
+        Returns:
+            A {name -> (value on this ring, value on the other ring)} dict.
+        """
+        moved = {}
+        for name in names:
+            old, new = self.get(name), other.get(name)
+            if old != new:
+                moved[name] = (old, new)
+        return moved
@@ -0,0 +1,183 @@
+from concurrent import futures
+import threading
+
+from pymongo.errors import ConnectionFailure
+
+from .cache import _clock
+
+CLOSED = 'closed'
+OPEN = 'open'
+HALF_OPEN = 'half_open'
+
+
+class ClusterUnavailable(ConnectionFailure):
+    """Raised instead of using a cluster whose circuit breaker is open."""
+
+
+class CircuitBreaker(object):
+    """Tracks the health of one cluster.
+
+    The breaker opens after failure_threshold consecutive failed checks.
+    Once reset_timeout seconds passed, the next check is a trial (the
+    breaker is half open while it runs): it closes the breaker if it
+    succeeds and opens it again otherwise. Operations are only allowed while
+    the breaker is closed.
+    """
+
+    def __init__(self, failure_threshold=3, reset_timeout=30):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.state = CLOSED
+        self.failures = 0
+        self.opened_at = None
+        self.last_check = None
+        self.last_error = None
+        self._lock = threading.Lock()
+
+    def allow(self):
+        return self.state == CLOSED
+
+    def should_check(self):
+        """Whether a check should run now, moving an open breaker whose
+        reset_timeout elapsed to half open."""
+        with self._lock:
+            if self.state != OPEN:
+                return True
+            if _clock() - self.opened_at >= self.reset_timeout:
+                self.state = HALF_OPEN
+                return True
+            return False
+
+    def record_success(self):
+        with self._lock:
+            self.state = CLOSED
+            self.failures = 0
+            self.opened_at = None
+            self.last_check = _clock()
+            self.last_error = None
+
+    def record_failure(self, error):
+        with self._lock:
+            self.failures += 1
+            self.last_check = _clock()
+            self.last_error = error
+            if (self.state == HALF_OPEN or
+                    self.failures >= self.failure_threshold):
+                self.state = OPEN
+                self.opened_at = _clock()
+
+    def summary(self):
+        with self._lock:
+            return {'state': self.state,
+                    'failures': self.failures,
+                    'last_check': self.last_check,
+                    'last_error': self.last_error}
+
+
+class HealthMonitor(object):
+    """Pings the connected clusters of a MongoPool in the background and
+    feeds their circuit breakers.
+
+    Clusters without a Client are not checked, so that health checks don't
+    connect to clusters nobody uses. A ping taking longer than ping_timeout
+    counts as a failure, and a cluster is not pinged again while its previous
+    ping is still running.
+    """
+
+    def __init__(self, pool, interval=5, ping_timeout=2, failure_threshold=3,
+                 reset_timeout=30):
+        self._pool = pool
+        self.interval = interval
+        self.ping_timeout = ping_timeout
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        # label -> CircuitBreaker
+        self.breakers = {}
+        self._pending = {}
+        self._lock = threading.Lock()
+        self._stopped = threading.Event()
+        self._executor = futures.ThreadPoolExecutor(max_workers=8)
+        self._thread = None
+
+    def breaker(self, label):
+        breaker = self.breakers.get(label)
+        if breaker is None:
+            with self._lock:
+                breaker = self.breakers.setdefault(
+                    label, CircuitBreaker(self.failure_threshold,
+                                          self.reset_timeout))
+        return breaker
+
+    def start(self):
+        self._stopped.clear()
+        self._thread = threading.Thread(target=self._run,
+                                        name='mongo-pool-health')
+        self._thread.daemon = True
+        self._thread.start()
+
+    def stop(self):
+        self._stopped.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+        self._executor.shutdown(wait=False)
+
+    def after_fork(self):
+        """Restart in a forked child, where the thread no longer exists."""
+        self._lock = threading.Lock()
+        for breaker in self.breakers.values():
+            breaker._lock = threading.Lock()
+        self._pending = {}
+        self._executor = futures.ThreadPoolExecutor(max_workers=8)
+        if self._thread is not None:
+            self.start()
+
+    def _run(self):
+        while not self._stopped.wait(self.interval):
+            self.check()
+
+    def check(self):
+        """Ping every connected cluster once, waiting at most ping_timeout.
+
+        Clusters whose breaker is not closed are pinged even when their
+        Client was released (by set_timeout, reload or the idle reaper): the
+        ping creates a new one, as operations can't while the breaker is
+        open.
+        """
+        started = {}
+        for cluster in self._pool._clusters:
+            label = cluster['label']
+            if label in self._pending:
+                continue
+            connection = cluster.get('connection')
+            if connection is None:
+                breaker = self.breakers.get(label)
+                if breaker is None or breaker.state == CLOSED:
+                    continue
+            breaker = self.breaker(label)
+            if not breaker.should_check():
+                continue
+            future = self._executor.submit(self._ping, cluster)
+            started[future] = label
+            self._pending[label] = future
+
+        done, _ = futures.wait(started, timeout=self.ping_timeout)
+        for future, label in started.items():
+            breaker = self.breaker(label)
+            if future in done:
+                del self._pending[label]
+                error = future.exception()
+                if error is None:
+                    breaker.record_success()
+                else:
+                    breaker.record_failure(error)
+            else:
+                breaker.record_failure(futures.TimeoutError('ping timed out'))
+                future.add_done_callback(
+                    lambda _, label=label: self._pending.pop(label, None))
+
+    def _ping(self, cluster):
+        connection = cluster.get('connection')
+        if connection is None:
+            connection = self._pool._get_connection(cluster)
+        return connection.admin.command('ping')
@@ -0,0 +1,149 @@
+import threading
+
+from .cache import _clock
+from .lazy import LazyModule
+
+futures = LazyModule('concurrent.futures')
+
+# Hedge delay derived from the latencies of the cluster's reads.
+AUTO = 'auto'
+# Reads needed before the adaptive delay is trusted, and the delay used
+# until then.
+AUTO_MIN_SAMPLES = 20
+AUTO_DEFAULT_DELAY_MS = 50
+AUTO_QUANTILE = 0.95
+
+
+class HedgeStats(object):
+    """Counters and read latencies of the hedged reads of one cluster."""
+
+    def __init__(self):
+        # Imported here since instrumentation depends on pymongo, see
+        # MongoPool.
+        from .instrumentation import Histogram
+        self.latency = Histogram()
+        self.reads = 0
+        self.hedged = 0
+        self.won = 0
+        self._lock = threading.Lock()
+
+    def record_read(self, hedged):
+        with self._lock:
+            self.reads += 1
+            if hedged:
+                self.hedged += 1
+
+    def record_win(self):
+        with self._lock:
+            self.won += 1
+
+    def summary(self):
+        return {'reads': self.reads,
+                'hedged': self.hedged,
+                'won': self.won,
+                'latency': self.latency.summary()}
+
+
+class Hedger(object):
+    """Runs a read and, if it is slow, the same read against another member.
+
+    The first read is given delay_ms milliseconds to answer. After that, the
+    hedge is sent and the first successful answer of the two is returned.
+    A read failing before the delay is hedged right away. The losing read is
+    not cancelled, its result is dropped once it completes.
+    """
+
+    def __init__(self, workers=32):
+        """
+        Args:
+            workers: the maximum number of reads running at once, hedges
+                included.
+        """
+        self._workers = workers
+        self._executor = None
+        # label -> HedgeStats
+        self._stats = {}
+        self._lock = threading.Lock()
+
+    def stats(self, label):
+        stats = self._stats.get(label)
+        if stats is None:
+            with self._lock:
+                stats = self._stats.setdefault(label, HedgeStats())
+        return stats
+
+    def summary(self):
+        return dict((label, stats.summary())
+                    for label, stats in list(self._stats.items()))
+
+    def after_fork(self):
+        """Drop the executor, whose threads don't exist in a forked child."""
+        self._executor = None
+        self._lock = threading.Lock()
+        for stats in self._stats.values():
+            stats._lock = threading.Lock()
+
+    def _get_executor(self):
+        if self._executor is None:
+            with self._lock:
+                if self._executor is None:
+                    self._executor = futures.ThreadPoolExecutor(
+                        max_workers=self._workers)
+        return self._executor
+
+    def delay(self, label, delay_ms):
+        """Returns the hedge delay in seconds, resolving AUTO to the p95
+        read latency of the cluster."""
+        if delay_ms == AUTO:
+            latency = self.stats(label).latency
+            if latency.count < AUTO_MIN_SAMPLES:
+                delay_ms = AUTO_DEFAULT_DELAY_MS
+            else:
+                delay_ms = latency.quantile(AUTO_QUANTILE)
+        return delay_ms / 1000.0
+
+    def read(self, label, read, hedge, delay_ms):
+        """Runs read, and hedge as well if read is slow or fails.
+
+        Args:
+            label: the label of the cluster, stats are kept per label.
+            read, hedge: callables running the same read against different
+                members.
+            delay_ms: milliseconds to wait for read before running hedge, or
+                AUTO.
+
+        Returns:
+            The result of the first successful callable.
+
+        Raises:
+            Exception: the error of read, if both callables failed.
+        """
+        stats = self.stats(label)
+        delay = self.delay(label, delay_ms)
+        executor = self._get_executor()
+        start = _clock()
+        first = executor.submit(read)
+        pending = [first]
+        done, _ = futures.wait(pending, timeout=delay)
+        hedged = not done or first.exception() is not None
+        if hedged:
+            pending.append(executor.submit(hedge))
+        stats.record_read(hedged)
+
+        error = None
+        while pending:
+            done, _ = futures.wait(pending,
+                                   return_when=futures.FIRST_COMPLETED)
+            # Prefer the first read when both are done.
+            for future in list(pending):
+                if future not in done:
+                    continue
+                pending.remove(future)
+                if future.exception() is None:
+                    if future is not first:
+                        stats.record_win()
+                    stats.latency.record((_clock() - start) * 1000)
+                    return future.result()
+                if future is first or error is None:
+                    error = future.exception()
+        raise error
@@ -0,0 +1,231 @@
+import math
+import threading
+
+from pymongo import monitoring
+
+from .cache import _clock
+
+# Connection pool events were added in pymongo 3.9.
+_HAS_POOL_EVENTS = hasattr(monitoring, 'ConnectionPoolListener')
+
+
+class Histogram(object):
+    """A log-bucketed histogram of millisecond values.
+
+    Buckets grow by 10%, so quantiles are reported with at most 10% error
+    while memory stays constant whatever the number of samples.
+    """
+
+    _MIN = 0.001
+    _LOG_GROWTH = math.log(1.1)
+
+    def __init__(self):
+        # bucket index -> count
+        self._buckets = {}
+        self._lock = threading.Lock()
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def record(self, value):
+        if value <= self._MIN:
+            index = 0
+        else:
+            index = int(math.ceil(math.log(value / self._MIN) /
+                                  self._LOG_GROWTH))
+        with self._lock:
+            self._buckets[index] = self._buckets.get(index, 0) + 1
+            self.count += 1
+            self.total += value
+            if value > self.max:
+                self.max = value
+
+    def quantile(self, q):
+        """Returns an upper bound of the q quantile, None if there are no
+        samples."""
+        with self._lock:
+            if not self.count:
+                return None
+            rank = q * self.count
+            seen = 0
+            for index in sorted(self._buckets):
+                seen += self._buckets[index]
+                if seen >= rank:
+                    break
+            return min(self._MIN * math.exp(index * self._LOG_GROWTH),
+                       self.max)
+
+    def summary(self):
+        return {'count': self.count,
+                'mean': self.total / self.count if self.count else None,
+                'p50': self.quantile(0.5),
+                'p99': self.quantile(0.99),
+                'max': self.max if self.count else None}
+
+
+class ClusterStats(object):
+    """Counters and histograms of the Client(s) of one cluster."""
+
+    def __init__(self):
+        self.commands = Histogram()
+        self.checkout_wait = Histogram()
+        self.command_errors = 0
+        self.checkout_errors = 0
+        self.heartbeat_errors = 0
+        self.connections = 0
+
+    def summary(self):
+        return {'commands': self.commands.summary(),
+                'command_errors': self.command_errors,
+                'checkout_wait': self.checkout_wait.summary(),
+                'checkout_errors': self.checkout_errors,
+                'heartbeat_errors': self.heartbeat_errors,
+                'connections': self.connections}
+
+
+class Instrumentation(object):
+    """Collects per-cluster metrics through pymongo's monitoring listeners.
+
+    Pass an instance (or True) as MongoPool's instrumentation argument and
+    read the metrics with MongoPool.stats(). Every Client created by the pool
+    gets listeners tagged with the label of the cluster which created it;
+    clusters sharing a Client are reported under that label.
+    """
+
+    def __init__(self, hooks=None):
+        """
+        Args:
+            hooks: optional list of callables, called with the label, the
+                metric name and the value of every recorded sample, to export
+                metrics as they are recorded.
+        """
+        self.hooks = list(hooks or [])
+        self.routing = Histogram()
+        # label -> ClusterStats
+        self._clusters = {}
+        self._lock = threading.Lock()
+
+    def cluster(self, label):
+        stats = self._clusters.get(label)
+        if stats is None:
+            with self._lock:
+                stats = self._clusters.setdefault(label, ClusterStats())
+        return stats
+
+    def record(self, label, metric, value):
+        """Records a sample of a histogram metric.
+
+        The label is None for metrics of the pool itself, such as routing.
+        """
+        target = self if label is None else self.cluster(label)
+        getattr(target, metric).record(value)
+        for hook in self.hooks:
+            hook(label, metric, value)
+
+    def increment(self, label, metric, value=1):
+        """Updates a counter of a cluster."""
+        stats = self.cluster(label)
+        with self._lock:
+            setattr(stats, metric, getattr(stats, metric) + value)
+        for hook in self.hooks:
+            hook(label, metric, value)
+
+    def listeners(self, label):
+        """Returns the pymongo event listeners for a cluster's Client."""
+        listeners = [_CommandListener(self, label),
+                     _HeartbeatListener(self, label)]
+        if _HAS_POOL_EVENTS:
+            listeners.append(_PoolListener(self, label))
+        return listeners
+
+    def summary(self):
+        with self._lock:
+            clusters = dict(self._clusters)
+        return {'routing': self.routing.summary(),
+                'clusters': dict((label, stats.summary())
+                                 for label, stats in clusters.items())}
+
+
+class _CommandListener(monitoring.CommandListener):
+    def __init__(self, instrumentation, label):
+        self._instrumentation = instrumentation
+        self._label = label
+
+    def started(self, event):
+        pass
+
+    def succeeded(self, event):
+        self._instrumentation.record(self._label, 'commands',
+                                     event.duration_micros / 1000.0)
+
+    def failed(self, event):
+        self._instrumentation.record(self._label, 'commands',
+                                     event.duration_micros / 1000.0)
+        self._instrumentation.increment(self._label, 'command_errors')
+
+
+class _HeartbeatListener(monitoring.ServerHeartbeatListener):
+    def __init__(self, instrumentation, label):
+        self._instrumentation = instrumentation
+        self._label = label
+
+    def started(self, event):
+        pass
+
+    def succeeded(self, event):
+        pass
+
+    def failed(self, event):
+        self._instrumentation.increment(self._label, 'heartbeat_errors')
+
+
+if _HAS_POOL_EVENTS:
+    class _PoolListener(monitoring.ConnectionPoolListener):
+        """Measures how long operations wait for a pooled connection.
+
+        Check out events are published by the thread checking out, so the
+        start time is kept in a thread local.
+        """
+
+        def __init__(self, instrumentation, label):
+            self._instrumentation = instrumentation
+            self._label = label
+            self._local = threading.local()
+
+        def connection_check_out_started(self, event):
+            self._local.start = _clock()
+
+        def connection_checked_out(self, event):
+            start = getattr(self._local, 'start', None)
+            if start is not None:
+                self._local.start = None
+                self._instrumentation.record(
+                    self._label, 'checkout_wait', (_clock() - start) * 1000)
+
+        def connection_check_out_failed(self, event):
+            self._local.start = None
+            self._instrumentation.increment(self._label, 'checkout_errors')
+
+        def connection_created(self, event):
+            self._instrumentation.increment(self._label, 'connections')
+
+        def connection_closed(self, event):
+            self._instrumentation.increment(self._label, 'connections', -1)
+
+        def pool_created(self, event):
+            pass
+
+        def pool_ready(self, event):
+            pass
+
+        def pool_cleared(self, event):
+            pass
+
+        def pool_closed(self, event):
+            pass
+
+        def connection_ready(self, event):
+            pass
+
+        def connection_checked_in(self, event):
+            pass
@@ -0,0 +1,33 @@
+import importlib
+
+
+class LazyModule(object):
+    """Stands for a module which is only imported on first attribute access.
+
+    Setting or deleting attributes also goes to the module, so that the
+    module can still be patched through the stand-in.
+    """
+
+    def __init__(self, name):
+        object.__setattr__(self, '_name', name)
+        object.__setattr__(self, '_module', None)
+
+    def _load(self):
+        module = object.__getattribute__(self, '_module')
+        if module is None:
+            module = importlib.import_module(
+                object.__getattribute__(self, '_name'))
+            object.__setattr__(self, '_module', module)
+        return module
+
+    def __getattr__(self, name):
+        return getattr(self._load(), name)
+
+    def __setattr__(self, name, value):
+        setattr(self._load(), name, value)
+
+    def __delattr__(self, name):
+        delattr(self._load(), name)
+
+    def __repr__(self):
+        return '<lazy module %r>' % object.__getattribute__(self, '_name')
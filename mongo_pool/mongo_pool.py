@@ -1,6 +1,41 @@
-import pymongo
+import contextlib
+import os
+import random
 import re
 import six
+import threading
+import weakref
+
+from .cache import LRUCache, _clock
+from .clients import ClientRegistry, client_key
+from .hashring import HashRing
+from .hedging import AUTO, Hedger
+from .lazy import LazyModule
+from .reaper import IdleReaper
+from .routing import Router
+
+# pymongo, and the modules of this package which depend on it, are only
+# imported once they are needed, so that importing mongo_pool and building a
+# MongoPool stay cheap.
+pymongo = LazyModule('pymongo')
+futures = LazyModule('concurrent.futures')
+
+# Client tuning options which can be set per cluster or for the whole pool.
+# They are passed as they are to the connection class.
+CLIENT_OPTIONS = ('maxPoolSize', 'minPoolSize', 'maxIdleTimeMS',
+                  'waitQueueTimeoutMS', 'connectTimeoutMS', 'localThresholdMS',
+                  'compressors')
+COMPRESSORS = ('zstd', 'snappy', 'zlib')
+# Admission control options of a cluster, see Limiter.
+LIMIT_OPTIONS = ('max_concurrency', 'max_queue', 'queue_timeout')
+# Hash ring points per unit of weight of a shard group member.
+DEFAULT_VNODES = 160
+# Names of the pymongo.ReadPreference values.
+READ_PREFERENCES = ('PRIMARY', 'PRIMARY_PREFERRED', 'SECONDARY',
+                    'SECONDARY_PREFERRED', 'NEAREST')
+
+# Marks "use the pool's network timeout" where None is a valid timeout.
+_DEFAULT_TIMEOUT = object()
 
 
 class MongoPool(object):
@@ -10,21 +45,127 @@ class MongoPool(object):
     """
 
     def __init__(self, config, network_timeout=None, connection_class=None,
-                 j=False):
+                 j=False, database_cache_size=1000, database_cache_ttl=None,
+                 fork_hooks=False, client_options=None,
+                 max_timeout_variants=4, instrumentation=None,
+                 query_cache=None, query_cache_size=10000):
         super(MongoPool, self).__init__()
         # Set timeout.
         self._network_timeout = network_timeout
+        # Pool-wide client tuning, which clusters can override.
+        self._validate_client_options(client_options or {})
+        self._client_options_defaults = dict(client_options or {})
 
-        # { label -> cluster config } dict
-        self._clusters = []
         self._validate_config(config)
-        self._parse_configs(config)
-        self._mapped_databases = []
+        # Holds the cluster configs, in configuration order, and maps
+        # database names to them. Replaced as a whole by reload.
+        self._router = Router(self._parse_configs(config))
+        self._reload_lock = threading.Lock()
+        # { database name -> pymongo.Database } cache, bounded so that
+        # dynamic dbpaths don't pile up handles forever.
+        self._databases = LRUCache(max_size=database_cache_size,
+                                   ttl=database_cache_ttl)
+        # Clusters with identical connection parameters share a Client.
+        self._clients = ClientRegistry()
+        # { network timeout -> Clients } for timeouts other than the pool's,
+        # see with_timeout. Evicted variants have their Clients released.
+        self._timeout_variants = LRUCache(max_size=max_timeout_variants,
+                                          on_evict=self._release_variant)
+        self._timeout_variants_lock = threading.Lock()
+        # Holds the timeout set by the timeout() context manager.
+        self._local = threading.local()
+        # Clients are not fork-safe, so remember which process owns them.
+        self._pid = os.getpid()
+        if fork_hooks and hasattr(os, 'register_at_fork'):
+            self._register_fork_hook()
 
-        self._connection_class = connection_class or pymongo.MongoClient
+        # Circuit breakers, see start_health_checks.
+        self._health = None
+        # Releases unused Clients, see start_idle_reaper.
+        self._reaper = None
+        # Runs hedged reads, see hedged_find_one.
+        self._hedger = Hedger()
+        # Optional per-cluster metrics, see stats.
+        if instrumentation is True:
+            from .instrumentation import Instrumentation
+            instrumentation = Instrumentation()
+        self._instrumentation = instrumentation
+        # Optional cache of query results, see _validate_query_cache.
+        self._query_cache = None
+        if query_cache is not None:
+            self._validate_query_cache(query_cache)
+        if query_cache:
+            from .querycache import QueryCache
+            rules = [(re.compile(self._parse_dbpath(rule['dbpath'])),
+                      rule['collections'], rule['ttl'])
+                     for rule in query_cache]
+            self._query_cache = QueryCache(rules, max_size=query_cache_size)
+
+        # None for pymongo.MongoClient, see _connection_class.
+        self._custom_connection_class = connection_class
         # Journaling for pymongo.
         self.j = j
 
+    @property
+    def _connection_class(self):
+        return self._custom_connection_class or pymongo.MongoClient
+
+    def _register_fork_hook(self):
+        """Reset the pool in forked children as soon as they start.
+
+        Only a weak reference to the pool is kept, since fork hooks can't be
+        unregistered.
+        """
+        pool_ref = weakref.ref(self)
+
+        def after_in_child():
+            pool = pool_ref()
+            if pool is not None:
+                pool._check_pid()
+
+        os.register_at_fork(after_in_child=after_in_child)
+
+    def _check_pid(self):
+        """Drop Clients and databases inherited from a parent process.
+
+        The inherited Clients are not closed, since their sockets and monitor
+        state still belong to the parent. Locks are replaced as well, because
+        they may have been held by another thread while forking.
+        """
+        pid = os.getpid()
+        if pid == self._pid:
+            return
+        for cluster in self._clusters:
+            cluster.pop('connection', None)
+            cluster.pop('client_key', None)
+            cluster.pop('last_used', None)
+            cluster.pop('members', None)
+            cluster.pop('member_keys', None)
+            cluster['lock'] = threading.Lock()
+            if 'limits' in cluster:
+                from .admission import Limiter
+                cluster['limiter'] = Limiter(cluster['label'],
+                                             *cluster['limits'])
+        self._clients = ClientRegistry()
+        self._databases = LRUCache(max_size=self._databases.max_size,
+                                   ttl=self._databases.ttl)
+        self._timeout_variants = LRUCache(
+            max_size=self._timeout_variants.max_size,
+            on_evict=self._release_variant)
+        self._timeout_variants_lock = threading.Lock()
+        if self._health is not None:
+            self._health.after_fork()
+        if self._reaper is not None:
+            self._reaper.after_fork()
+        self._hedger.after_fork()
+        if self._query_cache is not None:
+            self._query_cache.after_fork()
+        self._pid = pid
+
+    @property
+    def _clusters(self):
+        return self._router.clusters
+
     def get_cluster(self, label):
         """Returns a connection to a mongo-clusters.
 
@@ -38,11 +179,675 @@ class MongoPool(object):
             AttributeError: there is no cluster with the given label in the
                 config
         """
+        cluster = self._get_cluster_config(label)
+        self._check_available(cluster)
+        return self._get_connection(cluster)
+
+    def start_health_checks(self, interval=5, ping_timeout=2,
+                            failure_threshold=3, reset_timeout=30):
+        """Start pinging the connected clusters in the background.
+
+        Each cluster gets a circuit breaker, which opens after
+        failure_threshold consecutive failed (or slower than ping_timeout)
+        pings. While it is open, accessing the cluster's databases raises
+        ClusterUnavailable right away instead of waiting for timeouts. After
+        reset_timeout seconds, a trial ping closes the breaker again if it
+        succeeds. See health for the state of the clusters.
+
+        Args:
+            interval: seconds between two rounds of pings.
+            ping_timeout: seconds after which a ping counts as failed.
+            failure_threshold: consecutive failures opening a breaker.
+            reset_timeout: seconds before an open breaker is tried again.
+        """
+        from .health import HealthMonitor
+        self.stop_health_checks()
+        health = HealthMonitor(self, interval=interval,
+                               ping_timeout=ping_timeout,
+                               failure_threshold=failure_threshold,
+                               reset_timeout=reset_timeout)
+        health.start()
+        self._health = health
+
+    def stop_health_checks(self):
+        """Stop the health checks and close all circuit breakers."""
+        health, self._health = self._health, None
+        if health is not None:
+            health.stop()
+
+    def health(self):
+        """Returns the circuit breaker state of the checked clusters.
+
+        Returns:
+            A {label -> {'state', 'failures', 'last_check', 'last_error'}}
+            dict, where state is 'closed', 'open' or 'half_open'. Empty if
+            health checks are not running.
+        """
+        health = self._health
+        if health is None:
+            return {}
+        return dict((label, breaker.summary())
+                    for label, breaker in list(health.breakers.items()))
+
+    def start_idle_reaper(self, idle_timeout=300, interval=None):
+        """Start releasing the Clients of idle clusters in the background.
+
+        Every interval seconds, the Clients of the clusters whose databases
+        were not resolved through the pool for idle_timeout seconds are
+        released, along with their cached databases, see reap_idle_clients.
+        The next access to such a cluster connects again.
+
+        Args:
+            idle_timeout: seconds after which an unused cluster is released.
+            interval: seconds between two checks, idle_timeout / 10 by
+                default.
+        """
+        if idle_timeout <= 0:
+            raise ValueError('idle_timeout must be a positive number')
+        if interval is None:
+            interval = idle_timeout / 10.0
+        self.stop_idle_reaper()
+        reaper = IdleReaper(self, idle_timeout, interval)
+        reaper.start()
+        self._reaper = reaper
+
+    def stop_idle_reaper(self):
+        """Stop releasing idle Clients."""
+        reaper, self._reaper = self._reaper, None
+        if reaper is not None:
+            reaper.stop()
+
+    def reap_idle_clients(self, idle_timeout):
+        """Release the Clients of clusters not used for idle_timeout seconds.
+
+        A cluster is used whenever one of its databases or its Client is
+        resolved through the pool, not when operations run on them: the use
+        of databases or Clients kept elsewhere (e.g. in a module global) is
+        not seen by the pool.
+
+        Before pymongo 4, released Clients are closed, and the databases
+        still held elsewhere keep working since pymongo reconnects closed
+        Clients. pymongo 4 Clients can't be used once closed, so they are
+        only dropped by the pool and left to the databases still holding
+        them: pymongo stops their monitors and closes their connections once
+        they are garbage collected.
+
+        Args:
+            idle_timeout: seconds after which an unused cluster is released.
+
+        Returns:
+            The list of labels of the released clusters.
+        """
+        self._check_pid()
+        deadline = _clock() - idle_timeout
+        idle = [cluster for cluster in self._clusters
+                if cluster.get('last_used', deadline + 1) <= deadline]
+        if not idle:
+            return []
+
+        # Drop the cached databases first, so that they are not handed out
+        # once their Client is closed.
+        idle_ids = set(id(cluster) for cluster in idle)
+        self._databases.discard_if(
+            lambda key, entry: id(entry[1]) in idle_ids)
+
+        close = pymongo.version_tuple < (4,)
+        reaped = []
+        for cluster in idle:
+            # Skip clusters used while their databases were being dropped.
+            if cluster.get('last_used', deadline + 1) > deadline:
+                continue
+            self._release_cluster(cluster, close=close)
+            reaped.append(cluster['label'])
+        return reaped
+
+    def _get_cluster_config(self, label):
         for cluster in self._clusters:
             if label == cluster['label']:
-                return self._get_connection(cluster)
+                return cluster
         raise AttributeError('No such cluster %s.' % label)
 
+    def warmup(self, labels=None, dbnames=None, parallelism=8, timeout=None,
+               ping=True):
+        """Connect to clusters ahead of time, in parallel.
+
+        Clients are normally created on the first access to one of their
+        databases. Warming up creates them concurrently on a thread pool, so
+        that no request pays for the connection setup.
+
+        Args:
+            labels: labels of the clusters to connect to. If neither labels
+                nor dbnames are given, all clusters are warmed up.
+            dbnames: database names whose clusters are connected to. They are
+                also added to the database cache.
+            parallelism: the maximum number of clusters connected to at once.
+            timeout: seconds to wait for all clusters, None to wait forever.
+            ping: whether to run a ping command to make sure that the cluster
+                is actually reachable.
+
+        Returns:
+            A {label -> {'seconds': float, 'error': Exception or None}} dict.
+            Clusters that did not finish in time have a
+            concurrent.futures.TimeoutError as error and None as seconds.
+
+        Raises:
+            AttributeError: there is no cluster with one of the given labels.
+            Exception: one of the database names does not match any cluster.
+        """
+        if labels is None and dbnames is None:
+            selected = list(self._clusters)
+        else:
+            selected = [self._get_cluster_config(label)
+                        for label in labels or []]
+            selected.extend(self._match_dbname(dbname)
+                            for dbname in dbnames or [])
+        # Connect to each cluster only once.
+        clusters = []
+        for cluster in selected:
+            if cluster['label'] not in [c['label'] for c in clusters]:
+                clusters.append(cluster)
+
+        def connect(cluster):
+            start = _clock()
+            error = None
+            try:
+                connection = self._get_connection(cluster)
+                if ping:
+                    connection.admin.command('ping')
+            except Exception as e:
+                error = e
+            return {'seconds': _clock() - start, 'error': error}
+
+        results = {}
+        executor = futures.ThreadPoolExecutor(
+            max_workers=max(1, min(parallelism, len(clusters))))
+        try:
+            pending = dict((executor.submit(connect, cluster), cluster['label'])
+                           for cluster in clusters)
+            done, not_done = futures.wait(pending, timeout=timeout)
+            for future in done:
+                results[pending[future]] = future.result()
+            for future in not_done:
+                future.cancel()
+                results[pending[future]] = {
+                    'seconds': None, 'error': futures.TimeoutError()}
+        finally:
+            # Don't block on clusters that timed out.
+            executor.shutdown(wait=False)
+
+        for dbname in dbnames or []:
+            if results[self._match_dbname(dbname)['label']]['error'] is None:
+                self[dbname]
+        return results
+
+    def fanout(self, db_pattern, collection, filter=None, sort=None,
+               projection=None, limit=None, batch_size=100, workers=8,
+               labels=None):
+        """Query a collection in many databases concurrently.
+
+        The find is issued on every matching database, on a thread pool of
+        workers threads, and results are streamed back lazily. Each database
+        only has the batch being consumed and the next one in memory. When a
+        sort is given, every database is queried with it and the results are
+        merged, so they come out globally sorted.
+
+            for comment in pool.fanout('comments_2014.*', 'comments',
+                                       {'author': 'x'}, sort='created_at'):
+                ...
+
+        Args:
+            db_pattern: a dbpath-like pattern, matched against the database
+                names listed on the clusters, or an explicit list of database
+                names.
+            collection: the name of the collection to query.
+            filter, projection: passed to find.
+            sort: a key name or a list of (key, direction) pairs.
+            limit: the maximum number of documents returned overall.
+            batch_size: the number of documents fetched at once per database.
+            workers: the maximum number of concurrent fetches.
+            labels: only list databases on the clusters with these labels.
+
+        Returns:
+            A generator of documents. Closing it stops all queries.
+        """
+        from .fanout import fanout
+        if isinstance(db_pattern, list):
+            dbnames = db_pattern
+        else:
+            dbnames = self._find_databases(db_pattern, labels, workers)
+        return fanout(self, dbnames, collection, filter=filter, sort=sort,
+                      projection=projection, limit=limit,
+                      batch_size=batch_size, workers=workers)
+
+    def _find_databases(self, db_pattern, labels=None, workers=8):
+        """List the databases matching db_pattern which are routed to the
+        cluster they were found on."""
+        pattern = re.compile(self._parse_dbpath(db_pattern))
+        clusters = self._clusters
+        if labels is not None:
+            clusters = [self._get_cluster_config(label) for label in labels]
+
+        # Clusters sharing a Client are listed once.
+        connections = {}
+        owners = {}
+        for cluster in clusters:
+            connection = self._get_connection(cluster)
+            connections[id(connection)] = connection
+            owners.setdefault(id(connection), set()).add(cluster['label'])
+
+        def list_databases(connection):
+            return connection.list_database_names()
+
+        keys = list(connections)
+        executor = futures.ThreadPoolExecutor(max_workers=workers)
+        try:
+            listed = executor.map(list_databases,
+                                  [connections[key] for key in keys])
+            dbnames = []
+            for key, names in zip(keys, listed):
+                for name in names:
+                    if not pattern.match(name):
+                        continue
+                    cluster = self._router.match(name)
+                    if (cluster is not None and
+                            cluster['label'] in owners[key]):
+                        dbnames.append(name)
+        finally:
+            executor.shutdown(wait=False)
+        return sorted(dbnames)
+
+    def bulk_router(self, batch_size=1000, workers=8):
+        """Returns a BulkRouter writing through this pool.
+
+        Args:
+            batch_size: the maximum number of operations per bulk_write.
+            workers: the maximum number of clusters written to at once.
+        """
+        from .bulk import BulkRouter
+        return BulkRouter(self, batch_size=batch_size, workers=workers)
+
+    def buffered_writer(self, dbname, collection, max_batch=500,
+                        max_delay_ms=100, max_buffer=10000, block=True):
+        """Returns a BufferedWriter inserting into a collection in batches,
+        from a background thread.
+
+        Args:
+            dbname, collection: where documents are inserted.
+            max_batch: the maximum number of documents per insert_many.
+            max_delay_ms: the maximum time a document waits to be flushed.
+            max_buffer: the maximum number of queued documents.
+            block: whether writes wait for room when the buffer is full,
+                rather than dropping the document.
+        """
+        from .writer import BufferedWriter
+        return BufferedWriter(self, dbname, collection, max_batch=max_batch,
+                              max_delay_ms=max_delay_ms,
+                              max_buffer=max_buffer, block=block)
+
+    def parallel_scan(self, dbname, collection, filter=None, projection=None,
+                      partitions=8, workers=8, batch_size=1000,
+                      split='sample', callback=None):
+        """Reads a whole collection with one cursor per _id range.
+
+        The collection is split into partitions _id ranges holding similar
+        numbers of documents, which are read concurrently on a thread pool of
+        workers threads. Reads go through the cluster's Client, with its
+        read preference, so they can be spread over secondaries.
+
+            for event in pool.parallel_scan('analytics', 'events',
+                                            {'type': 'click'}, partitions=16,
+                                            workers=8):
+                ...
+
+        Args:
+            dbname, collection: what to read.
+            filter, projection: passed to find.
+            partitions: the number of _id ranges. Fewer ranges are read when
+                the collection has too few distinct _ids.
+            workers: the maximum number of concurrent fetches.
+            batch_size: the number of documents fetched at once per range.
+            split: 'sample' to split on a $sample of the _ids, or
+                'bucket_auto' to split with $bucketAuto, which is more even
+                but reads all the _ids.
+            callback: if given, called as callback(range filter, documents)
+                for every batch, from the worker threads, instead of
+                returning the documents.
+
+        Returns:
+            A generator of documents, in no particular order. Each range only
+            has the batch being consumed and the next one in memory, and
+            closing the generator stops all queries. With a callback, the
+            number of documents read, once all ranges were read.
+
+        Raises:
+            ValueError: partitions, workers or batch_size are not positive,
+                or split is unknown.
+        """
+        from . import scan
+        for name, value in (('partitions', partitions), ('workers', workers),
+                            ('batch_size', batch_size)):
+            if not isinstance(value, six.integer_types) or value < 1:
+                raise ValueError('%s must be a positive integer' % name)
+        if split not in scan.SPLITS:
+            raise ValueError('split must be one of %s' % ', '.join(scan.SPLITS))
+
+        coll = self[dbname][collection]
+        points = scan.split_points(coll, filter, partitions, split)
+        filters = scan.partition_filters(filter, points)
+        if callback is not None:
+            return scan.scan_with_callback(coll, filters, callback,
+                                           projection=projection,
+                                           batch_size=batch_size,
+                                           workers=workers)
+        return scan.scan(coll, filters, projection=projection,
+                         batch_size=batch_size, workers=workers)
+
+    def hedged_find_one(self, dbname, collection, filter=None, delay_ms=None,
+                        *args, **kwargs):
+        """Runs a find_one, hedged against slow replica set members.
+
+        The read is sent to one member of the cluster allowed by its read
+        preference. If no answer came after delay_ms milliseconds, the same
+        read is sent to another member and the first answer is returned.
+        Reads on clusters without hedging, with a primary read preference or
+        with less than two eligible members are not hedged.
+
+            pool.hedged_find_one('tenants', 'settings', {'_id': tenant})
+
+        Args:
+            dbname, collection: where to read.
+            filter: the find_one filter.
+            delay_ms: milliseconds before hedging, or 'auto' for the p95
+                latency of the cluster's hedged reads. Defaults to the
+                cluster's hedge_delay_ms, reads are not hedged if neither
+                is set.
+            args, kwargs: passed to find_one.
+
+        Returns:
+            The document found, or None.
+        """
+        return self._hedged_read(
+            dbname, collection, delay_ms,
+            lambda target: target.find_one(filter, *args, **kwargs))
+
+    def hedged_find(self, dbname, collection, filter=None, delay_ms=None,
+                    *args, **kwargs):
+        """Runs a find, hedged like hedged_find_one.
+
+        Returns:
+            The list of documents found, since a cursor can not be hedged.
+        """
+        return self._hedged_read(
+            dbname, collection, delay_ms,
+            lambda target: list(target.find(filter, *args, **kwargs)))
+
+    def _hedged_read(self, dbname, collection, delay_ms, read):
+        cluster = self._match_dbname(dbname)
+        self._check_available(cluster)
+        if delay_ms is None:
+            delay_ms = cluster['hedge_delay_ms']
+        members = []
+        if delay_ms is not None:
+            members = self._hedge_members(cluster)
+        if len(members) < 2:
+            return read(self._get_database(dbname)[collection])
+
+        def read_from(address):
+            connection = self._get_member_connection(cluster, address)
+            database = self._init_database(connection, dbname)
+            limiter = cluster.get('limiter')
+            if limiter is not None:
+                from .admission import limit
+                database = limit(database, limiter)
+            return read(database[collection])
+
+        first, hedge = members[:2]
+        return self._hedger.read(cluster['label'],
+                                 lambda: read_from(first),
+                                 lambda: read_from(hedge), delay_ms)
+
+    def _hedge_members(self, cluster):
+        """Returns the addresses of the members a cluster's read preference
+        allows reading from, as discovered by the cluster's Client.
+
+        Members are ordered by preference: the primary comes first for
+        PRIMARY_PREFERRED and last for SECONDARY_PREFERRED. Members which are
+        equally preferred are shuffled, to spread the reads.
+        """
+        params = cluster['params']
+        mode = params['read_preference']
+        if not params.get('replicaSet') or mode == 'PRIMARY':
+            return []
+        connection = self._get_connection(cluster)
+        secondaries = list(getattr(connection, 'secondaries', None) or ())
+        random.shuffle(secondaries)
+        primary = getattr(connection, 'primary', None)
+        if primary is None or mode == 'SECONDARY':
+            return secondaries
+        if mode == 'PRIMARY_PREFERRED':
+            return [primary] + secondaries
+        if mode == 'SECONDARY_PREFERRED':
+            # The primary is only a fallback, hedging reads with it when
+            # there are not 2 secondaries.
+            return secondaries + [primary]
+        members = secondaries + [primary]
+        random.shuffle(members)
+        return members
+
+    def _get_member_connection(self, cluster, address):
+        """Return a Client connected to a single member of a cluster."""
+        connection = cluster.get('members', {}).get(address)
+        if connection is not None:
+            return connection
+
+        with cluster['lock']:
+            members = cluster.setdefault('members', {})
+            connection = members.get(address)
+            if connection is None:
+                options = self._client_options(cluster)
+                options.pop('replicaSet', None)
+                options['host'], options['port'] = address
+                # Clients of single members must not discover the whole set,
+                # which pymongo does by default since 4.0. The option exists
+                # since 3.11.
+                if pymongo.version_tuple >= (3, 11):
+                    options['directConnection'] = True
+                key = client_key(options)
+                connection = self._clients.acquire(
+                    key, lambda: self._new_client(cluster, options))
+                cluster.setdefault('member_keys', {})[address] = key
+                members[address] = connection
+        return connection
+
+    def shard_moves(self, group, shards, dbnames=None, vnodes=None):
+        """Report the databases of a shard group that would move to another
+        cluster if the group's shards were changed.
+
+        Args:
+            group: the label of the shard group.
+            shards: the new shards, as in the config (a list of labels or a
+                dict of label -> weight).
+            dbnames: the database names to check. By default, the databases
+                of the group are listed on its current clusters.
+            vnodes: the new number of points per unit of weight, by default
+                the current one.
+
+        Returns:
+            A {dbname -> (current label, new label)} dict.
+
+        Raises:
+            AttributeError: there is no shard group with the given label.
+        """
+        for entry in self._router.entries:
+            if entry['label'] == group and 'shards' in entry:
+                break
+        else:
+            raise AttributeError('No such shard group %s.' % group)
+
+        if vnodes is None:
+            vnodes = entry['vnodes']
+        self._validate_shards({'shards': shards, 'vnodes': vnodes})
+        if isinstance(shards, list):
+            shards = dict((label, 1) for label in shards)
+
+        current = HashRing([(label, weight, label)
+                            for label, weight in entry['shards']],
+                           entry['vnodes'])
+        changed = HashRing([(label, weight, label)
+                            for label, weight in sorted(shards.items())],
+                           vnodes)
+        if dbnames is None:
+            labels = [label for label, _ in entry['shards']]
+            dbnames = [name for name in
+                       self._find_databases(entry['pattern'], labels)
+                       if self._router.entry_for(name) is entry]
+        return current.moves(changed, dbnames)
+
+    def reload(self, config):
+        """Replace the configuration, reconnecting only where needed.
+
+        Clusters whose label and connection parameters are unchanged keep
+        their Clients, even if their dbpath changed. Clients of removed or
+        changed clusters are released, and only the cached databases whose
+        cluster changed are dropped. The routing table is swapped in a single
+        step, so concurrent lookups see either the old or the new config.
+
+        Args:
+            config: the new list of cluster configurations.
+
+        Returns:
+            A dict with the 'added', 'removed', 'changed' and 'unchanged'
+            lists of labels.
+
+        Raises:
+            TypeError: a fault in the configurations is found
+            ValueError: an invalid value is found in the configurations
+        """
+        self._validate_config(config)
+        self._check_pid()
+        with self._reload_lock:
+            old_router = self._router
+            old_clusters = dict((cluster['label'], cluster)
+                                for cluster in old_router.clusters)
+            summary = {'added': [], 'removed': [], 'changed': [],
+                       'unchanged': []}
+
+            entries = []
+            # ids of the kept clusters whose limits changed.
+            relimited = set()
+            for entry in self._parse_configs(config):
+                # Shard groups have no Client, they only affect routing.
+                if 'shards' not in entry:
+                    old = old_clusters.get(entry['label'])
+                    if old is None:
+                        summary['added'].append(entry['label'])
+                    elif (client_key(old['params']) !=
+                            client_key(entry['params'])):
+                        summary['changed'].append(entry['label'])
+                    else:
+                        # Keep the old dict, along with its lock and Client.
+                        # The routing fields are only read when building a
+                        # Router.
+                        old['pattern'] = entry['pattern']
+                        old['dbpaths'] = entry['dbpaths']
+                        old['hedge_delay_ms'] = entry['hedge_delay_ms']
+                        if old.get('limits') != entry.get('limits'):
+                            # Cached databases use the old Limiter.
+                            relimited.add(id(old))
+                            # Replaced in place rather than popped first, as
+                            # concurrent resolutions read the limiter.
+                            if 'limits' in entry:
+                                old['limits'] = entry['limits']
+                                old['limiter'] = entry['limiter']
+                            else:
+                                old.pop('limiter', None)
+                                old.pop('limits', None)
+                        entry = old
+                        summary['unchanged'].append(entry['label'])
+                entries.append(entry)
+
+            self._router = Router(entries)
+
+            kept = set(summary['unchanged'])
+            summary['removed'] = [label for label in old_clusters
+                                  if label not in kept and
+                                  label not in summary['changed']]
+
+            def routing_changed(key, entry):
+                if id(entry[1]) in relimited:
+                    return True
+                name = key[0] if isinstance(key, tuple) else key
+                return old_router.match(name) is not self._router.match(name)
+            self._databases.discard_if(routing_changed)
+
+            for label, cluster in old_clusters.items():
+                if label not in kept:
+                    self._release_cluster(cluster)
+        return summary
+
+    def _release_cluster(self, cluster, close=True):
+        """Release all the Clients of a cluster, including timeout variants.
+
+        Args:
+            cluster: the cluster dict.
+            close: whether to close the Clients no other cluster uses.
+        """
+        with cluster['lock']:
+            connection = cluster.pop('connection', None)
+            key = cluster.pop('client_key', None)
+            cluster.pop('last_used', None)
+        if connection is not None:
+            # Closes the Client once no other cluster uses it.
+            self._clients.release(key, close=close)
+        self._release_members(cluster, close=close)
+
+        for _, variant in self._timeout_variants.items():
+            with variant['lock']:
+                variant['connections'].pop(cluster['label'], None)
+                key = variant['keys'].pop(cluster['label'], None)
+            if key is not None:
+                self._clients.release(key, close=close)
+
+    @staticmethod
+    def _validate_query_cache(rules):
+        """Validate the query_cache option.
+
+        It is a list of rules, each a dictionary with:
+            {dbpath(string|list of strings), collections(list of strings),
+             ttl(number of seconds)}
+        The reads of the listed collections, in the databases matching
+        dbpath, are cached. The first rule matching a collection applies.
+
+        Raises:
+            TypeError: a fault in the rules is found
+            ValueError: a ttl is not positive
+        """
+        if not isinstance(rules, list):
+            raise TypeError('query_cache must be a list')
+        for rule in rules:
+            if not isinstance(rule, dict):
+                raise TypeError('query_cache rules must be dictionaries')
+            dbpath = rule.get('dbpath')
+            if isinstance(dbpath, list):
+                valid = all(isinstance(name, six.string_types)
+                            for name in dbpath)
+            else:
+                valid = isinstance(dbpath, six.string_types)
+            if not valid:
+                raise TypeError('query_cache dbpath must be a string or a '
+                                'list of strings')
+            collections = rule.get('collections')
+            if not isinstance(collections, list) or not all(
+                    isinstance(name, six.string_types)
+                    for name in collections):
+                raise TypeError('query_cache collections must be a list of '
+                                'strings')
+            ttl = rule.get('ttl')
+            if isinstance(ttl, bool) or not isinstance(ttl, (int, float)):
+                raise TypeError('query_cache ttl must be a number')
+            if ttl <= 0:
+                raise ValueError('query_cache ttl must be positive')
+
     @staticmethod
     def _validate_config(config):
         """Validate that the provided configurtion is valid.
@@ -50,18 +855,31 @@ class MongoPool(object):
         Each dictionary in the configuration list must have the following
         mandatory entries :
             {label: {host(string), port(int), dbpath(string|list of strings)}}
-        It can also contain 1 optional key:
-            {read_preference(string)}
+        It can also contain the following optional keys:
+            {read_preference(string), replicaSet(string),
+             hedge_delay_ms(number|'auto')}
+        as well as any of the client tuning options in CLIENT_OPTIONS and of
+        the admission control options in LIMIT_OPTIONS.
+
+        A dictionary can instead describe a shard group, spreading the
+        databases matching its dbpath over other clusters:
+            {label: {dbpath(string|list of strings),
+                     shards(list of labels|dict of label -> weight)}}
+        with an optional vnodes(int) key.
 
         Args:
             config: the list of configurations provided at instantiation
 
         Raises:
             TypeError: a fault in the configurations is found
+            ValueError: a client tuning option or a shard group has an
+                invalid value
         """
         if not isinstance(config, list):
             raise TypeError('Config must be a list')
 
+        cluster_labels = set()
+        groups = []
         for config_dict in config:
             if not isinstance(config_dict, dict):
                 raise TypeError('Config must be a list of dictionaries')
@@ -70,15 +888,12 @@ class MongoPool(object):
             if not isinstance(cfg, dict):
                 raise TypeError('Config structure is broken')
 
-            if 'host' not in cfg:
-                raise TypeError('Config entries must have a value for host')
-            if not isinstance(cfg['host'], six.string_types) and not isinstance(cfg['host'], list):
-                raise TypeError('Host must be a string or a list.')
-
-            if 'port' not in cfg:
-                raise TypeError('Config entries must have a value for port')
-            if not isinstance(cfg['port'], int):
-                raise TypeError('Port must be an int')
+            if 'shards' in cfg:
+                MongoPool._validate_shards(cfg)
+                groups.append(cfg)
+            else:
+                cluster_labels.add(label)
+                MongoPool._validate_cluster(cfg)
 
             if 'dbpath' not in cfg:
                 raise TypeError('Config entries must have a value for dbpath')
@@ -91,54 +906,220 @@ class MongoPool(object):
                         raise TypeError('Dbpath must either a string or a list '
                                         'of strings')
 
-            if ('read_preference' in cfg and
-                not isinstance(cfg['read_preference'], six.string_types)):
-                raise TypeError('Read_preference must be a string')
+        for cfg in groups:
+            for label in cfg['shards']:
+                if label not in cluster_labels:
+                    raise ValueError('Unknown shard cluster: %s' % label)
+
+    @staticmethod
+    def _validate_shards(cfg):
+        """Validate the shards and vnodes of a shard group."""
+        shards = cfg['shards']
+        if isinstance(shards, list):
+            shards = dict((label, 1) for label in shards)
+        if not isinstance(shards, dict):
+            raise TypeError('Shards must be a list of labels or a dict of '
+                            'label -> weight')
+        if not shards:
+            raise ValueError('Shards must not be empty')
+        for label, weight in shards.items():
+            if not isinstance(label, six.string_types):
+                raise TypeError('Shard labels must be strings')
+            if isinstance(weight, bool) or not isinstance(weight,
+                                                          (int, float)):
+                raise TypeError('Shard weights must be numbers')
+            if weight <= 0:
+                raise ValueError('Shard weights must be positive')
+
+        if 'vnodes' in cfg:
+            if isinstance(cfg['vnodes'], bool) or not isinstance(cfg['vnodes'],
+                                                                 int):
+                raise TypeError('vnodes must be an int')
+            if cfg['vnodes'] < 1:
+                raise ValueError('vnodes must be positive')
+
+    @staticmethod
+    def _validate_cluster(cfg):
+        """Validate the connection parameters of a cluster."""
+        if 'host' not in cfg:
+            raise TypeError('Config entries must have a value for host')
+        if not isinstance(cfg['host'], six.string_types) and not isinstance(cfg['host'], list):
+            raise TypeError('Host must be a string or a list.')
+
+        if 'port' not in cfg:
+            raise TypeError('Config entries must have a value for port')
+        if not isinstance(cfg['port'], int):
+            raise TypeError('Port must be an int')
+
+        if ('read_preference' in cfg and
+            not isinstance(cfg['read_preference'], six.string_types)):
+            raise TypeError('Read_preference must be a string')
+
+        if ('replicaSet' in cfg and
+            not isinstance(cfg['replicaSet'], six.string_types)):
+            raise TypeError('replicaSet must be a string')
+
+        MongoPool._validate_client_options(cfg)
+        MongoPool._validate_limits(cfg)
+
+        if 'hedge_delay_ms' in cfg:
+            delay = cfg['hedge_delay_ms']
+            if delay != AUTO and (isinstance(delay, bool) or
+                                  not isinstance(delay, (int, float))):
+                raise TypeError("hedge_delay_ms must be a number or 'auto'")
+            if delay != AUTO and delay < 0:
+                raise ValueError('hedge_delay_ms must not be negative')
+            if not cfg.get('replicaSet'):
+                raise ValueError('hedge_delay_ms requires a replicaSet')
+
+    @staticmethod
+    def _validate_limits(cfg):
+        """Validate the admission control options of a cluster."""
+        for name in LIMIT_OPTIONS:
+            if name not in cfg:
+                continue
+            value = cfg[name]
+            if name == 'queue_timeout':
+                if isinstance(value, bool) or not isinstance(value,
+                                                             (int, float)):
+                    raise TypeError('queue_timeout must be a number')
+            elif isinstance(value, bool) or not isinstance(value, int):
+                raise TypeError('%s must be an int' % name)
+            if value < 0:
+                raise ValueError('%s must not be negative' % name)
+
+        if 'max_concurrency' in cfg:
+            if cfg['max_concurrency'] < 1:
+                raise ValueError('max_concurrency must be positive')
+        elif 'max_queue' in cfg or 'queue_timeout' in cfg:
+            raise ValueError('max_queue and queue_timeout require '
+                             'max_concurrency')
+
+    @staticmethod
+    def _validate_client_options(options):
+        """Validate the client tuning options found in options.
+
+        All options are non-negative ints, except for compressors which is a
+        compressor name or a list of compressor names.
+
+        Args:
+            options: a cluster configuration or the pool-wide client_options.
+
+        Raises:
+            TypeError: an option has the wrong type
+            ValueError: an option has an invalid value
+        """
+        if not isinstance(options, dict):
+            raise TypeError('Client options must be a dictionary')
+
+        for name in CLIENT_OPTIONS:
+            if name not in options:
+                continue
+            value = options[name]
+            if name == 'compressors':
+                if isinstance(value, six.string_types):
+                    value = [value]
+                if not isinstance(value, list):
+                    raise TypeError('compressors must be a string or a list '
+                                    'of strings')
+                for compressor in value:
+                    if compressor not in COMPRESSORS:
+                        raise ValueError('Invalid compressor: %s' % compressor)
+            elif isinstance(value, bool) or not isinstance(value, int):
+                raise TypeError('%s must be an int' % name)
+            elif value < 0:
+                raise ValueError('%s must not be negative' % name)
 
-            if ('replicaSet' in cfg and
-                not isinstance(cfg['replicaSet'], six.string_types)):
-                raise TypeError('replicaSet must be a string')
+        if (options.get('minPoolSize') is not None and
+                options.get('maxPoolSize') is not None and
+                options['minPoolSize'] > options['maxPoolSize']):
+            raise ValueError('minPoolSize must not exceed maxPoolSize')
 
     def _parse_configs(self, config):
-        """Builds a dict with information to connect to Clusters.
+        """Builds dicts with information to connect to Clusters.
 
         Parses the list of configuration dictionaries passed by the user and
-        builds an internal dict (_clusters) that holds information for creating
+        builds a list of dicts (_clusters) that hold information for creating
         Clients connecting to Clusters and matching database names.
 
         Args:
             config: A list of dictionaries containing connecting and
                 identification information about Clusters.
                 A dict has the following structure:
-                {label: {host, port, read_preference, dbpath}}.
+                {label: {host, port, read_preference, dbpath, ...}}, where
+                ... are client tuning options overriding the pool-wide ones.
 
-        Raises:
-            Exception('No configuration provided'): no configuration provided.
+        Returns:
+            The list of cluster and shard group dicts, in configuration order.
         """
+        clusters = []
         for config_dict in config:
             label = list(config_dict.keys())[0]
             cfg = config_dict[label]
             # Transform dbpath to something digestable by regexp.
             dbpath = cfg['dbpath']
             pattern = self._parse_dbpath(dbpath)
+            if isinstance(dbpath, list):
+                dbpaths = list(dbpath)
+            else:
+                dbpaths = [dbpath]
 
+            if 'shards' in cfg:
+                shards = cfg['shards']
+                if isinstance(shards, list):
+                    shards = dict((shard, 1) for shard in shards)
+                clusters.append({
+                    'pattern': pattern,
+                    'dbpaths': dbpaths,
+                    'label': label,
+                    # (cluster label, weight) pairs, placed on a hash ring.
+                    'shards': sorted(shards.items()),
+                    'vnodes': cfg.get('vnodes', DEFAULT_VNODES)
+                })
+                continue
+
+            # Converted to a pymongo.ReadPreference value when connecting,
+            # see _client_options.
             read_preference = cfg.get('read_preference', 'primary').upper()
-            read_preference = self._get_read_preference(read_preference)
+            if read_preference not in READ_PREFERENCES:
+                raise ValueError('Invalid read preference: %s' %
+                                 read_preference)
 
             # Put all parameters that could be passed to pymongo.MongoClient
             # in a separate dict, to ease MongoClient creation.
+            params = {
+                'host': cfg['host'],
+                'port': cfg['port'],
+                'read_preference': read_preference,
+                'replicaSet': cfg.get('replicaSet')
+            }
+            for name in CLIENT_OPTIONS:
+                value = cfg.get(name, self._client_options_defaults.get(name))
+                if value is None:
+                    continue
+                if name == 'compressors' and isinstance(value, list):
+                    value = ','.join(value)
+                params[name] = value
+
             cluster_config = {
-                'params': {
-                    'host': cfg['host'],
-                    'port': cfg['port'],
-                    'read_preference': read_preference,
-                    'replicaSet': cfg.get('replicaSet')
-                },
+                'params': params,
                 'pattern': pattern,
-                'label': label
+                'dbpaths': dbpaths,
+                'label': label,
+                # Serializes Client creation for this cluster.
+                'lock': threading.Lock(),
+                # Enables hedged reads, see hedged_find_one.
+                'hedge_delay_ms': cfg.get('hedge_delay_ms')
             }
+            if 'max_concurrency' in cfg:
+                from .admission import Limiter
+                limits = tuple(cfg.get(name) for name in LIMIT_OPTIONS)
+                cluster_config['limits'] = limits
+                cluster_config['limiter'] = Limiter(label, *limits)
+
+            clusters.append(cluster_config)
 
-            self._clusters.append(cluster_config)
+        return clusters
 
     @staticmethod
     def _parse_dbpath(dbpath):
@@ -187,7 +1168,8 @@ class MongoPool(object):
 
         Close all current connections. This will cause future operations to
         create new Clients with the network_timeout passed through
-        socketTimeoutMS optional parameter.
+        socketTimeoutMS optional parameter. To temporarily use another timeout
+        without reconnecting, see with_timeout and timeout.
 
         Args:
             network_timeout: The new value in milliseconds for the timeout.
@@ -198,43 +1180,224 @@ class MongoPool(object):
         self._network_timeout = network_timeout
         self._disconnect()
 
+    def with_timeout(self, network_timeout):
+        """Returns a view of the pool using another network timeout.
+
+        The view resolves databases like the pool does, but through Clients
+        created with network_timeout. These Clients are kept for later use
+        and the pool's own Clients are left untouched. Only the Clients of the
+        max_timeout_variants most recently used timeouts are kept open.
+
+            pool.with_timeout(60000).analytics.events.aggregate(...)
+
+        Args:
+            network_timeout: the timeout in milliseconds.
+        """
+        return _TimeoutView(self, network_timeout)
+
+    @contextlib.contextmanager
+    def timeout(self, network_timeout):
+        """Context manager using another network timeout in this thread.
+
+        Databases resolved through the pool inside the block use Clients
+        created with network_timeout, see with_timeout.
+
+            with pool.timeout(60000):
+                pool.analytics.events.aggregate(...)
+
+        Args:
+            network_timeout: the timeout in milliseconds.
+        """
+        previous = getattr(self._local, 'network_timeout', _DEFAULT_TIMEOUT)
+        self._local.network_timeout = network_timeout
+        try:
+            yield self
+        finally:
+            self._local.network_timeout = previous
+
+    def _release_members(self, cluster, close=True):
+        """Release the Clients of single members used for hedged reads."""
+        with cluster['lock']:
+            cluster.pop('members', None)
+            keys = list(cluster.pop('member_keys', {}).values())
+        for key in keys:
+            self._clients.release(key, close=close)
+
+    def _release_variant(self, network_timeout, variant):
+        """Release the Clients and databases of a timeout variant."""
+        with variant['lock']:
+            variant['closed'] = True
+            keys = list(variant['keys'].values())
+            variant['keys'].clear()
+            variant['connections'].clear()
+        self._databases.discard_if(
+            lambda key, database: (isinstance(key, tuple) and
+                                   key[1] == network_timeout))
+        for key in keys:
+            self._clients.release(key)
+
     def _disconnect(self):
         """Disconnect from all MongoDB Clients."""
         for cluster in self._clusters:
-            if 'connection' in cluster:
-                connection = cluster.pop('connection')
-                connection.close()
-        # Remove all attributes that are database names so that next time
-        # when they are accessed, __getattr__ will be called and will create
-        # new Clients
-        for dbname in self._mapped_databases:
-            self.__delattr__(dbname)
-        self._mapped_databases = []
-
-    def _get_connection(self, cluster):
+            with cluster['lock']:
+                connection = cluster.pop('connection', None)
+                key = cluster.pop('client_key', None)
+                cluster.pop('last_used', None)
+            if connection is not None:
+                self._clients.release(key)
+            self._release_members(cluster)
+        for network_timeout, variant in self._timeout_variants.clear():
+            self._release_variant(network_timeout, variant)
+        # Drop all cached databases so that next time when they are
+        # accessed, __getattr__ will create new Clients.
+        self._databases.clear()
+
+    def invalidate_cached_queries(self, dbname, collection):
+        """Drop the cached query results of a collection.
+
+        Writes made through the pool's databases invalidate the results they
+        may change. This is for writes made by other means.
+        """
+        if self._query_cache is not None:
+            self._query_cache.invalidate('%s.%s' % (dbname, collection))
+
+    def cache_stats(self):
+        """Returns the size, hits, misses and evictions of the database cache.
+        """
+        return self._databases.stats()
+
+    def stats(self):
+        """Returns metrics about the pool.
+
+        Routing and cache metrics are always available. If the pool was
+        created with instrumentation, per-cluster command latencies, error
+        counts, connection checkout wait times and open connections are
+        reported as well, along with the time spent in routing. Latencies are
+        in milliseconds. Clusters with a max_concurrency have their running
+        and queued operations and their rejection counts reported under
+        'limits'. The query cache, if any, is reported under 'query_cache'.
+        """
+        router = self._router
+        stats = {'databases': self.cache_stats(),
+                 'routing': {'hits': router.hits, 'misses': router.misses},
+                 'clients': len(self._clients)}
+        if self._reaper is not None:
+            stats['reaped'] = self._reaper.reaped
+        hedging = self._hedger.summary()
+        if hedging:
+            stats['hedging'] = hedging
+        limiters = [(cluster['label'], cluster.get('limiter'))
+                    for cluster in router.clusters]
+        limits = dict((label, limiter.stats())
+                      for label, limiter in limiters if limiter is not None)
+        if limits:
+            stats['limits'] = limits
+        if self._query_cache is not None:
+            stats['query_cache'] = self._query_cache.stats()
+        if self._instrumentation is not None:
+            summary = self._instrumentation.summary()
+            stats['routing'].update(summary['routing'])
+            stats['clusters'] = summary['clusters']
+        return stats
+
+    def _new_client(self, cluster, options):
+        """Create a Client for a cluster, with the given options."""
+        if self._instrumentation is not None:
+            options = dict(options, event_listeners=(
+                self._instrumentation.listeners(cluster['label'])))
+        return self._connection_class(**options)
+
+    def _client_options(self, cluster, network_timeout=_DEFAULT_TIMEOUT):
+        """Returns the keyword arguments used to create a cluster's Client."""
+        if network_timeout is _DEFAULT_TIMEOUT:
+            network_timeout = self._network_timeout
+        # w=1 because:
+        # http://stackoverflow.com/questions/14798552/is-mongodb-2-x-write-concern-w-1-truly-equals-to-safe-true
+        options = dict(socketTimeoutMS=network_timeout, w=1, j=self.j)
+        options.update(cluster['params'])
+        options['read_preference'] = self._get_read_preference(
+            options['read_preference'])
+        return options
+
+    def _get_connection(self, cluster, network_timeout=_DEFAULT_TIMEOUT):
         """Return a connection to a Cluster.
 
         Return a MongoClient or a MongoReplicaSetClient for the given Cluster.
         This is done in a lazy manner (if there is already a Client connected to
-        the Cluster, it is returned and no other Client is created).
+        the Cluster, it is returned and no other Client is created). Concurrent
+        callers asking for the same Cluster wait for a single Client to be
+        created instead of each building their own. Clusters which only
+        differ by their dbpath share the same Client.
 
         Args:
             cluster: A dict containing information about a cluster.
+            network_timeout: use a Client with this timeout rather than the
+                pool's one, see with_timeout.
 
         Returns:
             A MongoClient or MongoReplicaSetClient instance connected to the
             desired cluster
         """
-        # w=1 because:
-        # http://stackoverflow.com/questions/14798552/is-mongodb-2-x-write-concern-w-1-truly-equals-to-safe-true
-        if 'connection' not in cluster:
-            cluster['connection'] = self._connection_class(
-                socketTimeoutMS=self._network_timeout,
-                w=1,
-                j=self.j,
-                **cluster['params'])
+        self._check_pid()
+        # Clusters not used for a while can be released, see
+        # reap_idle_clients.
+        cluster['last_used'] = _clock()
+        if (network_timeout is not _DEFAULT_TIMEOUT and
+                network_timeout != self._network_timeout):
+            return self._get_variant_connection(cluster, network_timeout)
 
-        return cluster['connection']
+        connection = cluster.get('connection')
+        if connection is not None:
+            return connection
+
+        with cluster['lock']:
+            connection = cluster.get('connection')
+            if connection is None:
+                options = self._client_options(cluster)
+                key = client_key(options)
+                connection = self._clients.acquire(
+                    key, lambda: self._new_client(cluster, options))
+                cluster['client_key'] = key
+                cluster['connection'] = connection
+
+        return connection
+
+    def _get_timeout_variant(self, network_timeout):
+        variant = self._timeout_variants.get(network_timeout)
+        if variant is not None:
+            return variant
+        with self._timeout_variants_lock:
+            variant = self._timeout_variants.get(network_timeout)
+            if variant is None:
+                # { label -> Client } and { label -> registry key }
+                variant = {'connections': {}, 'keys': {}, 'closed': False,
+                           'lock': threading.Lock()}
+                self._timeout_variants.set(network_timeout, variant)
+        return variant
+
+    def _get_variant_connection(self, cluster, network_timeout):
+        """Return a connection to a Cluster using a non-default timeout."""
+        label = cluster['label']
+        while True:
+            variant = self._get_timeout_variant(network_timeout)
+            connection = variant['connections'].get(label)
+            if connection is not None:
+                return connection
+
+            with variant['lock']:
+                # The variant may have been evicted meanwhile, in which case
+                # a new one is needed.
+                if variant['closed']:
+                    continue
+                connection = variant['connections'].get(label)
+                if connection is None:
+                    options = self._client_options(cluster, network_timeout)
+                    key = client_key(options)
+                    connection = self._clients.acquire(
+                        key, lambda: self._new_client(cluster, options))
+                    variant['keys'][label] = key
+                    variant['connections'][label] = connection
+                return connection
 
     def _match_dbname(self, dbname):
         """Map a database name to the Cluster that holds the database.
@@ -246,10 +1409,16 @@ class MongoPool(object):
             A dict containing the information about the Cluster that holds the
             database.
         """
-        for config in self._clusters:
-            if re.match(config['pattern'], dbname):
-                return config
-        raise Exception('No such database %s.' % dbname)
+        if self._instrumentation is None:
+            cluster = self._router.match(dbname)
+        else:
+            start = _clock()
+            cluster = self._router.match(dbname)
+            self._instrumentation.record(None, 'routing',
+                                         (_clock() - start) * 1000)
+        if cluster is None:
+            raise Exception('No such database %s.' % dbname)
+        return cluster
 
     def _get_connection_by_db_name(self, db_name):
         config = self._match_dbname(db_name)
@@ -258,16 +1427,72 @@ class MongoPool(object):
     def _init_database(self, connection, db_name):
         return connection[db_name]
 
+    def _get_database(self, name, network_timeout=_DEFAULT_TIMEOUT):
+        self._check_pid()
+        if network_timeout is _DEFAULT_TIMEOUT:
+            network_timeout = getattr(self._local, 'network_timeout',
+                                      _DEFAULT_TIMEOUT)
+        if network_timeout == self._network_timeout:
+            network_timeout = _DEFAULT_TIMEOUT
+
+        # The cache holds (database, cluster) pairs, keyed by name for the
+        # pool's timeout and by (name, timeout) for other timeouts.
+        if network_timeout is _DEFAULT_TIMEOUT:
+            key = name
+        else:
+            key = (name, network_timeout)
+        entry = self._databases.get(key)
+        if entry is None:
+            cluster = self._match_dbname(name)
+            self._check_available(cluster)
+            connection = self._get_connection(cluster, network_timeout)
+            database = self._init_database(connection, name)
+            limiter = cluster.get('limiter')
+            if limiter is not None:
+                from .admission import limit
+                database = limit(database, limiter)
+            if self._query_cache is not None:
+                database = self._query_cache.wrap(database, name)
+            entry = (database, cluster)
+            # Remember this name->database mapping so that future
+            # references to the same name don't go through routing again.
+            self._databases.set(key, entry)
+        else:
+            self._check_available(entry[1])
+            entry[1]['last_used'] = _clock()
+        return entry[0]
+
+    def _check_available(self, cluster):
+        """Fail fast if the circuit breaker of a cluster is open."""
+        health = self._health
+        if health is not None and not health.breaker(cluster['label']).allow():
+            from .health import ClusterUnavailable
+            raise ClusterUnavailable('Cluster %s is unavailable.' %
+                                     cluster['label'])
+
     def __getattr__(self, name):
         """Map a database name to the coresponding pymongo.Database instance"""
-        connection = self._get_connection_by_db_name(name)
-        database = self._init_database(connection, name)
-        # Remember this name->database mapping on the object. This will cause
-        # future references to the same name to NOT invoke self.__getattr__,
-        # and be resolved directly at object level.
-        setattr(self, name, database)
-        self._mapped_databases.append(name)
-        return database
+        return self._get_database(name)
+
+    def __getitem__(self, key):
+        return self._get_database(key)
+
+
+class _TimeoutView(object):
+    """Resolves databases through a MongoPool, with another network timeout.
+    """
+
+    def __init__(self, pool, network_timeout):
+        self._pool = pool
+        self._network_timeout = network_timeout
+
+    def get_cluster(self, label):
+        cluster = self._pool._get_cluster_config(label)
+        self._pool._check_available(cluster)
+        return self._pool._get_connection(cluster, self._network_timeout)
+
+    def __getattr__(self, name):
+        return self._pool._get_database(name, self._network_timeout)
 
     def __getitem__(self, key):
-        return getattr(self, key)
+        return self._pool._get_database(key, self._network_timeout)
@@ -0,0 +1,318 @@
+"""Read-through caching of query results, see MongoPool's query_cache."""
+from collections import OrderedDict
+import copy
+from datetime import datetime
+import re
+import threading
+import uuid
+
+from bson.decimal128 import Decimal128
+from bson.max_key import MaxKey
+from bson.min_key import MinKey
+from bson.objectid import ObjectId
+from bson.regex import Regex
+from bson.timestamp import Timestamp
+import six
+
+from .cache import LRUCache
+
+# Collection methods whose results are cached.
+CACHED_READS = ('find_one', 'count_documents', 'estimated_document_count',
+                'distinct', 'count')
+# Collection methods after which the collection's cached results are dropped.
+WRITES = ('insert_one', 'insert_many', 'replace_one', 'update_one',
+          'update_many', 'delete_one', 'delete_many', 'find_one_and_delete',
+          'find_one_and_replace', 'find_one_and_update', 'bulk_write', 'drop',
+          'rename', 'insert', 'update', 'remove', 'save', 'find_and_modify')
+
+# Values shared between cached results and their copies.
+_IMMUTABLE = (type(None), bool, float, six.binary_type, datetime, uuid.UUID,
+              Decimal128, MaxKey, MinKey, ObjectId, Timestamp) + (
+    six.integer_types + six.string_types)
+
+_PATTERN = type(re.compile(''))
+
+_MISSING = object()
+# The ttl of collections whose reads are not cached.
+_UNCACHED = object()
+
+
+def _freeze(value):
+    """Turns a query into a hashable value, keeping the types of values
+    apart so that {'a': 1} and {'a': True} are different queries.
+
+    Raises:
+        TypeError: value holds values of unknown types.
+    """
+    if isinstance(value, dict):
+        return (dict, tuple((key, _freeze(item))
+                            for key, item in value.items()))
+    if isinstance(value, (list, tuple)):
+        return (list, tuple(_freeze(item) for item in value))
+    if isinstance(value, _IMMUTABLE):
+        return (type(value), value)
+    if isinstance(value, (Regex, _PATTERN)):
+        return (Regex, value.pattern, value.flags)
+    raise TypeError('Unknown type %s' % type(value))
+
+
+def _normalize(args, kwargs):
+    """Returns a hashable key for the arguments of a read, or None if they
+    can't be cached.
+
+    The top-level keys of the filter are sorted, since their order does not
+    change the results.
+    """
+    if 'session' in kwargs:
+        return None
+    args = list(args)
+    if args and isinstance(args[0], dict):
+        args[0] = OrderedDict(sorted(args[0].items()))
+    if isinstance(kwargs.get('filter'), dict):
+        kwargs = dict(kwargs, filter=OrderedDict(
+            sorted(kwargs['filter'].items())))
+    try:
+        key = (_freeze(args), _freeze(OrderedDict(sorted(kwargs.items()))))
+        hash(key)
+    except TypeError:
+        return None
+    return key
+
+
+def _same_reads(collection, other):
+    """Whether reads through collection and other return the same results.
+    """
+    return (collection.read_preference == other.read_preference and
+            collection.read_concern == other.read_concern and
+            collection.codec_options == other.codec_options)
+
+
+def _copy(value):
+    """Deep copies documents, much faster than copy.deepcopy.
+
+    Dicts (SONs included) and lists are copied, other values are immutable
+    BSON values and are shared, except for unknown types which go through
+    copy.deepcopy.
+    """
+    if isinstance(value, dict):
+        copied = value.copy()
+        for key, item in value.items():
+            if not isinstance(item, _IMMUTABLE):
+                copied[key] = _copy(item)
+        return copied
+    if isinstance(value, list):
+        return [item if isinstance(item, _IMMUTABLE) else _copy(item)
+                for item in value]
+    if isinstance(value, _IMMUTABLE):
+        return value
+    return copy.deepcopy(value)
+
+
+class QueryCache(object):
+    """Caches the results of reads on configured collections.
+
+    Results are kept in a size-bounded LRU cache, each for the ttl of its
+    collection. Every collection has a generation, which is part of the
+    cache keys and is bumped by writes made through the cache's wrappers.
+    Entries of older generations can't be hit anymore and are evicted over
+    time, and reads which raced with a write are not cached.
+    """
+
+    def __init__(self, rules, max_size=10000):
+        """
+        Args:
+            rules: a list of (compiled dbpath pattern, collection names, ttl
+                in seconds) tuples. The first rule matching a namespace
+                applies.
+            max_size: the maximum number of cached results.
+        """
+        self.rules = rules
+        self._results = LRUCache(max_size=max_size)
+        # namespace -> generation
+        self._generations = {}
+        self._lock = threading.Lock()
+        self.invalidations = 0
+
+    def after_fork(self):
+        """Drop the state copied from a parent process, locks included."""
+        self._results = LRUCache(max_size=self._results.max_size)
+        self._generations = {}
+        self._lock = threading.Lock()
+
+    def ttls(self, dbname):
+        """Returns the {collection -> ttl} of the rules matching dbname."""
+        ttls = {}
+        for pattern, collections, ttl in self.rules:
+            if pattern.match(dbname):
+                for collection in collections:
+                    ttls.setdefault(collection, ttl)
+        return ttls
+
+    def wrap(self, database, dbname):
+        """Returns database, wrapped if some of its collections are cached.
+        """
+        ttls = self.ttls(dbname)
+        if not ttls:
+            return database
+        return CachedDatabase(database, dbname, self, ttls)
+
+    def invalidate(self, namespace):
+        """Drops the cached results of a 'database.collection' namespace."""
+        with self._lock:
+            self._generations[namespace] = (
+                self._generations.get(namespace, 0) + 1)
+            self.invalidations += 1
+
+    def read(self, namespace, ttl, method, function, args, kwargs):
+        """Returns the result of function(*args, **kwargs), from the cache
+        when it holds the result of the same read.
+
+        Results are deep copied, so that callers can't modify the cached
+        ones.
+        """
+        query = _normalize(args, kwargs)
+        if query is None:
+            return function(*args, **kwargs)
+
+        generation = self._generations.get(namespace, 0)
+        key = (namespace, generation, method, query)
+        result = self._results.get(key, _MISSING)
+        if result is _MISSING:
+            result = function(*args, **kwargs)
+            if self._generations.get(namespace, 0) == generation:
+                self._results.set(key, result, ttl=ttl)
+        return _copy(result)
+
+    def stats(self):
+        """Returns the size, hits, misses, evictions (expired entries
+        included) and invalidations of the cache."""
+        stats = self._results.stats()
+        stats['invalidations'] = self.invalidations
+        return stats
+
+
+class CachedDatabase(object):
+    """A Database whose cached collections are wrapped in CachedCollections.
+
+    Cached collections are obtained as attributes, items or through
+    get_collection. Everything else is returned as it is.
+    """
+    __slots__ = ('_target', '_name', '_cache', '_ttls')
+
+    def __init__(self, target, name, cache, ttls):
+        self._target = target
+        self._name = name
+        self._cache = cache
+        self._ttls = ttls
+
+    def _collection(self, name, collection, ttl=None):
+        if name not in self._ttls:
+            return collection
+        if ttl is None:
+            ttl = self._ttls[name]
+        return CachedCollection(collection, '%s.%s' % (self._name, name),
+                                self._cache, ttl)
+
+    def __getattr__(self, name):
+        value = getattr(self._target, name)
+        if name == 'drop_collection':
+            return self._drop_collection
+        if name == 'get_collection':
+            return self._get_collection
+        return self._collection(name, value)
+
+    def __getitem__(self, name):
+        return self._collection(name, self._target[name])
+
+    def _get_collection(self, name, *args, **kwargs):
+        collection = self._target.get_collection(name, *args, **kwargs)
+        if (args or kwargs) and not _same_reads(collection, self._target):
+            # Only its writes go through the cache.
+            return self._collection(name, collection, ttl=_UNCACHED)
+        return self._collection(name, collection)
+
+    def _drop_collection(self, name_or_collection, *args, **kwargs):
+        try:
+            return self._target.drop_collection(name_or_collection, *args,
+                                                **kwargs)
+        finally:
+            name = getattr(name_or_collection, 'name', name_or_collection)
+            if name in self._ttls:
+                self._cache.invalidate('%s.%s' % (self._name, name))
+
+    def __eq__(self, other):
+        if isinstance(other, CachedDatabase):
+            other = other._target
+        return self._target == other
+
+    def __ne__(self, other):
+        return not self == other
+
+    def __hash__(self):
+        return hash(self._target)
+
+    def __repr__(self):
+        return 'Cached(%r)' % (self._target,)
+
+
+class CachedCollection(object):
+    """A Collection caching its reads and invalidating them on writes.
+
+    Collections whose read preference, read concern or codec options differ
+    from the cached ones' (see with_options) only invalidate: their ttl is
+    _UNCACHED and their reads are not cached.
+    """
+    __slots__ = ('_target', '_namespace', '_cache', '_ttl')
+
+    def __init__(self, target, namespace, cache, ttl):
+        self._target = target
+        self._namespace = namespace
+        self._cache = cache
+        self._ttl = ttl
+
+    def __getattr__(self, name):
+        value = getattr(self._target, name)
+        cache = self._cache
+        namespace = self._namespace
+        if name in CACHED_READS and self._ttl is not _UNCACHED:
+            ttl = self._ttl
+
+            def read(*args, **kwargs):
+                return cache.read(namespace, ttl, name, value, args, kwargs)
+            return read
+        if name in WRITES:
+            def write(*args, **kwargs):
+                try:
+                    return value(*args, **kwargs)
+                finally:
+                    # Even failed writes may have changed some documents.
+                    cache.invalidate(namespace)
+            return write
+        if name == 'with_options':
+            ttl = self._ttl
+
+            def with_options(*args, **kwargs):
+                collection = value(*args, **kwargs)
+                if not _same_reads(collection, self._target):
+                    return CachedCollection(collection, namespace, cache,
+                                            _UNCACHED)
+                return CachedCollection(collection, namespace, cache, ttl)
+            return with_options
+        return value
+
+    def __getitem__(self, name):
+        return self._target[name]
+
+    def __eq__(self, other):
+        if isinstance(other, CachedCollection):
+            other = other._target
+        return self._target == other
+
+    def __ne__(self, other):
+        return not self == other
+
+    def __hash__(self):
+        return hash(self._target)
+
+    def __repr__(self):
+        return 'Cached(%r)' % (self._target,)
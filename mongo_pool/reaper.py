@@ -0,0 +1,39 @@
+import threading
+
+
+class IdleReaper(object):
+    """Periodically releases the Clients of clusters a MongoPool did not use
+    for idle_timeout seconds, see MongoPool.reap_idle_clients.
+    """
+
+    def __init__(self, pool, idle_timeout, interval):
+        self._pool = pool
+        self.idle_timeout = idle_timeout
+        self.interval = interval
+        # Number of clusters whose Clients were released.
+        self.reaped = 0
+        self._stopped = threading.Event()
+        self._thread = None
+
+    def start(self):
+        self._stopped.clear()
+        self._thread = threading.Thread(target=self._run,
+                                        name='mongo-pool-reaper')
+        self._thread.daemon = True
+        self._thread.start()
+
+    def stop(self):
+        self._stopped.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def after_fork(self):
+        """Restart in a forked child, where the thread no longer exists."""
+        if self._thread is not None:
+            self._stopped = threading.Event()
+            self.start()
+
+    def _run(self):
+        while not self._stopped.wait(self.interval):
+            self.reaped += len(self._pool.reap_idle_clients(self.idle_timeout))
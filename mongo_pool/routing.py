@@ -0,0 +1,178 @@
+import re
+
+from .hashring import HashRing
+
+# Characters which make a dbpath entry a regexp rather than a plain name.
+_REGEXP_CHARS = re.compile(r'[.^$*+?{}\[\]\\|()]')
+# Constructs that change meaning (or fail to compile) once a pattern is
+# embedded in a bigger alternation: numbered backreferences and global
+# inline flags.
+_NOT_COMBINABLE = re.compile(r'\\[1-9]|\(\?[aiLmsux]+\)')
+# Patterns are combined into alternations of at most this many groups. The
+# regexp engine saves the groups on every branch it tries, so a name
+# missing a big alternation costs quadratic time, and Python 2 regexps can't
+# have more than 100 groups anyway.
+_MAX_GROUPS = 40
+
+
+class Router(object):
+    """Maps database names to the clusters that hold them.
+
+    Literal dbpath entries are resolved through a dict lookup. Everything else
+    goes through compiled alternations of the cluster patterns, a few dozen
+    patterns each, which keep the order of the configuration so that the
+    first match still wins.
+    Successful resolutions are memoized.
+
+    Entries may also be shard groups, spreading the databases they match over
+    several clusters with consistent hashing.
+    """
+
+    def __init__(self, entries, memo_size=10000):
+        """
+        Args:
+            entries: list of cluster and shard group dicts, as built by
+                MongoPool._parse_configs, in configuration order.
+            memo_size: maximum number of memoized name -> cluster entries.
+        """
+        self.entries = entries
+        self.clusters = [entry for entry in entries if 'shards' not in entry]
+        # group label -> HashRing of clusters
+        self.rings = self._build_rings(entries, self.clusters)
+        self._memo = {}
+        self._memo_size = memo_size
+        # Memo counters. They are not locked, so they are only approximate
+        # under concurrency.
+        self.hits = 0
+        self.misses = 0
+        self._combined = self._combine(entries)
+        # Patterns compiled one by one are only needed when they could not
+        # be combined, which also reports the invalid ones.
+        self._compiled = None
+        if self._combined is None:
+            self._compiled = [(re.compile(entry['pattern']), entry)
+                              for entry in entries]
+        # Built on the first match, since it runs every literal through the
+        # patterns. Threads racing to build it build the same dict.
+        self._literals = None
+
+    @staticmethod
+    def _build_rings(entries, clusters):
+        by_label = dict((cluster['label'], cluster) for cluster in clusters)
+        rings = {}
+        for entry in entries:
+            if 'shards' in entry:
+                members = [(label, weight, by_label[label])
+                           for label, weight in entry['shards']]
+                rings[entry['label']] = HashRing(members, entry['vnodes'])
+        return rings
+
+    @staticmethod
+    def _combine(entries):
+        """Builds alternation regexps with a named group per entry.
+
+        Returns:
+            A list of (compiled regexp, {group name -> entry}) tuples, in
+            configuration order, or None if the patterns can not be safely
+            combined.
+        """
+        combined = []
+        parts = []
+        groups = {}
+        count = 0
+        for index, entry in enumerate(entries):
+            pattern = entry['pattern']
+            if _NOT_COMBINABLE.search(pattern):
+                return None
+            # Counts escaped parentheses and non capturing groups too, which
+            # only makes the alternations smaller.
+            size = pattern.count('(') + 1
+            if parts and count + size > _MAX_GROUPS:
+                combined.append((parts, groups))
+                parts, groups, count = [], {}, 0
+            group = '_mongo_pool_%d' % index
+            groups[group] = entry
+            parts.append('(?P<%s>%s)' % (group, pattern))
+            count += size
+        combined.append((parts, groups))
+        try:
+            return [(re.compile('|'.join(parts)), groups)
+                    for parts, groups in combined]
+        except (re.error, AssertionError):
+            # Python 2 raises AssertionError for too many groups.
+            return None
+
+    def _index_literals(self, entries):
+        """Builds a {database name -> cluster} dict for literal dbpaths.
+
+        A literal is mapped to the first cluster matching it, which is not
+        necessarily the one listing it if an earlier pattern is more general.
+        """
+        literals = {}
+        # Until an entry with a regexp dbpath is seen, a literal can only
+        # belong to the entry listing it, which saves matching the patterns.
+        regexp_seen = False
+        for entry in entries:
+            regexps = False
+            for dbpath in entry['dbpaths']:
+                if _REGEXP_CHARS.search(dbpath):
+                    regexps = True
+                    continue
+                if dbpath in literals:
+                    continue
+                if regexp_seen:
+                    owner = self._match_pattern(dbpath)
+                else:
+                    owner = self._resolve(entry, dbpath)
+                if owner is not None:
+                    literals[dbpath] = owner
+            regexp_seen = regexp_seen or regexps
+        return literals
+
+    def _match_pattern(self, dbname):
+        entry = self.entry_for(dbname)
+        if entry is None:
+            return None
+        return self._resolve(entry, dbname)
+
+    def _resolve(self, entry, dbname):
+        if 'shards' in entry:
+            return self.rings[entry['label']].get(dbname)
+        return entry
+
+    def entry_for(self, dbname):
+        """Returns the first cluster or shard group matching dbname, or None.
+        """
+        if self._combined is not None:
+            for combined, groups in self._combined:
+                match = combined.match(dbname)
+                if match is not None:
+                    return groups[match.lastgroup]
+            return None
+
+        for pattern, entry in self._compiled:
+            if pattern.match(dbname):
+                return entry
+        return None
+
+    def match(self, dbname):
+        """Returns the cluster holding dbname, or None if nothing matches."""
+        cluster = self._memo.get(dbname)
+        if cluster is not None:
+            self.hits += 1
+            return cluster
+
+        self.misses += 1
+        literals = self._literals
+        if literals is None:
+            literals = self._literals = self._index_literals(self.entries)
+        cluster = literals.get(dbname)
+        if cluster is None:
+            cluster = self._match_pattern(dbname)
+            if cluster is None:
+                return None
+
+        if len(self._memo) >= self._memo_size:
+            self._memo.clear()
+        self._memo[dbname] = cluster
+        return cluster
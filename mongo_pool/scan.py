@@ -0,0 +1,154 @@
+"""Range-partitioned collection scans, see MongoPool.parallel_scan."""
+from concurrent import futures
+from datetime import datetime
+from itertools import islice
+import numbers
+
+from bson.objectid import ObjectId
+import six
+
+from .fanout import stream_cursors
+
+# How the _id boundaries of the partitions are found.
+SAMPLE = 'sample'
+BUCKET_AUTO = 'bucket_auto'
+SPLITS = (SAMPLE, BUCKET_AUTO)
+# _ids sampled per partition, more samples give more even partitions.
+SAMPLES_PER_PARTITION = 20
+
+
+def _type_group(value):
+    """Returns the group of BSON types value is compared within."""
+    if isinstance(value, bool):
+        return bool
+    if isinstance(value, numbers.Number):
+        return numbers.Number
+    if isinstance(value, six.string_types):
+        return six.string_types
+    return type(value)
+
+
+def _sample_ids(collection, filter, partitions):
+    pipeline = [{'$sample': {'size': partitions * SAMPLES_PER_PARTITION}},
+                {'$project': {'_id': 1}}]
+    if filter:
+        pipeline.insert(0, {'$match': filter})
+    return [document['_id'] for document in collection.aggregate(pipeline)]
+
+
+def _bucket_ids(collection, filter, partitions):
+    pipeline = [{'$bucketAuto': {'groupBy': '$_id', 'buckets': partitions}}]
+    if filter:
+        pipeline.insert(0, {'$match': filter})
+    return [document['_id']['min']
+            for document in collection.aggregate(pipeline)]
+
+
+def split_points(collection, filter=None, partitions=8, split=SAMPLE):
+    """Finds _id values splitting a collection into similar ranges.
+
+    Args:
+        collection: the pymongo Collection to split.
+        filter: only the documents matching it are considered.
+        partitions: the wanted number of ranges.
+        split: SAMPLE to pick the boundaries from a $sample of the _ids,
+            which is cheap, or BUCKET_AUTO to let $bucketAuto compute them,
+            which is exact but reads all the _ids.
+
+    Returns:
+        A sorted list of at most partitions - 1 boundaries, all of the same
+        type. It is empty if the collection can not be split.
+    """
+    if partitions <= 1:
+        return []
+    if split == BUCKET_AUTO:
+        ids = _bucket_ids(collection, filter, partitions)
+    else:
+        ids = _sample_ids(collection, filter, partitions)
+
+    # Range queries only match _ids of the bound's type, so boundaries are
+    # taken from the most common type. The first range also holds the _ids
+    # of other types, see partition_filters.
+    groups = {}
+    for value in ids:
+        groups.setdefault(_type_group(value), []).append(value)
+    if not groups:
+        return []
+    ids = max(groups.values(), key=len)
+    if not isinstance(ids[0], (numbers.Number, six.string_types, ObjectId,
+                               datetime)):
+        return []
+    ids = sorted(set(ids))
+
+    points = []
+    for index in range(1, partitions):
+        point = ids[len(ids) * index // partitions]
+        if point != ids[0] and (not points or point != points[-1]):
+            points.append(point)
+    return points
+
+
+def partition_filters(filter, points):
+    """Returns one filter per _id range delimited by points.
+
+    The ranges are disjoint and together match every document of filter:
+    the first one is everything but the _ids from points[0] on, and so holds
+    _ids of other types than the points'.
+    """
+    if not points:
+        return [filter or {}]
+    ranges = [{'$not': {'$gte': points[0]}}]
+    for low, high in zip(points, points[1:]):
+        ranges.append({'$gte': low, '$lt': high})
+    ranges.append({'$gte': points[-1]})
+
+    filters = []
+    for id_range in ranges:
+        if filter:
+            filters.append({'$and': [filter, {'_id': id_range}]})
+        else:
+            filters.append({'_id': id_range})
+    return filters
+
+
+def scan(collection, filters, projection=None, batch_size=1000, workers=8):
+    """Streams the documents matching filters, one cursor per filter.
+
+    See MongoPool.parallel_scan.
+    """
+    cursors = (collection.find(filter, projection, batch_size=batch_size)
+               for filter in filters)
+    return stream_cursors(cursors, batch_size, workers)
+
+
+def scan_with_callback(collection, filters, callback, projection=None,
+                       batch_size=1000, workers=8):
+    """Runs callback(filter, batch) on every batch of every partition.
+
+    See MongoPool.parallel_scan.
+
+    Returns:
+        The number of documents read.
+    """
+    def consume(filter):
+        cursor = collection.find(filter, projection, batch_size=batch_size)
+        count = 0
+        try:
+            while True:
+                batch = list(islice(cursor, batch_size))
+                if not batch:
+                    return count
+                callback(filter, batch)
+                count += len(batch)
+        finally:
+            cursor.close()
+
+    executor = futures.ThreadPoolExecutor(max_workers=workers)
+    pending = [executor.submit(consume, filter) for filter in filters]
+    try:
+        return sum(future.result() for future in pending)
+    finally:
+        # Partitions which did not start yet are dropped after a failure.
+        for future in pending:
+            future.cancel()
+        executor.shutdown(wait=True)
@@ -0,0 +1,531 @@
+"""Simulated Clients, to load test a MongoPool without MongoDB.
+
+    simulation = Simulation(config, {
+        'analytics': {'connect_ms': 50, 'latency_ms': lognormal(5, 0.8),
+                      'pool_size': 10, 'failure_rate': 0.01},
+        'metadata': {'latency_ms': {'find_one': 1, 'default': 3}}})
+    pool = MongoPool(config, connection_class=simulation)
+
+Clients are created per (host, port) like pymongo's. Operations check a
+connection out of a bounded pool, paying connect_ms when a new connection is
+opened, then sleep for their latency and may fail. Documents are kept in
+memory per (host, port), and filters are equality matches on top-level
+fields.
+"""
+from copy import deepcopy
+from itertools import count
+import math
+import random
+import threading
+import time
+
+from pymongo import errors
+from pymongo.results import (DeleteResult, InsertManyResult,
+                             InsertOneResult, UpdateResult)
+
+from .admission import register_types
+from .cache import _clock
+
+# Raised when no connection could be checked out in time. pymongo 3 raises
+# a ConnectionFailure.
+_WaitQueueTimeout = getattr(errors, 'WaitQueueTimeoutError',
+                            errors.ConnectionFailure)
+
+# Settings of a cluster's simulated Clients, and their defaults.
+SETTINGS = {
+    # Milliseconds to open a pooled connection.
+    'connect_ms': 0,
+    # Milliseconds per operation: a number, a distribution (see constant,
+    # uniform, lognormal and exponential) or a dict of them by method name,
+    # with an optional 'default'.
+    'latency_ms': 0,
+    # Maximum number of connections per Client, the Client's maxPoolSize
+    # by default.
+    'pool_size': None,
+    # Probability that an operation fails with AutoReconnect.
+    'failure_rate': 0,
+    # Probability that an operation times out, after the Client's
+    # socketTimeoutMS or timeout_ms.
+    'timeout_rate': 0,
+    'timeout_ms': 1000,
+    # Number of secondaries reported by the Clients of replica sets, which
+    # hedged reads can use. They share the data of the primary.
+    'secondaries': 0,
+}
+DEFAULT_POOL_SIZE = 100
+
+
+def constant(ms):
+    """Always ms milliseconds."""
+    return lambda rng: ms
+
+
+def uniform(low_ms, high_ms):
+    """Uniformly distributed between low_ms and high_ms."""
+    return lambda rng: rng.uniform(low_ms, high_ms)
+
+
+def lognormal(median_ms, sigma):
+    """Log-normally distributed, the usual shape of service latencies.
+
+    Args:
+        median_ms: the median latency.
+        sigma: the standard deviation of the latency's logarithm. The higher,
+            the longer the tail: p99 is about median_ms * exp(2.33 * sigma).
+    """
+    mu = math.log(median_ms)
+    return lambda rng: rng.lognormvariate(mu, sigma)
+
+
+def exponential(mean_ms):
+    """Exponentially distributed with the given mean."""
+    return lambda rng: rng.expovariate(1.0 / mean_ms)
+
+
+def _address(host, port):
+    """Returns a hashable (host, port) key, hosts may be lists of seeds."""
+    if isinstance(host, list):
+        host = tuple(sorted(host))
+    return host, port
+
+
+def _validate(label, settings):
+    for name, value in settings.items():
+        if name not in SETTINGS:
+            raise ValueError('Unknown simulation setting for %s: %s' %
+                             (label, name))
+        if name == 'latency_ms':
+            latencies = value if isinstance(value, dict) else {'': value}
+            for latency in latencies.values():
+                if not callable(latency) and (
+                        isinstance(latency, bool) or
+                        not isinstance(latency, (int, float))):
+                    raise TypeError('latency_ms of %s must be a number, a '
+                                    'distribution or a dict of them' % label)
+        elif name == 'pool_size':
+            if value is not None and (not isinstance(value, int) or
+                                      value < 1):
+                raise ValueError('pool_size of %s must be a positive int' %
+                                 label)
+        elif name == 'secondaries':
+            if (isinstance(value, bool) or not isinstance(value, int) or
+                    value < 0):
+                raise ValueError('secondaries of %s must be a non-negative '
+                                 'int' % label)
+        elif isinstance(value, bool) or not isinstance(value, (int, float)):
+            raise TypeError('%s of %s must be a number' % (name, label))
+        elif value < 0 or (name.endswith('_rate') and value > 1):
+            raise ValueError('Invalid %s for %s: %s' % (name, label, value))
+
+
+class Simulation(object):
+    """A connection_class creating simulated Clients, configured per label.
+
+    Clusters sharing a host and port share their Clients, as with pymongo,
+    and use the settings of the first of them in the configuration.
+    """
+
+    def __init__(self, config, settings=None, default=None, seed=None):
+        """
+        Args:
+            config: the MongoPool configuration.
+            settings: {label -> settings} overriding default, see SETTINGS.
+            default: the settings of clusters without their own.
+            seed: seed of the random numbers, for repeatable runs.
+
+        Raises:
+            TypeError, ValueError: a setting is invalid.
+        """
+        settings = settings or {}
+        self._default = dict(SETTINGS, **(default or {}))
+        _validate('default', self._default)
+        # (host, port) -> label
+        self._labels = {}
+        for cluster in config:
+            for label, cfg in cluster.items():
+                if 'host' in cfg:
+                    self._labels.setdefault(
+                        _address(cfg['host'], cfg['port']), label)
+        self._settings = {}
+        for label, cluster_settings in settings.items():
+            self.update(label, **cluster_settings)
+        self._random = random.Random(seed)
+        # (host, port) -> {namespace -> {_id -> document}}
+        self._data = {}
+        # (host, port) of a secondary -> (host, port) of its replica set
+        self._members = {}
+        self._stats = {}
+        self._lock = threading.Lock()
+
+    def update(self, label, **settings):
+        """Changes the settings of a cluster, also for existing Clients."""
+        _validate(label, settings)
+        merged = dict(self._settings.get(label, self._default))
+        merged.update(settings)
+        self._settings[label] = merged
+
+    def settings(self, label):
+        """Returns the current settings of a cluster."""
+        return self._settings.get(label, self._default)
+
+    def __call__(self, **options):
+        """Creates a Client, taking the arguments of pymongo.MongoClient."""
+        address = _address(options.get('host'), options.get('port'))
+        with self._lock:
+            # Clients of single secondaries use their replica set's data.
+            primary = self._members.get(address, address)
+            label = self._labels.get(primary, '%s:%s' % primary)
+            data = self._data.setdefault(primary, {})
+            stats = self._stats.get(label)
+            if stats is None:
+                stats = self._stats[label] = _Stats()
+            secondaries = set()
+            if options.get('replicaSet'):
+                for index in range(self.settings(label)['secondaries']):
+                    member = ('%s-secondary%d' % (label, index), primary[1])
+                    self._members[member] = primary
+                    secondaries.add(member)
+        stats.add('clients')
+        return SimulatedClient(self, label, options, data, stats, primary,
+                               secondaries)
+
+    def latency(self, label, method):
+        """Draws the latency of an operation, in seconds."""
+        latency = self.settings(label)['latency_ms']
+        if isinstance(latency, dict):
+            latency = latency.get(method, latency.get('default', 0))
+        if callable(latency):
+            latency = latency(self._random)
+        return max(latency, 0) / 1000.0
+
+    def outcome(self, label):
+        """Draws whether an operation succeeds, fails or times out."""
+        settings = self.settings(label)
+        draw = self._random.random()
+        if draw < settings['failure_rate']:
+            return 'failure'
+        if draw < settings['failure_rate'] + settings['timeout_rate']:
+            return 'timeout'
+        return 'success'
+
+    def stats(self):
+        """Returns {label -> counters} of the simulated Clients.
+
+        The counters are the Clients created, connections opened,
+        operations, failures, timeouts, checkouts which had to wait, the
+        total milliseconds waited, and the most connections in use at once.
+        """
+        with self._lock:
+            return dict((label, stats.summary())
+                        for label, stats in self._stats.items())
+
+
+class _Stats(object):
+    def __init__(self):
+        self._counters = dict.fromkeys(
+            ('clients', 'connections', 'operations', 'failures', 'timeouts',
+             'checkout_waits', 'checkout_wait_ms', 'max_in_use'), 0)
+        self._lock = threading.Lock()
+
+    def add(self, name, value=1):
+        with self._lock:
+            self._counters[name] += value
+
+    def maximum(self, name, value):
+        with self._lock:
+            self._counters[name] = max(self._counters[name], value)
+
+    def summary(self):
+        with self._lock:
+            return dict(self._counters)
+
+
+class _ConnectionPool(object):
+    """Bounded pool of simulated connections, opened on demand."""
+
+    def __init__(self, size, wait_timeout, stats):
+        self.size = size
+        self.wait_timeout = wait_timeout
+        self.in_use = 0
+        self.idle = 0
+        self._stats = stats
+        self._condition = threading.Condition()
+
+    def checkout(self):
+        """Waits for a connection.
+
+        Returns:
+            True if a new connection has to be opened.
+        """
+        start = _clock()
+        waited = False
+        with self._condition:
+            while self.in_use >= self.size:
+                waited = True
+                remaining = None
+                if self.wait_timeout is not None:
+                    remaining = start + self.wait_timeout - _clock()
+                    if remaining <= 0:
+                        raise _WaitQueueTimeout(
+                            'Timed out while checking out a connection')
+                self._condition.wait(remaining)
+            self.in_use += 1
+            in_use = self.in_use
+            opened = self.idle == 0
+            if not opened:
+                self.idle -= 1
+        if waited:
+            self._stats.add('checkout_waits')
+            self._stats.add('checkout_wait_ms', (_clock() - start) * 1000)
+        self._stats.maximum('max_in_use', in_use)
+        return opened
+
+    def checkin(self, discard=False):
+        """Returns a connection, which is closed if discard is true."""
+        with self._condition:
+            self.in_use -= 1
+            if not discard:
+                self.idle += 1
+            self._condition.notify()
+
+
+class SimulatedClient(object):
+    """Stands for a pymongo.MongoClient, see Simulation."""
+
+    def __init__(self, simulation, label, options, data, stats,
+                 primary=None, secondaries=()):
+        self.label = label
+        self.options = options
+        self.closed = False
+        self._simulation = simulation
+        self._data = data
+        self._stats = stats
+        size = (simulation.settings(label)['pool_size'] or
+                options.get('maxPoolSize') or DEFAULT_POOL_SIZE)
+        wait_timeout = options.get('waitQueueTimeoutMS')
+        if wait_timeout is not None:
+            wait_timeout /= 1000.0
+        self._pool = _ConnectionPool(size, wait_timeout, stats)
+        self._ids = count(1)
+        self.address = (options.get('host'), options.get('port'))
+        self.primary = primary
+        self.secondaries = set(secondaries)
+        self.arbiters = set()
+
+    def run(self, method, operation=None):
+        """Runs operation() as one simulated round trip."""
+        simulation = self._simulation
+        settings = simulation.settings(self.label)
+        if self._pool.checkout():
+            self._stats.add('connections')
+            time.sleep(settings['connect_ms'] / 1000.0)
+        discard = False
+        try:
+            self._stats.add('operations')
+            outcome = simulation.outcome(self.label)
+            if outcome == 'timeout':
+                discard = True
+                self._stats.add('timeouts')
+                timeout = self.options.get('socketTimeoutMS')
+                if timeout is None:
+                    timeout = settings['timeout_ms']
+                time.sleep(timeout / 1000.0)
+                raise errors.NetworkTimeout('%s timed out (simulated)' %
+                                            self.label)
+            time.sleep(simulation.latency(self.label, method))
+            if outcome == 'failure':
+                discard = True
+                self._stats.add('failures')
+                raise errors.AutoReconnect('%s failed (simulated)' %
+                                           self.label)
+            if operation is not None:
+                return operation()
+        finally:
+            self._pool.checkin(discard)
+
+    def new_id(self):
+        return next(self._ids)
+
+    def collection(self, namespace):
+        return self._data.setdefault(namespace, {})
+
+    def __getitem__(self, name):
+        return SimulatedDatabase(self, name)
+
+    # Like pymongo's, not iterable despite __getitem__.
+    __iter__ = None
+
+    def __getattr__(self, name):
+        if name.startswith('_'):
+            raise AttributeError(name)
+        return self[name]
+
+    def list_database_names(self):
+        def names():
+            return sorted(set(namespace.split('.', 1)[0]
+                              for namespace, documents in self._data.items()
+                              if documents))
+        return self.run('list_database_names', names)
+
+    def close(self):
+        self.closed = True
+
+
+class SimulatedDatabase(object):
+    def __init__(self, client, name):
+        self.client = client
+        self.name = name
+
+    def __getitem__(self, name):
+        return SimulatedCollection(self, name)
+
+    __iter__ = None
+
+    def __getattr__(self, name):
+        if name.startswith('_'):
+            raise AttributeError(name)
+        return self[name]
+
+    def command(self, command, *args, **kwargs):
+        return self.client.run('command', lambda: {'ok': 1.0})
+
+    def list_collection_names(self):
+        prefix = self.name + '.'
+
+        def names():
+            return sorted(namespace[len(prefix):]
+                          for namespace in self.client._data
+                          if namespace.startswith(prefix))
+        return self.client.run('list_collection_names', names)
+
+    def drop_collection(self, name):
+        name = getattr(name, 'name', name)
+        return self.client.run('drop_collection', lambda: self.client._data.pop(
+            '%s.%s' % (self.name, name), None))
+
+
+def _matches(document, filter):
+    return all(document.get(key) == value
+               for key, value in (filter or {}).items())
+
+
+class SimulatedCollection(object):
+    def __init__(self, database, name):
+        self.database = database
+        self.name = name
+        self.full_name = '%s.%s' % (database.name, name)
+        self._client = database.client
+
+    def _documents(self):
+        return self._client.collection(self.full_name)
+
+    def _find(self, filter):
+        return [document for document in list(self._documents().values())
+                if _matches(document, filter)]
+
+    def find_one(self, filter=None, *args, **kwargs):
+        if filter is not None and not isinstance(filter, dict):
+            filter = {'_id': filter}
+
+        def find_one():
+            found = self._find(filter)
+            return deepcopy(found[0]) if found else None
+        return self._client.run('find_one', find_one)
+
+    def find(self, filter=None, *args, **kwargs):
+        return SimulatedCursor(self, filter, kwargs.get('limit') or 0)
+
+    def count_documents(self, filter, **kwargs):
+        return self._client.run('count_documents',
+                                lambda: len(self._find(filter)))
+
+    def insert_one(self, document, **kwargs):
+        def insert_one():
+            document.setdefault('_id', self._client.new_id())
+            self._documents()[document['_id']] = deepcopy(document)
+            return InsertOneResult(document['_id'], True)
+        return self._client.run('insert_one', insert_one)
+
+    def insert_many(self, documents, **kwargs):
+        documents = list(documents)
+
+        def insert_many():
+            for document in documents:
+                document.setdefault('_id', self._client.new_id())
+                self._documents()[document['_id']] = deepcopy(document)
+            return InsertManyResult([document['_id']
+                                     for document in documents], True)
+        return self._client.run('insert_many', insert_many)
+
+    def _update(self, method, filter, update, many):
+        def run():
+            found = self._find(filter)
+            if not many:
+                found = found[:1]
+            for document in found:
+                stored = self._documents()[document['_id']]
+                stored.update(deepcopy(update.get('$set', {})))
+            return UpdateResult({'n': len(found), 'nModified': len(found),
+                                 'ok': 1.0}, True)
+        return self._client.run(method, run)
+
+    def update_one(self, filter, update, **kwargs):
+        """Applies $set updates, other operators are ignored."""
+        return self._update('update_one', filter, update, False)
+
+    def update_many(self, filter, update, **kwargs):
+        return self._update('update_many', filter, update, True)
+
+    def _delete(self, method, filter, many):
+        def run():
+            found = self._find(filter)
+            if not many:
+                found = found[:1]
+            for document in found:
+                self._documents().pop(document['_id'], None)
+            return DeleteResult({'n': len(found), 'ok': 1.0}, True)
+        return self._client.run(method, run)
+
+    def delete_one(self, filter, **kwargs):
+        return self._delete('delete_one', filter, False)
+
+    def delete_many(self, filter, **kwargs):
+        return self._delete('delete_many', filter, True)
+
+    def drop(self):
+        return self.database.drop_collection(self.name)
+
+
+class SimulatedCursor(object):
+    """Fetches all the matching documents in one round trip, when first
+    iterated."""
+
+    def __init__(self, collection, filter, limit):
+        self._collection = collection
+        self._filter = filter
+        self._limit = limit
+        self._documents = None
+        self.closed = False
+
+    def __iter__(self):
+        return self
+
+    def next(self):
+        if self._documents is None:
+            def find():
+                found = self._collection._find(self._filter)
+                if self._limit:
+                    found = found[:self._limit]
+                return iter(deepcopy(found))
+            self._documents = self._collection._client.run('find', find)
+        return next(self._documents)
+
+    __next__ = next
+
+    def close(self):
+        self.closed = True
+
+
+# Pools of clusters with a max_concurrency limit simulated operations too.
+register_types(objects=(SimulatedDatabase, SimulatedCollection),
+               cursors=(SimulatedCursor,))
@@ -0,0 +1,226 @@
+from collections import deque
+import atexit
+import threading
+import weakref
+
+from pymongo.errors import BulkWriteError
+
+from .cache import _clock
+from .instrumentation import Histogram
+
+# Open writers, closed when the interpreter exits.
+_writers = weakref.WeakSet()
+
+
+@atexit.register
+def _close_writers():
+    for writer in list(_writers):
+        writer.close()
+
+
+class BufferedWriter(object):
+    """Inserts documents in the background, in batches.
+
+    Documents passed to write are queued in memory and inserted with
+    insert_many(ordered=False) by a background thread, once max_batch of them
+    are queued or the oldest one waited for max_delay_ms. When max_buffer
+    documents are queued, write blocks (or drops the document, if block is
+    False) until the background thread catches up.
+
+    Writes are fire-and-forget: failures are only counted, see stats. The
+    remaining documents are flushed by close, which is also called when the
+    interpreter exits.
+
+        with pool.buffered_writer('logs', 'requests') as writer:
+            writer.write({'path': '/', 'status': 200})
+    """
+
+    def __init__(self, pool, dbname, collection, max_batch=500,
+                 max_delay_ms=100, max_buffer=10000, block=True):
+        """
+        Args:
+            pool: the MongoPool routing dbname.
+            dbname, collection: where documents are inserted.
+            max_batch: the maximum number of documents per insert_many.
+            max_delay_ms: the maximum time a document waits to be flushed.
+            max_buffer: the maximum number of queued documents.
+            block: whether write waits for room when the buffer is full,
+                rather than dropping the document.
+
+        Raises:
+            Exception: the database does not match any cluster.
+        """
+        if max_batch < 1 or max_buffer < max_batch:
+            raise ValueError('max_batch must be positive and not exceed '
+                             'max_buffer')
+        # Fail early if the database can not be routed.
+        pool._match_dbname(dbname)
+
+        self._pool = pool
+        self._dbname = dbname
+        self._collection = collection
+        self._max_batch = max_batch
+        self._max_delay = max_delay_ms / 1000.0
+        self._max_buffer = max_buffer
+        self._block = block
+
+        # (document, time it was queued)
+        self._buffer = deque()
+        # Number of batches being inserted.
+        self._flushing = 0
+        # Number of flush calls waiting.
+        self._flush_requests = 0
+        self._closed = False
+        self._condition = threading.Condition()
+        self._flush_latency = Histogram()
+        self.written = 0
+        self.failed = 0
+        self.dropped = 0
+
+        self._thread = threading.Thread(target=self._run,
+                                        name='mongo-pool-writer')
+        self._thread.daemon = True
+        self._thread.start()
+        _writers.add(self)
+
+    def write(self, document, timeout=None):
+        """Queue a document for insertion.
+
+        Args:
+            document: the document to insert.
+            timeout: seconds to wait for room in the buffer when it is full
+                and block is True, None to wait forever.
+
+        Returns:
+            True if the document was queued, False if it was dropped.
+
+        Raises:
+            ValueError: the writer is closed.
+        """
+        with self._condition:
+            if self._closed:
+                raise ValueError('Write to a closed BufferedWriter')
+            if len(self._buffer) >= self._max_buffer:
+                if self._block:
+                    deadline = None if timeout is None else _clock() + timeout
+                    while (len(self._buffer) >= self._max_buffer and
+                           not self._closed):
+                        remaining = None
+                        if deadline is not None:
+                            remaining = deadline - _clock()
+                            if remaining <= 0:
+                                break
+                        self._condition.wait(remaining)
+                if len(self._buffer) >= self._max_buffer or self._closed:
+                    self.dropped += 1
+                    return False
+
+            self._buffer.append((document, _clock()))
+            # Wake the background thread up to start the delay of this batch,
+            # or because the batch is full.
+            if (len(self._buffer) == 1 or
+                    len(self._buffer) >= self._max_batch):
+                self._condition.notify_all()
+            return True
+
+    def flush(self, timeout=None):
+        """Wait until all queued documents are inserted.
+
+        Returns:
+            True if everything was flushed, False on timeout.
+        """
+        deadline = None if timeout is None else _clock() + timeout
+        with self._condition:
+            self._flush_requests += 1
+            self._condition.notify_all()
+            try:
+                while self._buffer or self._flushing:
+                    if not self._thread.is_alive():
+                        return False
+                    remaining = None
+                    if deadline is not None:
+                        remaining = deadline - _clock()
+                        if remaining <= 0:
+                            return False
+                    self._condition.wait(remaining)
+            finally:
+                # Batches wait for max_batch or max_delay_ms again once no
+                # flush is waiting.
+                self._flush_requests -= 1
+        return True
+
+    def close(self, timeout=None):
+        """Flush the queued documents and stop the background thread."""
+        with self._condition:
+            if self._closed:
+                return
+            self._closed = True
+            self._condition.notify_all()
+        _writers.discard(self)
+        self._thread.join(timeout)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def stats(self):
+        """Returns the counters and the flush latency (in milliseconds)."""
+        with self._condition:
+            return {'buffered': len(self._buffer),
+                    'written': self.written,
+                    'failed': self.failed,
+                    'dropped': self.dropped,
+                    'flush_latency': self._flush_latency.summary()}
+
+    def _next_batch(self):
+        """Waits until a batch is due and takes it from the buffer.
+
+        Returns:
+            A list of documents, or None once closed and empty.
+        """
+        with self._condition:
+            while True:
+                if self._buffer:
+                    due = self._buffer[0][1] + self._max_delay
+                    if (len(self._buffer) >= self._max_batch or
+                            self._closed or self._flush_requests or
+                            due <= _clock()):
+                        break
+                    self._condition.wait(due - _clock())
+                elif self._closed:
+                    return None
+                else:
+                    self._condition.wait()
+
+            count = min(self._max_batch, len(self._buffer))
+            batch = [self._buffer.popleft()[0] for _ in range(count)]
+            self._flushing += 1
+            # Writers blocked on a full buffer can go on.
+            self._condition.notify_all()
+            return batch
+
+    def _run(self):
+        while True:
+            batch = self._next_batch()
+            if batch is None:
+                return
+
+            start = _clock()
+            written = 0
+            try:
+                collection = self._pool[self._dbname][self._collection]
+                result = collection.insert_many(batch, ordered=False)
+                written = len(result.inserted_ids)
+            except BulkWriteError as e:
+                written = e.details.get('nInserted', 0)
+            except Exception:
+                pass
+            self._flush_latency.record((_clock() - start) * 1000)
+
+            with self._condition:
+                self.written += written
+                self.failed += len(batch) - written
+                self._flushing -= 1
+                self._condition.notify_all()
@@ -25,7 +25,8 @@ setup(
     license='Apache Software License',
     author='UberVU',
     author_email="development@ubervu.com",
-    install_requires=['pymongo>=3.6.1', 'six>=1.15.0'],
+    install_requires=['pymongo>=3.6.1', 'six>=1.15.0',
+                      'futures>=3.3.0; python_version < "3"'],
     packages=['mongo_pool'],
     include_package_data=True,
     platforms='any',
@@ -44,5 +45,6 @@ setup(
         ],
     extras_require={
         'testing': ['nose', 'mock'],
+        'asyncio': ['motor>=2.0; python_version >= "3.6"'],
     }
 )
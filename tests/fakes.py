@@ -0,0 +1,56 @@
+"""Fakes shared by the tests."""
+try:
+    import asyncio
+except ImportError:
+    asyncio = None
+
+
+def resolved(value):
+    """Returns a future already holding value."""
+    future = asyncio.Future()
+    future.set_result(value)
+    return future
+
+
+class FakeCursor(object):
+    """Iterates over documents, like a pymongo cursor or, asynchronously,
+    like a Motor cursor.
+
+    Raises error, if any, once the documents are exhausted.
+    """
+
+    def __init__(self, documents, error=None):
+        self._documents = iter(documents)
+        self._error = error
+        self.closed = False
+        # Number of documents read from the cursor.
+        self.taken = 0
+
+    def _next(self):
+        try:
+            document = next(self._documents)
+        except StopIteration:
+            if self._error is not None:
+                raise self._error
+            raise
+        self.taken += 1
+        return document
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        return self._next()
+    next = __next__
+
+    def __aiter__(self):
+        return self
+
+    def __anext__(self):
+        try:
+            return resolved(self._next())
+        except StopIteration:
+            raise StopAsyncIteration
+
+    def close(self):
+        self.closed = True
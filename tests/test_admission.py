@@ -0,0 +1,146 @@
+from copy import deepcopy
+import threading
+from unittest import TestCase
+
+from mock import patch
+import pymongo
+from pymongo.collection import Collection
+from pymongo.cursor import Cursor
+from pymongo.database import Database
+
+from mongo_pool import MongoPool
+from mongo_pool.admission import ClusterSaturated, Limiter
+
+
+def new_client(**kwargs):
+    # Never connects, operations are patched.
+    return pymongo.MongoClient(connect=False, **kwargs)
+
+
+class LimiterTestCase(TestCase):
+    def test_rejects_when_queue_is_full(self):
+        limiter = Limiter('label', max_concurrency=2, max_queue=0)
+        limiter.acquire()
+        limiter.acquire()
+        with self.assertRaises(ClusterSaturated):
+            limiter.acquire()
+        limiter.release()
+        limiter.acquire()
+        self.assertEqual(limiter.stats()['in_flight'], 2)
+        self.assertEqual(limiter.stats()['admitted'], 3)
+        self.assertEqual(limiter.stats()['rejected'], 1)
+
+    def test_queue_timeout(self):
+        limiter = Limiter('label', max_concurrency=1, queue_timeout=0.01)
+        limiter.acquire()
+        with self.assertRaises(ClusterSaturated):
+            limiter.acquire()
+        self.assertEqual(limiter.stats()['timed_out'], 1)
+        self.assertEqual(limiter.stats()['queued'], 0)
+
+    def test_waiters_are_admitted_on_release(self):
+        limiter = Limiter('label', max_concurrency=1)
+        limiter.acquire()
+        admitted = threading.Event()
+
+        def wait():
+            with limiter:
+                admitted.set()
+        thread = threading.Thread(target=wait)
+        thread.start()
+        self.assertFalse(admitted.wait(0.05))
+        self.assertEqual(limiter.stats()['queued'], 1)
+        limiter.release()
+        thread.join(5)
+        self.assertTrue(admitted.is_set())
+        self.assertEqual(limiter.stats()['in_flight'], 0)
+
+
+class AdmissionControlTestCase(TestCase):
+    def setUp(self):
+        self.config = [{'label1': {'host': '127.0.0.1', 'port': 27017,
+                                   'dbpath': 'db1', 'max_concurrency': 1,
+                                   'max_queue': 0}},
+                       {'label2': {'host': '127.0.0.1', 'port': 27018,
+                                   'dbpath': 'db2'}}]
+        self.pool = MongoPool(self.config, connection_class=new_client)
+        self.addCleanup(self.pool._disconnect)
+
+    def test_raises_exception_for_invalid_limits(self):
+        for name, value, error in [('max_concurrency', 'a', TypeError),
+                                   ('max_concurrency', 0, ValueError),
+                                   ('max_queue', True, TypeError),
+                                   ('max_queue', -1, ValueError),
+                                   ('queue_timeout', '1', TypeError)]:
+            config = deepcopy(self.config)
+            config[0]['label1'][name] = value
+            with self.assertRaises(error):
+                MongoPool(config)
+
+        config = deepcopy(self.config)
+        config[1]['label2']['max_queue'] = 10
+        with self.assertRaises(ValueError):
+            MongoPool(config)
+
+    def test_unlimited_clusters_are_not_wrapped(self):
+        self.assertIsInstance(self.pool.db2, Database)
+        self.assertNotIsInstance(self.pool.db1, Database)
+        self.assertEqual(self.pool.db1.name, 'db1')
+        self.assertIsInstance(self.pool.db1.events._target, Collection)
+        self.assertEqual(self.pool.db1['events'].full_name, 'db1.events')
+
+    def test_saturated_cluster_rejects_operations(self):
+        started = threading.Event()
+        release = threading.Event()
+
+        def find_one(collection, *args, **kwargs):
+            if collection.database.name == 'db1':
+                started.set()
+                release.wait(5)
+            return {'_id': 1}
+
+        with patch.object(Collection, 'find_one', autospec=True,
+                          side_effect=find_one):
+            thread = threading.Thread(target=self.pool.db1.events.find_one)
+            thread.start()
+            self.assertTrue(started.wait(5))
+            try:
+                with self.assertRaises(ClusterSaturated):
+                    self.pool.db1.events.find_one()
+                # Other clusters are not affected.
+                self.assertEqual(self.pool.db2.events.find_one(),
+                                 {'_id': 1})
+                limits = self.pool.stats()['limits']
+                self.assertEqual(list(limits), ['label1'])
+                self.assertEqual(limits['label1']['in_flight'], 1)
+                self.assertEqual(limits['label1']['rejected'], 1)
+            finally:
+                release.set()
+                thread.join(5)
+            self.assertEqual(self.pool.db1.events.find_one(), {'_id': 1})
+
+    def test_cursors_are_limited(self):
+        limiter = self.pool._get_cluster_config('label1')['limiter']
+        documents = iter([{'_id': 1}, {'_id': 2}])
+
+        def next_document(cursor):
+            self.assertEqual(limiter.in_flight, 1)
+            return next(documents)
+
+        with patch.object(Cursor, '__next__', autospec=True,
+                          side_effect=next_document):
+            cursor = self.pool.db1.events.find().sort('_id').limit(2)
+            self.assertEqual(list(cursor), [{'_id': 1}, {'_id': 2}])
+        self.assertEqual(limiter.in_flight, 0)
+
+    def test_reload_applies_new_limits(self):
+        db1 = self.pool.db1
+        self.pool.db2
+        config = deepcopy(self.config)
+        config[0]['label1']['max_concurrency'] = 5
+        self.pool.reload(config)
+
+        self.assertIn('db2', self.pool._databases)
+        self.assertIsNot(self.pool.db1, db1)
+        self.assertEqual(
+            self.pool.stats()['limits']['label1']['max_concurrency'], 5)
@@ -0,0 +1,208 @@
+from copy import deepcopy
+from unittest import TestCase, skipIf
+
+from mock import MagicMock
+
+try:
+    import asyncio
+    from mongo_pool import AsyncMongoPool
+except ImportError:
+    # The asyncio pool needs python 3.6.
+    asyncio = None
+
+from .fakes import FakeCursor, resolved
+
+
+class FakeClient(object):
+    """An async Client serving DATA[port]."""
+    DATA = {}
+
+    def __init__(self, **kwargs):
+        self.kwargs = kwargs
+        self.closed = False
+        self.cursors = []
+        self.admin = MagicMock()
+        self.admin.command.side_effect = lambda name: resolved({'ok': 1})
+
+    def __getitem__(self, dbname):
+        client = self
+        database = MagicMock()
+        database.name = dbname
+
+        def find(filter, projection, sort=None, limit=0, batch_size=0):
+            documents = list(client.DATA[client.kwargs['port']][dbname])
+            if sort:
+                documents.sort(key=lambda document: document[sort[0][0]])
+            error = None
+            if documents and documents[-1] == 'error':
+                documents.pop()
+                error = ValueError('cursor failed')
+            cursor = FakeCursor(documents, error)
+            client.cursors.append(cursor)
+            return cursor
+        database.__getitem__.return_value.find.side_effect = find
+        return database
+
+    def list_database_names(self):
+        return resolved(sorted(self.DATA[self.kwargs['port']]))
+
+    def close(self):
+        self.closed = True
+
+
+@skipIf(asyncio is None, 'asyncio is not available')
+class AsyncMongoPoolTestCase(TestCase):
+    def setUp(self):
+        self.loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(self.loop)
+        self.addCleanup(asyncio.set_event_loop, None)
+        self.addCleanup(self.loop.close)
+        self.config = [{'label1': {'host': '127.0.0.1', 'port': 27017,
+                                   'dbpath': 'db1'}},
+                       {'label3': {'host': '127.0.0.1', 'port': 27018,
+                                   'dbpath': ['comments_2015', 'db3']}},
+                       {'label2': {'host': '127.0.0.1', 'port': 27017,
+                                   'dbpath': 'comments_.*'}}]
+        FakeClient.DATA = {
+            27017: {'db1': [], 'comments_2014': [{'t': 1}, {'t': 4}],
+                    'comments_2015': [{'t': 100}]},
+            27018: {'comments_2015': [{'t': 2}, {'t': 3}], 'db3': []}}
+        self.created = []
+
+        def connection_class(**kwargs):
+            client = FakeClient(**kwargs)
+            self.created.append(client)
+            return client
+        self.pool = AsyncMongoPool(self.config,
+                                   connection_class=connection_class)
+
+    def wait(self, coroutine):
+        return self.loop.run_until_complete(coroutine)
+
+    def collect(self, documents):
+        result = []
+        while True:
+            try:
+                result.append(self.wait(documents.__anext__()))
+            except StopAsyncIteration:
+                return result
+
+    def test_validates_config(self):
+        config = deepcopy(self.config)
+        config[0]['label1']['port'] = '27017'
+        with self.assertRaises(TypeError):
+            AsyncMongoPool(config, connection_class=FakeClient)
+
+    def test_requires_motor_without_connection_class(self):
+        try:
+            import motor  # noqa
+        except ImportError:
+            with self.assertRaises(ImportError):
+                AsyncMongoPool(self.config)
+        else:
+            AsyncMongoPool(self.config)
+
+    def test_get_database(self):
+        db1 = self.wait(self.pool.get_database('db1'))
+        self.assertEqual(db1.name, 'db1')
+        self.assertIs(self.wait(self.pool.get_database('db1')), db1)
+        self.wait(self.pool.get_database('comments_2014'))
+        # Clusters with the same connection parameters share a Client.
+        self.assertEqual(len(self.created), 1)
+        self.assertEqual(self.created[0].kwargs['socketTimeoutMS'], None)
+
+        self.wait(self.pool.get_database('db3'))
+        self.assertEqual(len(self.created), 2)
+        self.assertIs(self.wait(self.pool.get_cluster('label3')),
+                      self.created[1])
+        with self.assertRaises(Exception):
+            self.wait(self.pool.get_database('unknown'))
+
+    def test_concurrent_access_creates_one_client(self):
+        created = []
+
+        def connection_class(**kwargs):
+            # A Client whose creation has to wait.
+            created.append(kwargs)
+            return asyncio.sleep(0.01, result=FakeClient(**kwargs))
+        pool = AsyncMongoPool(self.config, connection_class=connection_class)
+        databases = self.wait(asyncio.gather(*[pool.get_database('db1')
+                                               for _ in range(50)]))
+        self.assertEqual(len(created), 1)
+        self.assertEqual(len(databases), 50)
+
+    def test_warmup(self):
+        results = self.wait(self.pool.warmup())
+        self.assertEqual(set(results), set(['label1', 'label2', 'label3']))
+        for result in results.values():
+            self.assertIsNone(result['error'])
+        self.assertEqual(len(self.created), 2)
+        self.created[0].admin.command.assert_called_with('ping')
+
+    def test_warmup_timeout(self):
+        def connection_class(**kwargs):
+            client = FakeClient(**kwargs)
+            if kwargs['port'] == 27018:
+                client.admin.command.side_effect = (
+                    lambda name: asyncio.Future())
+            return client
+        pool = AsyncMongoPool(self.config, connection_class=connection_class)
+        results = self.wait(pool.warmup(labels=['label1'], dbnames=['db3'],
+                                       timeout=0.05))
+        self.assertIsNone(results['label1']['error'])
+        self.assertIsInstance(results['label3']['error'],
+                              asyncio.TimeoutError)
+        self.assertNotIn('db3', pool._databases)
+
+    def test_find_databases(self):
+        self.assertEqual(self.wait(self.pool.find_databases('comments_.*')),
+                         ['comments_2014', 'comments_2015'])
+        self.assertEqual(
+            self.wait(self.pool.find_databases('comments_.*',
+                                              labels=['label2'])),
+            ['comments_2014'])
+
+    def test_sorted_fanout(self):
+        documents = self.pool.fanout('comments_.*', 'comments', sort='t')
+        self.assertEqual(self.collect(documents),
+                         [{'t': 1}, {'t': 2}, {'t': 3}, {'t': 4}])
+        for client in self.created:
+            for cursor in client.cursors:
+                self.assertTrue(cursor.closed)
+
+    def test_unordered_fanout(self):
+        documents = self.collect(self.pool.fanout(
+            ['comments_2014', 'comments_2015'], 'comments', limit=3))
+        self.assertEqual(len(documents), 3)
+        documents = self.collect(self.pool.fanout(
+            ['comments_2014', 'comments_2015'], 'comments'))
+        self.assertEqual(sorted(document['t'] for document in documents),
+                         [1, 2, 3, 4])
+
+    def test_unordered_fanout_buffers_per_database(self):
+        FakeClient.DATA[27017]['comments_2014'] = [{'t': i}
+                                                   for i in range(50)]
+        documents = self.pool.fanout(['comments_2014', 'comments_2015'],
+                                     'comments', batch_size=2)
+        self.wait(documents.__anext__())
+        self.wait(asyncio.sleep(0.01))
+        fast, slow = [client.cursors[0] for client in self.created]
+        # 4 buffered documents, one waiting for room and one returned.
+        self.assertLessEqual(fast.taken, 6)
+        # The fast database does not take the room of the slow one.
+        self.assertEqual(slow.taken, 2)
+        self.assertEqual(len(self.collect(documents)), 51)
+
+    def test_fanout_errors(self):
+        FakeClient.DATA[27018]['comments_2015'].append('error')
+        with self.assertRaises(ValueError):
+            self.collect(self.pool.fanout('comments_.*', 'comments'))
+
+    def test_aclose(self):
+        self.wait(self.pool.warmup())
+        self.wait(self.pool.aclose())
+        self.assertTrue(all(client.closed for client in self.created))
+        self.assertEqual(len(self.pool._databases), 0)
+        # The pool connects again when used after being closed.
+        self.wait(self.pool.get_database('db1'))
+        self.assertEqual(len(self.created), 3)
@@ -0,0 +1,81 @@
+from unittest import TestCase
+
+from mock import MagicMock
+from pymongo import InsertOne, DeleteOne
+from pymongo.errors import AutoReconnect, BulkWriteError
+
+from mongo_pool import MongoPool
+
+
+class BulkRouterTestCase(TestCase):
+    def setUp(self):
+        self.config = [{'label1': {'host': '127.0.0.1', 'port': 27017,
+                                   'dbpath': 'tenant_[0-4]'}},
+                       {'label2': {'host': '127.0.0.1', 'port': 27018,
+                                   'dbpath': 'tenant_.*'}}]
+        self.clients = {27017: MagicMock(), 27018: MagicMock()}
+        self.pool = MongoPool(
+            self.config,
+            connection_class=lambda **kw: self.clients[kw['port']])
+
+    def collection(self, port, dbname, collection):
+        return self.clients[port][dbname][collection]
+
+    def test_groups_by_namespace_in_batches(self):
+        collection = self.collection(27017, 'tenant_1', 'events')
+        collection.bulk_write.return_value.bulk_api_result = {
+            'nInserted': 2, 'writeErrors': []}
+
+        router = self.pool.bulk_router(batch_size=2)
+        router.extend(('tenant_1', 'events', InsertOne({'i': i}))
+                      for i in range(3))
+        router.add('tenant_7', 'events', DeleteOne({'i': 1}))
+        self.assertEqual(len(router), 4)
+        results = router.execute()
+
+        self.assertEqual(len(router), 0)
+        self.assertEqual(collection.bulk_write.call_count, 2)
+        batches = [c[0][0] for c in collection.bulk_write.call_args_list]
+        self.assertEqual([len(batch) for batch in batches], [2, 1])
+        for c in collection.bulk_write.call_args_list:
+            self.assertEqual(c[1], {'ordered': False})
+        self.assertEqual(results[('tenant_1', 'events')]['nInserted'], 4)
+        self.assertTrue(self.collection(27018, 'tenant_7',
+                                        'events').bulk_write.called)
+
+    def test_collects_errors(self):
+        collection = self.collection(27017, 'tenant_1', 'events')
+        collection.bulk_write.side_effect = [
+            BulkWriteError({'nInserted': 0,
+                            'writeErrors': [{'index': 0, 'code': 11000}]}),
+            AutoReconnect('down')]
+
+        router = self.pool.bulk_router(batch_size=1)
+        router.add('tenant_1', 'events', InsertOne({'_id': 1}))
+        router.add('tenant_1', 'events', InsertOne({'_id': 2}))
+        result = router.execute()[('tenant_1', 'events')]
+
+        self.assertEqual(result['writeErrors'], [{'index': 0, 'code': 11000}])
+        self.assertEqual(len(result['errors']), 1)
+        self.assertIsInstance(result['errors'][0], AutoReconnect)
+
+    def test_unavailable_clusters_are_collected(self):
+        self.clients[27018].__getitem__.side_effect = AutoReconnect('down')
+        collection = self.collection(27017, 'tenant_1', 'events')
+        collection.bulk_write.return_value.bulk_api_result = {'nInserted': 1}
+
+        router = self.pool.bulk_router()
+        router.add('tenant_1', 'events', InsertOne({'_id': 1}))
+        router.add('tenant_7', 'events', InsertOne({'_id': 2}))
+        results = router.execute()
+
+        self.assertEqual(results[('tenant_1', 'events')]['nInserted'], 1)
+        errors = results[('tenant_7', 'events')]['errors']
+        self.assertEqual(len(errors), 1)
+        self.assertIsInstance(errors[0], AutoReconnect)
+
+    def test_rejects_unknown_databases(self):
+        router = self.pool.bulk_router()
+        with self.assertRaises(Exception):
+            router.add('unknown', 'events', InsertOne({}))
+        self.assertEqual(router.execute(), {})
@@ -0,0 +1,65 @@
+from unittest import TestCase
+
+from mock import patch
+
+from mongo_pool.cache import LRUCache
+
+
+class LRUCacheTestCase(TestCase):
+    def test_evicts_least_recently_used(self):
+        cache = LRUCache(max_size=2)
+        cache.set('a', 1)
+        cache.set('b', 2)
+        cache.get('a')
+        cache.set('c', 3)
+
+        self.assertIn('a', cache)
+        self.assertNotIn('b', cache)
+        self.assertEqual(cache.stats()['evictions'], 1)
+
+    def test_counts_hits_and_misses(self):
+        cache = LRUCache()
+        cache.set('a', 1)
+        self.assertEqual(cache.get('a'), 1)
+        self.assertIsNone(cache.get('b'))
+
+        stats = cache.stats()
+        self.assertEqual(stats['hits'], 1)
+        self.assertEqual(stats['misses'], 1)
+
+    @patch('mongo_pool.cache._clock')
+    def test_expires_entries(self, clock):
+        clock.return_value = 100
+        cache = LRUCache(ttl=10)
+        cache.set('a', 1)
+
+        clock.return_value = 109
+        self.assertEqual(cache.get('a'), 1)
+        clock.return_value = 111
+        self.assertIsNone(cache.get('a'))
+        self.assertNotIn('a', cache)
+
+    @patch('mongo_pool.cache._clock')
+    def test_entries_may_have_their_own_ttl(self, clock):
+        clock.return_value = 100
+        cache = LRUCache(ttl=10)
+        cache.set('a', 1, ttl=60)
+        cache.set('b', 2)
+
+        clock.return_value = 150
+        self.assertEqual(cache.get('a'), 1)
+        self.assertIsNone(cache.get('b'))
+
+    def test_discard_if(self):
+        cache = LRUCache()
+        cache.set('a', 1)
+        cache.set('b', 2)
+        self.assertEqual(cache.discard_if(lambda key, value: value > 1),
+                         ['b'])
+        self.assertEqual(len(cache), 1)
+
+    def test_rejects_invalid_bounds(self):
+        with self.assertRaises(ValueError):
+            LRUCache(max_size=0)
+        with self.assertRaises(ValueError):
+            LRUCache(ttl=0)
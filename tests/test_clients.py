@@ -0,0 +1,41 @@
+from unittest import TestCase
+
+from mock import MagicMock
+from pymongo.read_preferences import Primary, Secondary
+
+from mongo_pool.clients import ClientRegistry, client_key
+
+
+class ClientKeyTestCase(TestCase):
+    def test_host_order_does_not_matter(self):
+        self.assertEqual(client_key({'host': ['b', 'a'], 'port': 1}),
+                         client_key({'host': ['a', 'b'], 'port': 1}))
+        self.assertEqual(client_key({'host': 'a', 'port': 1}),
+                         client_key({'host': ['a'], 'port': 1}))
+
+    def test_read_preferences_are_compared(self):
+        self.assertEqual(client_key({'read_preference': Primary()}),
+                         client_key({'read_preference': Primary()}))
+        self.assertNotEqual(client_key({'read_preference': Primary()}),
+                            client_key({'read_preference': Secondary()}))
+
+
+class ClientRegistryTestCase(TestCase):
+    def test_shares_clients_and_closes_the_last_reference(self):
+        registry = ClientRegistry()
+        create = MagicMock()
+        client = registry.acquire('key', create)
+        self.assertIs(registry.acquire('key', create), client)
+        create.assert_called_once_with()
+
+        registry.release('key')
+        self.assertFalse(client.close.called)
+        registry.release('key')
+        client.close.assert_called_once_with()
+        self.assertEqual(len(registry), 0)
+
+    def test_failed_creation_is_not_kept(self):
+        registry = ClientRegistry()
+        with self.assertRaises(ValueError):
+            registry.acquire('key', MagicMock(side_effect=ValueError))
+        self.assertEqual(len(registry), 0)
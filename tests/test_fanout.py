@@ -0,0 +1,132 @@
+from datetime import datetime
+from unittest import TestCase
+
+from bson.binary import Binary
+from bson.decimal128 import Decimal128
+from bson.max_key import MaxKey
+from bson.min_key import MinKey
+from bson.objectid import ObjectId
+from bson.regex import Regex
+from bson.timestamp import Timestamp
+import pymongo
+
+from mongo_pool import MongoPool
+from mongo_pool.fanout import SortKey, normalize_sort
+
+from .fakes import FakeCursor
+
+
+class FakeClient(object):
+    """Holds {dbname -> {collection -> documents}} and records finds."""
+
+    def __init__(self, databases):
+        self.databases = databases
+        self.cursors = []
+
+    def list_database_names(self):
+        return list(self.databases)
+
+    def __getitem__(self, dbname):
+        client = self
+
+        class Database(object):
+            def __getitem__(self, collection):
+                return Collection(client, client.databases[dbname][collection])
+        return Database()
+
+
+class Collection(object):
+    def __init__(self, client, documents):
+        self._client = client
+        self._documents = documents
+
+    def find(self, filter, projection, sort=None, limit=0, batch_size=0):
+        documents = list(self._documents)
+        for key, direction in reversed(sort or []):
+            documents.sort(key=lambda d: d[key],
+                           reverse=direction == pymongo.DESCENDING)
+        if limit:
+            documents = documents[:limit]
+        cursor = FakeCursor(documents)
+        self._client.cursors.append(cursor)
+        return cursor
+
+
+class FanoutTestCase(TestCase):
+    def setUp(self):
+        self.clients = {
+            27017: FakeClient({
+                'comments_1': {'c': [{'n': 1}, {'n': 4}, {'n': 7}]},
+                'comments_2': {'c': [{'n': 2}, {'n': 5}]},
+                # Routed to the other cluster, so it is ignored here.
+                'comments_3': {'c': [{'n': 100}]},
+                'other': {'c': [{'n': 0}]}}),
+            27018: FakeClient({
+                'comments_3': {'c': [{'n': 3}, {'n': 6}, {'n': 8}]}}),
+        }
+        config = [{'label1': {'host': '127.0.0.1', 'port': 27017,
+                              'dbpath': ['comments_[12]', 'other']}},
+                  {'label2': {'host': '127.0.0.1', 'port': 27018,
+                              'dbpath': 'comments_.*'}}]
+        self.pool = MongoPool(
+            config, connection_class=lambda **kw: self.clients[kw['port']])
+
+    def test_unordered_fanout_returns_everything(self):
+        documents = self.pool.fanout('comments_.*', 'c', batch_size=2,
+                                     workers=2)
+        self.assertEqual(sorted(d['n'] for d in documents),
+                         [1, 2, 3, 4, 5, 6, 7, 8])
+
+    def test_sorted_fanout_merges(self):
+        documents = self.pool.fanout('comments_.*', 'c', batch_size=1,
+                                     workers=1, sort=[('n', -1)])
+        self.assertEqual([d['n'] for d in documents],
+                         [8, 7, 6, 5, 4, 3, 2, 1])
+
+    def test_limit_and_explicit_databases(self):
+        documents = self.pool.fanout(['comments_1', 'comments_3'], 'c',
+                                     sort='n', limit=3)
+        self.assertEqual([d['n'] for d in documents], [1, 3, 4])
+
+    def test_closing_the_generator_closes_cursors(self):
+        documents = self.pool.fanout('comments_.*', 'c', batch_size=1)
+        next(documents)
+        documents.close()
+        cursors = self.clients[27017].cursors + self.clients[27018].cursors
+        self.assertEqual(len(cursors), 3)
+        self.assertTrue(all(cursor.closed for cursor in cursors))
+
+
+class SortKeyTestCase(TestCase):
+    def test_mixed_directions_and_missing_values(self):
+        sort = normalize_sort([('a', 1), ('b', -1)])
+        documents = [{'a': 2, 'b': 1}, {'a': 1, 'b': 1}, {'a': 1, 'b': 3},
+                     {'b': 5}, {'a': 'x'}]
+        ordered = sorted(documents, key=lambda d: SortKey(d, sort))
+        self.assertEqual(ordered, [{'b': 5}, {'a': 1, 'b': 3},
+                                   {'a': 1, 'b': 1}, {'a': 2, 'b': 1},
+                                   {'a': 'x'}])
+
+    def test_types_follow_the_bson_order(self):
+        sort = normalize_sort('a')
+        when = datetime(2020, 1, 1)
+        object_id = ObjectId()
+        values = [MinKey(), None, 1, 2.5, Decimal128('3'), 'a', 'b',
+                  {'x': 1}, Binary(b'\x01'), object_id, False, True, when,
+                  Timestamp(1, 1), Regex('^a'), MaxKey()]
+        documents = [{'a': value} for value in reversed(values)]
+        documents.append({})
+        ordered = sorted(documents, key=lambda d: SortKey(d, sort))
+        self.assertEqual([document.get('a') for document in ordered],
+                         [values[0], None, None] + values[2:])
+
+    def test_arrays_sort_by_their_bounds(self):
+        documents = [{'a': [1, 5]}, {'a': 3}, {'a': []}, {'a': None}]
+        ordered = sorted(documents,
+                         key=lambda d: SortKey(d, normalize_sort('a')))
+        self.assertEqual(ordered, [{'a': []}, {'a': None}, {'a': [1, 5]},
+                                   {'a': 3}])
+        ordered = sorted(documents,
+                         key=lambda d: SortKey(d, [('a', -1)]))
+        self.assertEqual(ordered, [{'a': [1, 5]}, {'a': 3}, {'a': None},
+                                   {'a': []}])
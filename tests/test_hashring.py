@@ -0,0 +1,37 @@
+from unittest import TestCase
+
+from mongo_pool.hashring import HashRing
+
+
+class HashRingTestCase(TestCase):
+    def setUp(self):
+        self.names = ['tenant_%d' % i for i in range(2000)]
+
+    def ring(self, weights, vnodes=160):
+        return HashRing([(label, weight, label)
+                         for label, weight in sorted(weights.items())],
+                        vnodes)
+
+    def test_placement_is_deterministic(self):
+        first = self.ring({'a': 1, 'b': 1, 'c': 1})
+        second = HashRing([('c', 1, 'c'), ('a', 1, 'a'), ('b', 1, 'b')])
+        self.assertEqual([first.get(name) for name in self.names],
+                         [second.get(name) for name in self.names])
+
+    def test_adding_a_member_only_moves_names_to_it(self):
+        before = self.ring({'a': 1, 'b': 1, 'c': 1})
+        after = self.ring({'a': 1, 'b': 1, 'c': 1, 'd': 1})
+        moved = before.moves(after, self.names)
+
+        self.assertTrue(all(new == 'd' for _, new in moved.values()))
+        # About a quarter of the names move.
+        self.assertTrue(300 < len(moved) < 700)
+
+    def test_weights(self):
+        ring = self.ring({'a': 1, 'b': 3})
+        placed = [ring.get(name) for name in self.names]
+        self.assertTrue(1300 < placed.count('b') < 1700)
+
+    def test_needs_members(self):
+        with self.assertRaises(ValueError):
+            HashRing([])
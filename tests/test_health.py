@@ -0,0 +1,119 @@
+import threading
+from unittest import TestCase
+
+from mock import MagicMock, patch
+from pymongo.errors import AutoReconnect, ConnectionFailure
+
+from mongo_pool import MongoPool
+from mongo_pool.health import CircuitBreaker, ClusterUnavailable
+
+
+class CircuitBreakerTestCase(TestCase):
+    @patch('mongo_pool.health._clock')
+    def test_transitions(self, clock):
+        clock.return_value = 0
+        breaker = CircuitBreaker(failure_threshold=2, reset_timeout=10)
+        breaker.record_failure(AutoReconnect())
+        self.assertTrue(breaker.allow())
+        breaker.record_failure(AutoReconnect())
+        self.assertEqual(breaker.state, 'open')
+        self.assertFalse(breaker.allow())
+        self.assertFalse(breaker.should_check())
+
+        # A failed trial opens the breaker again.
+        clock.return_value = 10
+        self.assertTrue(breaker.should_check())
+        self.assertEqual(breaker.state, 'half_open')
+        self.assertFalse(breaker.allow())
+        breaker.record_failure(AutoReconnect())
+        self.assertEqual(breaker.state, 'open')
+
+        clock.return_value = 20
+        self.assertTrue(breaker.should_check())
+        breaker.record_success()
+        self.assertEqual(breaker.summary()['state'], 'closed')
+        self.assertEqual(breaker.failures, 0)
+
+
+class HealthChecksTestCase(TestCase):
+    def setUp(self):
+        self.clients = {27017: MagicMock(), 27018: MagicMock()}
+        config = [{'label1': {'host': '127.0.0.1', 'port': 27017,
+                              'dbpath': 'db1'}},
+                  {'label2': {'host': '127.0.0.1', 'port': 27018,
+                              'dbpath': 'db2'}},
+                  {'label3': {'host': '127.0.0.1', 'port': 27019,
+                              'dbpath': 'db3'}}]
+        self.pool = MongoPool(
+            config, connection_class=lambda **kw: self.clients[kw['port']])
+        self.addCleanup(self.pool.stop_health_checks)
+
+    def test_open_breaker_fails_fast(self):
+        self.clients[27018].admin.command.side_effect = AutoReconnect('down')
+        self.pool.db1
+        self.pool.db2
+        # Long interval, checks are run by hand.
+        self.pool.start_health_checks(interval=3600, failure_threshold=2)
+        monitor = self.pool._health
+        monitor.check()
+        self.pool.db2
+        monitor.check()
+
+        with self.assertRaises(ClusterUnavailable):
+            self.pool.db2
+        with self.assertRaises(ConnectionFailure):
+            self.pool.get_cluster('label2')
+        self.pool.db1
+
+        health = self.pool.health()
+        self.assertEqual(health['label1']['state'], 'closed')
+        self.assertEqual(health['label2']['state'], 'open')
+        self.assertEqual(health['label2']['failures'], 2)
+        # Clusters without a Client are not checked.
+        self.assertNotIn('label3', health)
+
+        self.pool.stop_health_checks()
+        self.pool.db2
+        self.assertEqual(self.pool.health(), {})
+
+    @patch('mongo_pool.health._clock')
+    def test_open_breaker_closes_after_the_client_was_released(self, clock):
+        clock.return_value = 0
+        self.clients[27018].admin.command.side_effect = AutoReconnect('down')
+        self.pool.db2
+        self.pool.start_health_checks(interval=3600, failure_threshold=2,
+                                      reset_timeout=10)
+        monitor = self.pool._health
+        monitor.check()
+        monitor.check()
+        self.assertEqual(self.pool.health()['label2']['state'], 'open')
+
+        self.pool.set_timeout(1234)
+        self.assertIsNone(self.pool._clusters[1].get('connection'))
+        self.clients[27018].admin.command.side_effect = None
+        clock.return_value = 10
+        for _ in range(3):
+            monitor.check()
+        self.assertEqual(self.pool.health()['label2']['state'], 'closed')
+        self.pool.db2
+
+    def test_slow_pings_count_as_failures(self):
+        release = threading.Event()
+        self.clients[27017].admin.command.side_effect = (
+            lambda command: release.wait(5))
+        self.pool.db1
+        self.pool.start_health_checks(interval=3600, ping_timeout=0.05,
+                                      failure_threshold=1)
+        try:
+            self.pool._health.check()
+            self.assertEqual(self.pool.health()['label1']['state'], 'open')
+        finally:
+            release.set()
+
+    def test_background_checks(self):
+        pinged = threading.Event()
+        self.clients[27017].admin.command.side_effect = (
+            lambda command: pinged.set())
+        self.pool.db1
+        self.pool.start_health_checks(interval=0.01)
+        self.assertTrue(pinged.wait(5))
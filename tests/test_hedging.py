@@ -0,0 +1,159 @@
+import threading
+from unittest import TestCase
+
+from mock import MagicMock, patch
+from pymongo.errors import AutoReconnect
+import six
+
+from mongo_pool import MongoPool
+from mongo_pool.hedging import AUTO, AUTO_DEFAULT_DELAY_MS, Hedger
+
+
+class HedgerTestCase(TestCase):
+    def setUp(self):
+        self.hedger = Hedger(workers=4)
+        self.release = threading.Event()
+        self.addCleanup(self.release.set)
+
+    def slow(self, result):
+        def read():
+            self.release.wait(5)
+            return result
+        return read
+
+    def test_fast_reads_are_not_hedged(self):
+        hedge = MagicMock()
+        self.assertEqual(self.hedger.read('label', lambda: 1, hedge, 1000), 1)
+        hedge.assert_not_called()
+        self.assertEqual(self.hedger.summary()['label']['reads'], 1)
+        self.assertEqual(self.hedger.summary()['label']['hedged'], 0)
+
+    def test_slow_reads_are_hedged(self):
+        self.assertEqual(
+            self.hedger.read('label', self.slow(1), lambda: 2, 10), 2)
+        summary = self.hedger.summary()['label']
+        self.assertEqual((summary['hedged'], summary['won']), (1, 1))
+
+    def test_failed_reads_are_hedged_right_away(self):
+        def fail():
+            raise AutoReconnect('first')
+        self.assertEqual(self.hedger.read('label', fail, lambda: 2, 5000), 2)
+
+    def test_raises_first_error_when_both_fail(self):
+        def fail(message):
+            def read():
+                raise AutoReconnect(message)
+            return read
+        with six.assertRaisesRegex(self, AutoReconnect, 'first'):
+            self.hedger.read('label', fail('first'), fail('hedge'), 0)
+
+    def test_auto_delay(self):
+        self.assertEqual(self.hedger.delay('label', AUTO),
+                         AUTO_DEFAULT_DELAY_MS / 1000.0)
+        latency = self.hedger.stats('label').latency
+        for value in range(1, 101):
+            latency.record(value)
+        self.assertAlmostEqual(self.hedger.delay('label', AUTO), 0.095,
+                               delta=0.01)
+
+
+class HedgedReadsTestCase(TestCase):
+    def setUp(self):
+        self.release = threading.Event()
+        self.addCleanup(self.release.set)
+        self.clients = {}
+
+        def connection_class(**kwargs):
+            client = MagicMock()
+            client.secondaries = set([('h2', 27017), ('h1', 27017)])
+            client.primary = ('h0', 27017)
+            if kwargs['host'] == 'h1':
+                def find_one(*args, **kwargs):
+                    self.release.wait(5)
+                    return {'member': 'h1'}
+                client.__getitem__.return_value.__getitem__.return_value.\
+                    find_one.side_effect = find_one
+            else:
+                client.__getitem__.return_value.__getitem__.return_value.\
+                    find_one.return_value = {'member': kwargs['host']}
+            self.clients[kwargs['host']] = (kwargs, client)
+            return client
+
+        config = [{'label1': {'host': 'h0', 'port': 27017, 'dbpath': 'db1',
+                              'replicaSet': 'rs0',
+                              'read_preference': 'secondary',
+                              'hedge_delay_ms': 10}},
+                  {'label2': {'host': 'h3', 'port': 27017, 'dbpath': 'db2',
+                              'replicaSet': 'rs1',
+                              'read_preference': 'secondary'}}]
+        self.pool = MongoPool(config, connection_class=connection_class)
+        shuffle = patch('mongo_pool.mongo_pool.random.shuffle',
+                        side_effect=lambda members: members.sort())
+        shuffle.start()
+        self.addCleanup(shuffle.stop)
+
+    def test_hedged_find_one(self):
+        self.assertEqual(self.pool.hedged_find_one('db1', 'tenants', {'a': 1}),
+                         {'member': 'h2'})
+        stats = self.pool.stats()['hedging']['label1']
+        self.assertEqual((stats['reads'], stats['hedged'], stats['won']),
+                         (1, 1, 1))
+
+        kwargs, _ = self.clients['h1']
+        self.assertEqual(kwargs['port'], 27017)
+        self.assertNotIn('replicaSet', kwargs)
+        self.assertTrue(kwargs['directConnection'])
+        self.assertEqual(set(self.clients), set(['h0', 'h1', 'h2']))
+
+    def test_members_follow_the_read_preference(self):
+        cluster = self.pool._get_cluster_config('label1')
+        pool = self.pool
+        cluster['params']['read_preference'] = 'PRIMARY_PREFERRED'
+        self.assertEqual(pool._hedge_members(cluster),
+                         [('h0', 27017), ('h1', 27017), ('h2', 27017)])
+        self.assertEqual(pool.hedged_find_one('db1', 'tenants'),
+                         {'member': 'h0'})
+
+        cluster['params']['read_preference'] = 'SECONDARY_PREFERRED'
+        self.assertEqual(pool._hedge_members(cluster),
+                         [('h1', 27017), ('h2', 27017), ('h0', 27017)])
+        cluster['connection'].secondaries = set([('h2', 27017)])
+        self.assertEqual(pool._hedge_members(cluster),
+                         [('h2', 27017), ('h0', 27017)])
+
+        cluster['params']['read_preference'] = 'SECONDARY'
+        self.assertEqual(pool._hedge_members(cluster), [('h2', 27017)])
+
+    def test_member_clients_are_released(self):
+        self.pool.hedged_find_one('db1', 'tenants')
+        self.pool._disconnect()
+        for _, client in self.clients.values():
+            client.close.assert_called_once_with()
+
+    def test_reads_are_not_hedged_without_delay(self):
+        self.pool.hedged_find_one('db2', 'tenants')
+        self.assertEqual(list(self.clients), ['h3'])
+        self.assertNotIn('hedging', self.pool.stats())
+
+        # Unless a delay is given per call.
+        self.pool.hedged_find('db2', 'tenants', delay_ms=AUTO)
+        self.assertEqual(self.pool.stats()['hedging']['label2']['reads'], 1)
+
+    def test_primary_reads_are_not_hedged(self):
+        cluster = self.pool._get_cluster_config('label1')
+        cluster['params']['read_preference'] = 'PRIMARY'
+        self.pool.hedged_find_one('db1', 'tenants')
+        self.assertEqual(list(self.clients), ['h0'])
+
+    def test_raises_exception_for_invalid_hedge_delay(self):
+        config = [{'label': {'host': 'h0', 'port': 27017, 'dbpath': 'db',
+                             'replicaSet': 'rs0', 'hedge_delay_ms': 'fast'}}]
+        with self.assertRaises(TypeError):
+            MongoPool(config)
+        config[0]['label']['hedge_delay_ms'] = -1
+        with self.assertRaises(ValueError):
+            MongoPool(config)
+        config[0]['label']['hedge_delay_ms'] = 10
+        del config[0]['label']['replicaSet']
+        with self.assertRaises(ValueError):
+            MongoPool(config)
@@ -0,0 +1,78 @@
+from unittest import TestCase
+
+from mock import MagicMock, patch
+import pymongo
+
+from mongo_pool import MongoPool
+from mongo_pool.instrumentation import Histogram, Instrumentation
+
+
+class HistogramTestCase(TestCase):
+    def test_quantiles(self):
+        histogram = Histogram()
+        self.assertIsNone(histogram.quantile(0.5))
+        for value in range(1, 101):
+            histogram.record(value)
+
+        summary = histogram.summary()
+        self.assertEqual(summary['count'], 100)
+        self.assertEqual(summary['max'], 100)
+        self.assertAlmostEqual(summary['mean'], 50.5)
+        self.assertTrue(50 <= summary['p50'] <= 55)
+        self.assertTrue(99 <= summary['p99'] <= 100)
+
+
+class InstrumentationTestCase(TestCase):
+    def setUp(self):
+        self.config = [{'label1': {'host': '127.0.0.1', 'port': 27017,
+                                   'dbpath': 'db1'}}]
+
+    def test_listeners_record_per_label(self):
+        hook = MagicMock()
+        instrumentation = Instrumentation(hooks=[hook])
+        command, heartbeat, pool = instrumentation.listeners('label1')
+
+        command.succeeded(MagicMock(duration_micros=2000))
+        command.failed(MagicMock(duration_micros=4000))
+        heartbeat.failed(MagicMock())
+        pool.connection_created(MagicMock())
+        pool.connection_check_out_started(MagicMock())
+        pool.connection_checked_out(MagicMock())
+        pool.connection_check_out_failed(MagicMock())
+
+        stats = instrumentation.summary()['clusters']['label1']
+        self.assertEqual(stats['commands']['count'], 2)
+        self.assertEqual(stats['commands']['max'], 4)
+        self.assertEqual(stats['command_errors'], 1)
+        self.assertEqual(stats['heartbeat_errors'], 1)
+        self.assertEqual(stats['connections'], 1)
+        self.assertEqual(stats['checkout_wait']['count'], 1)
+        self.assertEqual(stats['checkout_errors'], 1)
+        hook.assert_any_call('label1', 'commands', 2.0)
+
+    def test_listeners_are_accepted_by_pymongo(self):
+        client = pymongo.MongoClient(
+            connect=False, event_listeners=Instrumentation().listeners('l'))
+        client.close()
+
+    @patch('mongo_pool.mongo_pool.pymongo.MongoClient')
+    def test_pool_stats(self, mock_MongoClient):
+        pool = MongoPool(self.config, instrumentation=True)
+        pool.db1
+        pool.db1
+
+        listeners = mock_MongoClient.call_args[1]['event_listeners']
+        listeners[0].succeeded(MagicMock(duration_micros=1000))
+        stats = pool.stats()
+        self.assertEqual(stats['databases']['hits'], 1)
+        self.assertEqual(stats['routing']['misses'], 1)
+        self.assertEqual(stats['routing']['count'], 1)
+        self.assertEqual(stats['clients'], 1)
+        self.assertEqual(stats['clusters']['label1']['commands']['count'], 1)
+
+    @patch('mongo_pool.mongo_pool.pymongo.MongoClient')
+    def test_no_listeners_by_default(self, mock_MongoClient):
+        pool = MongoPool(self.config)
+        pool.db1
+        self.assertNotIn('event_listeners', mock_MongoClient.call_args[1])
+        self.assertNotIn('clusters', pool.stats())
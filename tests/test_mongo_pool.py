@@ -1,6 +1,10 @@
 from copy import deepcopy
+import subprocess
+import sys
+import threading
+import time
 
-from mock import patch, call
+from mock import MagicMock, patch, call
 from unittest import TestCase
 import pymongo
 from pymongo.read_preferences import Primary
@@ -278,3 +282,384 @@ class MongoPoolTestCase(TestCase):
 
         self.assertFalse(mock_MongoClient.called, "New connections are "
                          "created for each database access")
+
+    @patch('mongo_pool.mongo_pool.pymongo.MongoClient')
+    def test_databases_are_cached(self, mock_MongoClient):
+        pool = MongoPool(self.config)
+        mock = mock_MongoClient()
+        self.assertIs(pool.db1, pool['db1'])
+        mock.__getitem__.assert_called_once_with('db1')
+        self.assertEqual(pool.cache_stats()['hits'], 1)
+
+    @patch('mongo_pool.mongo_pool.pymongo.MongoClient')
+    def test_database_cache_is_bounded(self, mock_MongoClient):
+        pool = MongoPool(self.config, database_cache_size=2)
+        pool.dbpattern1
+        pool.dbpattern2
+        pool.dbpattern3
+
+        stats = pool.cache_stats()
+        self.assertEqual(stats['size'], 2)
+        self.assertEqual(stats['evictions'], 1)
+        # Evicted databases are transparently recreated.
+        pool.dbpattern1
+        self.assertEqual(pool.cache_stats()['misses'], 4)
+
+    def test_concurrent_first_access_creates_one_client(self):
+        """
+        Ensure that hundreds of threads racing on the first access to the
+        same clusters build exactly one Client per cluster
+        """
+        def slow_client(**kwargs):
+            # Widen the window in which threads can race.
+            time.sleep(0.01)
+            return MagicMock()
+        connection_class = MagicMock(side_effect=slow_client)
+        pool = MongoPool(self.config, connection_class=connection_class)
+
+        start = threading.Event()
+        errors = []
+        names = ['db1', 'dbpattern1', 'dbpattern2', 'arraydb1']
+
+        def worker(index):
+            start.wait()
+            try:
+                pool[names[index % len(names)]]
+                pool.get_cluster('label1')
+            except Exception as e:
+                errors.append(e)
+
+        threads = [threading.Thread(target=worker, args=(i,))
+                   for i in range(300)]
+        for thread in threads:
+            thread.start()
+        start.set()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(errors, [])
+        ports = sorted(c[1]['port'] for c in connection_class.call_args_list)
+        self.assertEqual(ports, [27017, 27020, 27021])
+
+    @patch('mongo_pool.mongo_pool.os.getpid')
+    @patch('mongo_pool.mongo_pool.pymongo.MongoClient')
+    def test_recreates_clients_after_fork(self, mock_MongoClient, getpid):
+        """
+        Ensure that a forked process drops the Clients and databases inherited
+        from its parent, without closing them, and builds its own
+        """
+        getpid.return_value = 100
+        pool = MongoPool(self.config)
+        inherited = pool.get_cluster('label1')
+        pool.db1
+        mock_MongoClient.reset_mock()
+
+        getpid.return_value = 101
+        pool.db1
+        mock_MongoClient.assert_called_once_with(**self.call_arguments)
+        self.assertFalse(inherited.close.called)
+        self.assertEqual(pool.cache_stats()['hits'], 0)
+
+        # The child now owns its Clients.
+        mock_MongoClient.reset_mock()
+        pool.get_cluster('label1')
+        self.assertFalse(mock_MongoClient.called)
+
+    @patch('mongo_pool.mongo_pool.os.register_at_fork', create=True)
+    def test_registers_fork_hook(self, register_at_fork):
+        MongoPool(self.config, fork_hooks=True)
+        self.assertTrue(register_at_fork.called)
+        MongoPool(self.config)
+        self.assertEqual(register_at_fork.call_count, 1)
+
+    @patch('mongo_pool.mongo_pool.pymongo.MongoClient')
+    def test_warmup_connects_to_all_clusters(self, mock_MongoClient):
+        pool = MongoPool(self.config)
+        results = pool.warmup(parallelism=3)
+
+        self.assertEqual(sorted(results), ['label1', 'label3', 'label4',
+                                           'label5', 'label6'])
+        for result in results.values():
+            self.assertIsNone(result['error'])
+            self.assertGreaterEqual(result['seconds'], 0)
+        self.assertEqual(mock_MongoClient.call_count, 5)
+        mock_MongoClient().admin.command.assert_called_with('ping')
+
+    @patch('mongo_pool.mongo_pool.pymongo.MongoClient')
+    def test_warmup_populates_database_cache(self, mock_MongoClient):
+        pool = MongoPool(self.config)
+        results = pool.warmup(labels=['label1'], dbnames=['dbpattern1'],
+                              ping=False)
+
+        self.assertEqual(sorted(results), ['label1', 'label5'])
+        self.assertFalse(mock_MongoClient().admin.command.called)
+        mock_MongoClient.reset_mock()
+        pool.dbpattern1
+        self.assertFalse(mock_MongoClient.called)
+        self.assertEqual(pool.cache_stats()['hits'], 1)
+
+    def test_warmup_reports_errors_and_timeouts(self):
+        release = threading.Event()
+
+        def connection_class(**kwargs):
+            if kwargs['port'] == 27017:
+                raise ValueError('unreachable')
+            if kwargs['port'] == 27018:
+                release.wait(5)
+            return MagicMock()
+
+        pool = MongoPool(self.config, connection_class=connection_class)
+        try:
+            results = pool.warmup(labels=['label1', 'label3', 'label4'],
+                                  timeout=0.2)
+        finally:
+            release.set()
+
+        self.assertIsInstance(results['label1']['error'], ValueError)
+        self.assertIsNotNone(results['label3']['error'])
+        self.assertIsNone(results['label3']['seconds'])
+        self.assertIsNone(results['label4']['error'])
+
+    @patch('mongo_pool.mongo_pool.pymongo.MongoClient')
+    def test_clusters_with_same_endpoint_share_a_client(self,
+                                                        mock_MongoClient):
+        config = [{'label1': {'host': ['127.0.0.1', '127.0.0.2'],
+                              'port': 27017, 'dbpath': 'db1'}},
+                  {'label2': {'host': ['127.0.0.2', '127.0.0.1'],
+                              'port': 27017, 'dbpath': 'db2'}},
+                  {'label3': {'host': ['127.0.0.2', '127.0.0.1'],
+                              'port': 27017, 'dbpath': 'db3',
+                              'read_preference': 'secondary'}}]
+        pool = MongoPool(config)
+        pool.db1
+        pool.db2
+        self.assertEqual(mock_MongoClient.call_count, 1)
+        pool.db3
+        self.assertEqual(mock_MongoClient.call_count, 2)
+
+        pool._disconnect()
+        # Both Clients are closed exactly once.
+        self.assertEqual(mock_MongoClient.return_value.close.call_count, 2)
+
+    def test_raises_exception_for_invalid_client_options(self):
+        config = [{'label': {'host': '127.0.0.1', 'port': 27017,
+                             'dbpath': '.*'}}]
+        for name, value, error in [('maxPoolSize', 'a', TypeError),
+                                   ('maxPoolSize', True, TypeError),
+                                   ('minPoolSize', -1, ValueError),
+                                   ('compressors', 1, TypeError),
+                                   ('compressors', ['lz4'], ValueError)]:
+            cfg = deepcopy(config)
+            cfg[0]['label'][name] = value
+            with self.assertRaises(error):
+                MongoPool(cfg)
+            with self.assertRaises(error):
+                MongoPool(config, client_options={name: value})
+
+        config[0]['label'].update({'minPoolSize': 10, 'maxPoolSize': 5})
+        with self.assertRaises(ValueError):
+            MongoPool(config)
+
+    @patch('mongo_pool.mongo_pool.pymongo.MongoClient')
+    def test_passes_client_options(self, mock_MongoClient):
+        """
+        Ensure that pool-wide client options are passed to every Client and
+        that clusters can override them
+        """
+        self.config[0]['label1'].update({'maxPoolSize': 200,
+                                         'compressors': ['zstd', 'zlib']})
+        pool = MongoPool(self.config,
+                         client_options={'maxPoolSize': 10,
+                                         'connectTimeoutMS': 500})
+        pool.db1
+        self.call_arguments.update({'maxPoolSize': 200,
+                                    'connectTimeoutMS': 500,
+                                    'compressors': 'zstd,zlib'})
+        mock_MongoClient.assert_called_with(**self.call_arguments)
+
+        pool.dbp
+        self.call_arguments.update({'port': 27018, 'maxPoolSize': 10})
+        del self.call_arguments['compressors']
+        mock_MongoClient.assert_called_with(**self.call_arguments)
+
+    @patch('mongo_pool.mongo_pool.pymongo.MongoClient')
+    def test_with_timeout_keeps_existing_clients(self, mock_MongoClient):
+        pool = MongoPool(self.config)
+        default = pool.db1
+        mock_MongoClient.reset_mock()
+
+        pool.with_timeout(5).db1
+        self.call_arguments['socketTimeoutMS'] = 5
+        mock_MongoClient.assert_called_once_with(**self.call_arguments)
+        self.assertFalse(mock_MongoClient.return_value.close.called)
+
+        # Both the default and the variant Client are reused.
+        mock_MongoClient.reset_mock()
+        pool.with_timeout(5)['db1']
+        pool.with_timeout(5).get_cluster('label1')
+        self.assertIs(pool.db1, default)
+        self.assertFalse(mock_MongoClient.called)
+
+    @patch('mongo_pool.mongo_pool.pymongo.MongoClient')
+    def test_timeout_context_manager(self, mock_MongoClient):
+        pool = MongoPool(self.config)
+        with pool.timeout(5):
+            pool.db1
+            with pool.timeout(None):
+                pool.dbp
+        pool.arraydb1
+
+        timeouts = [(c[1]['port'], c[1]['socketTimeoutMS'])
+                    for c in mock_MongoClient.call_args_list]
+        self.assertEqual(timeouts, [(27017, 5), (27018, None), (27021, None)])
+
+    def test_timeout_variants_are_bounded(self):
+        connection_class = MagicMock(side_effect=lambda **kw: MagicMock())
+        pool = MongoPool(self.config, connection_class=connection_class,
+                         max_timeout_variants=2)
+        first = pool.with_timeout(1).get_cluster('label1')
+        pool.with_timeout(2).db1
+        pool.with_timeout(3).db1
+
+        first.close.assert_called_once_with()
+        self.assertEqual(len(pool._timeout_variants), 2)
+        self.assertNotIn(('db1', 1), pool._databases)
+        # An evicted variant is transparently recreated.
+        self.assertIsNot(pool.with_timeout(1).get_cluster('label1'), first)
+
+        pool._disconnect()
+        self.assertEqual(len(pool._timeout_variants), 0)
+        self.assertEqual(len(pool._clients), 0)
+
+    def test_reload_reconnects_only_changed_clusters(self):
+        connection_class = MagicMock(side_effect=lambda **kw: MagicMock())
+        pool = MongoPool(self.config, connection_class=connection_class)
+        db1 = pool.db1
+        dbp = pool.dbp
+        label1 = pool.get_cluster('label1')
+        label3 = pool.get_cluster('label3')
+        label5 = pool.get_cluster('label5')
+
+        config = deepcopy(self.config)
+        # label1 moves dbpath, label3 changes port, label4 is removed and
+        # label7 is added.
+        config[0]['label1']['dbpath'] = ['db1', 'db2']
+        config[1]['label3']['port'] = 27030
+        del config[2]
+        config.append({'label7': {'host': '127.0.0.1', 'port': 27040,
+                                  'dbpath': 'new.*'}})
+        summary = pool.reload(config)
+
+        self.assertEqual(summary, {'added': ['label7'],
+                                   'removed': ['label4'],
+                                   'changed': ['label3'],
+                                   'unchanged': ['label1', 'label5',
+                                                 'label6']})
+        self.assertIs(pool.get_cluster('label1'), label1)
+        self.assertIs(pool.get_cluster('label5'), label5)
+        self.assertFalse(label1.close.called)
+        label3.close.assert_called_once_with()
+
+        # Only the databases whose cluster changed are dropped.
+        self.assertIs(pool.db1, db1)
+        self.assertIsNot(pool.dbp, dbp)
+        self.assertEqual(connection_class.call_args[1]['port'], 27030)
+        pool.db2
+        pool.newdb
+        with self.assertRaises(AttributeError):
+            pool.get_cluster('label4')
+
+    def test_reload_validates_config(self):
+        pool = MongoPool(self.config)
+        with self.assertRaises(TypeError):
+            pool.reload([{'label': {'host': '127.0.0.1'}}])
+        self.assertEqual(pool._match_dbname('db1')['label'], 'label1')
+
+    def sharded_config(self, shards):
+        config = deepcopy(self.config)
+        config.insert(3, {'tenants': {'dbpath': r'tenant_\d+',
+                                      'shards': shards}})
+        return config
+
+    @patch('mongo_pool.mongo_pool.pymongo.MongoClient')
+    def test_shard_groups_spread_databases(self, mock_MongoClient):
+        pool = MongoPool(self.sharded_config(['label3', 'label4', 'label6']))
+        labels = set(pool._match_dbname('tenant_%d' % i)['label']
+                     for i in range(100))
+        self.assertEqual(labels, set(['label3', 'label4', 'label6']))
+        # Placement is stable and other entries keep matching in order.
+        self.assertIs(pool._match_dbname('tenant_7'),
+                      pool._match_dbname('tenant_7'))
+        self.assertEqual(pool._match_dbname('dbpattern1')['label'], 'label5')
+
+        pool.tenant_1
+        cluster = pool._match_dbname('tenant_1')
+        self.call_arguments['port'] = cluster['params']['port']
+        mock_MongoClient.assert_called_once_with(**self.call_arguments)
+
+    def test_raises_exception_for_invalid_shards(self):
+        for shards, error in [('label3', TypeError),
+                              ([], ValueError),
+                              ({'label3': 0}, ValueError),
+                              ({'label3': 'a'}, TypeError),
+                              (['label3', 'unknown'], ValueError)]:
+            with self.assertRaises(error):
+                MongoPool(self.sharded_config(shards))
+        config = self.sharded_config(['label3'])
+        config[3]['tenants']['vnodes'] = 0
+        with self.assertRaises(ValueError):
+            MongoPool(config)
+
+    def test_shard_moves(self):
+        pool = MongoPool(self.sharded_config({'label3': 1, 'label4': 1}))
+        dbnames = ['tenant_%d' % i for i in range(200)]
+        moves = pool.shard_moves('tenants', ['label3', 'label4', 'label6'],
+                                 dbnames=dbnames)
+
+        self.assertTrue(moves)
+        for dbname, (old, new) in moves.items():
+            self.assertEqual(pool._match_dbname(dbname)['label'], old)
+            self.assertEqual(new, 'label6')
+        with self.assertRaises(AttributeError):
+            pool.shard_moves('label1', ['label3'])
+
+    def test_shard_moves_lists_databases(self):
+        clients = {}
+
+        def connection_class(**kwargs):
+            client = MagicMock()
+            client.list_database_names.return_value = [
+                'tenant_%d' % i for i in range(50)] + ['dbp']
+            clients[kwargs['port']] = client
+            return client
+
+        pool = MongoPool(self.sharded_config(['label3', 'label4']),
+                         connection_class=connection_class)
+        moves = pool.shard_moves('tenants', ['label3', 'label4', 'label6'])
+        self.assertTrue(moves)
+        self.assertNotIn('dbp', moves)
+        # Only the current shards are listed.
+        self.assertEqual(sorted(clients), [27018, 27019])
+
+    def test_import_and_construction_do_not_import_pymongo(self):
+        script = ('import sys\n'
+                  'from mongo_pool import MongoPool\n'
+                  'pool = MongoPool(%r)\n'
+                  'pool._match_dbname("db1")\n'
+                  'print(sorted(name for name in sys.modules\n'
+                  '             if name.split(".")[0] in\n'
+                  '             ("pymongo", "pkg_resources")))' % self.config)
+        output = subprocess.check_output([sys.executable, '-c', script])
+        self.assertEqual(output.decode('ascii').strip(), '[]')
+
+    @patch('mongo_pool.mongo_pool.pymongo.MongoClient')
+    def test_read_preference_is_converted_when_connecting(
+            self, mock_MongoClient):
+        self.config[0]['label1']['read_preference'] = 'secondary'
+        pool = MongoPool(self.config)
+        self.assertEqual(pool._clusters[0]['params']['read_preference'],
+                         'SECONDARY')
+        pool.db1
+        _, kwargs = mock_MongoClient.call_args
+        self.assertEqual(kwargs['read_preference'],
+                         pymongo.ReadPreference.SECONDARY)
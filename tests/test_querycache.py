@@ -0,0 +1,178 @@
+from unittest import TestCase
+
+from mock import MagicMock, patch
+
+from mongo_pool import MongoPool
+from mongo_pool.querycache import CachedCollection
+
+
+class FakeClient(object):
+    """Hands out the same MagicMock collections for every database."""
+
+    def __init__(self, **kwargs):
+        self.databases = {}
+
+    def __getitem__(self, dbname):
+        database = self.databases.get(dbname)
+        if database is None:
+            database = self.databases[dbname] = MagicMock(name=dbname)
+            database.name = dbname
+            database.__getitem__.side_effect = (
+                lambda name, database=database: getattr(database, name))
+            database.get_collection.side_effect = (
+                lambda name, *args, **kwargs: getattr(database, name))
+            database.settings.find_one.side_effect = (
+                lambda filter=None, *args, **kwargs: {'_id': 1, 'tags': []})
+        return database
+
+
+class QueryCacheTestCase(TestCase):
+    def setUp(self):
+        self.config = [{'label1': {'host': '127.0.0.1', 'port': 27017,
+                                   'dbpath': ['tenants', 'other']}}]
+        self.client = FakeClient()
+        self.pool = self.make_pool()
+
+    def make_pool(self, **kwargs):
+        kwargs.setdefault('query_cache', [{'dbpath': 'tenants',
+                                           'collections': ['settings'],
+                                           'ttl': 60}])
+        return MongoPool(self.config, connection_class=lambda **kw: self.client,
+                         **kwargs)
+
+    def find_one(self):
+        return self.client['tenants'].settings.find_one
+
+    def test_repeated_reads_are_cached(self):
+        settings = self.pool.tenants.settings
+        self.assertIsInstance(settings, CachedCollection)
+        self.assertEqual(settings.find_one({'_id': 1}), {'_id': 1, 'tags': []})
+        self.assertEqual(settings.find_one({'_id': 1}), {'_id': 1, 'tags': []})
+        self.assertEqual(self.find_one().call_count, 1)
+        stats = self.pool.stats()['query_cache']
+        self.assertEqual((stats['hits'], stats['misses'], stats['size']),
+                         (1, 1, 1))
+
+    def test_queries_are_normalized(self):
+        settings = self.pool.tenants['settings']
+        settings.find_one({'a': 1, 'b': 2})
+        settings.find_one({'b': 2, 'a': 1})
+        settings.find_one(filter={'b': 2, 'a': 1})
+        self.assertEqual(self.find_one().call_count, 2)
+        # Values of different types are different queries.
+        settings.find_one({'a': True, 'b': 2})
+        settings.find_one({'a': 1, 'b': 2}, {'tags': 1})
+        self.assertEqual(self.find_one().call_count, 4)
+
+    def test_uncacheable_reads_go_through(self):
+        settings = self.pool.tenants.settings
+        settings.find_one({'_id': object()})
+        settings.find_one({'_id': 1}, session=MagicMock())
+        settings.find_one({'_id': 1}, session=MagicMock())
+        self.assertEqual(self.find_one().call_count, 3)
+        self.assertEqual(self.pool.stats()['query_cache']['size'], 0)
+
+    def test_results_are_copied(self):
+        settings = self.pool.tenants.settings
+        settings.find_one({'_id': 1})['tags'].append('changed')
+        self.assertEqual(settings.find_one({'_id': 1})['tags'], [])
+
+    def test_missing_documents_are_cached(self):
+        self.find_one().side_effect = None
+        self.find_one().return_value = None
+        settings = self.pool.tenants.settings
+        self.assertIsNone(settings.find_one({'_id': 2}))
+        self.assertIsNone(settings.find_one({'_id': 2}))
+        self.assertEqual(self.find_one().call_count, 1)
+
+    def test_writes_invalidate(self):
+        settings = self.pool.tenants.settings
+        settings.find_one({'_id': 1})
+        settings.update_one({'_id': 1}, {'$set': {'a': 1}})
+        settings.find_one({'_id': 1})
+        self.assertEqual(self.find_one().call_count, 2)
+        self.assertEqual(self.pool.stats()['query_cache']['invalidations'], 1)
+
+        self.pool.tenants.drop_collection('settings')
+        settings.find_one({'_id': 1})
+        self.pool.invalidate_cached_queries('tenants', 'settings')
+        settings.find_one({'_id': 1})
+        self.assertEqual(self.find_one().call_count, 4)
+
+    def test_collections_with_options(self):
+        database = self.pool.tenants
+        raw = self.client['tenants']
+        for target in (raw, raw.settings, raw.settings.with_options()):
+            target.read_preference = 'primary'
+            target.read_concern = target.codec_options = None
+        settings = database.get_collection('settings', write_concern=None)
+        self.assertIsInstance(settings, CachedCollection)
+        settings.find_one({'_id': 1})
+        database.settings.with_options(write_concern=None).find_one({'_id': 1})
+        self.assertEqual(self.find_one().call_count, 1)
+        self.assertNotIsInstance(database.get_collection('events'),
+                                 CachedCollection)
+
+        # Reads with other options are not cached, but writes invalidate.
+        other = MagicMock(read_preference='secondary', read_concern=None,
+                          codec_options=None)
+        other.find_one.return_value = {'_id': 1}
+        raw.settings.with_options.return_value = other
+        secondary = database.settings.with_options(read_preference=None)
+        secondary.find_one({'_id': 1})
+        secondary.find_one({'_id': 1})
+        self.assertEqual(other.find_one.call_count, 2)
+        secondary.update_one({'_id': 1}, {'$set': {'a': 1}})
+        settings.find_one({'_id': 1})
+        self.assertEqual(self.find_one().call_count, 2)
+
+    def test_reads_racing_with_writes_are_not_cached(self):
+        settings = self.pool.tenants.settings
+
+        def find_one(*args, **kwargs):
+            # Another thread writes while the read runs.
+            self.pool.tenants.settings.insert_one({'_id': 2})
+            return {'_id': 1}
+        self.find_one().side_effect = find_one
+        settings.find_one({'_id': 1})
+        self.assertEqual(self.pool.stats()['query_cache']['size'], 0)
+
+    @patch('mongo_pool.cache._clock')
+    def test_results_expire(self, clock):
+        clock.return_value = 100
+        settings = self.pool.tenants.settings
+        settings.find_one({'_id': 1})
+        clock.return_value = 159
+        settings.find_one({'_id': 1})
+        clock.return_value = 161
+        settings.find_one({'_id': 1})
+        self.assertEqual(self.find_one().call_count, 2)
+
+    def test_least_recently_used_results_are_evicted(self):
+        pool = self.make_pool(query_cache_size=1)
+        settings = pool.tenants.settings
+        settings.find_one({'_id': 1})
+        settings.find_one({'_id': 2})
+        settings.find_one({'_id': 1})
+        self.assertEqual(self.find_one().call_count, 3)
+        self.assertEqual(pool.stats()['query_cache']['evictions'], 2)
+
+    def test_other_collections_are_not_wrapped(self):
+        self.assertIs(self.pool.other, self.client['other'])
+        self.assertIs(self.pool.tenants.events,
+                      self.client['tenants'].events)
+        self.assertNotIn('query_cache', self.make_pool(
+            query_cache=None).stats())
+
+    def test_validates_rules(self):
+        for rules, error in (({}, TypeError),
+                             ([{'dbpath': 1, 'collections': ['a'],
+                                'ttl': 1}], TypeError),
+                             ([{'dbpath': 'a', 'collections': 'a',
+                                'ttl': 1}], TypeError),
+                             ([{'dbpath': 'a', 'collections': ['a'],
+                                'ttl': '1'}], TypeError),
+                             ([{'dbpath': 'a', 'collections': ['a'],
+                                'ttl': 0}], ValueError)):
+            with self.assertRaises(error):
+                self.make_pool(query_cache=rules)
@@ -0,0 +1,88 @@
+import time
+from unittest import TestCase
+
+from mock import MagicMock, patch
+
+from mongo_pool import MongoPool
+
+
+class IdleReaperTestCase(TestCase):
+    def setUp(self):
+        self.created = []
+
+        def connection_class(**kwargs):
+            client = MagicMock()
+            self.created.append((kwargs['port'], client))
+            return client
+
+        config = [{'label1': {'host': '127.0.0.1', 'port': 27017,
+                              'dbpath': 'db1'}},
+                  {'label2': {'host': '127.0.0.1', 'port': 27018,
+                              'dbpath': ['db2', 'db3']}}]
+        self.pool = MongoPool(config, connection_class=connection_class)
+        self.addCleanup(self.pool.stop_idle_reaper)
+
+    @patch('mongo_pool.mongo_pool._clock')
+    def test_reap_idle_clients(self, clock):
+        clock.return_value = 100
+        self.pool.db1
+        self.pool.db2
+        clock.return_value = 150
+        self.pool.db3
+        db2_client = self.created[1][1]
+
+        clock.return_value = 200
+        self.assertEqual(self.pool.reap_idle_clients(60), ['label1'])
+        self.created[0][1].close.assert_called_once_with()
+        db2_client.close.assert_not_called()
+        self.assertNotIn('db1', self.pool._databases)
+        self.assertIn('db2', self.pool._databases)
+        self.assertEqual(len(self.pool._clients), 1)
+
+        # Idle clusters connect again on their next use.
+        self.pool.db1
+        self.assertEqual(len(self.created), 3)
+        self.assertEqual(self.pool.reap_idle_clients(60), [])
+
+        # Cached database hits count as uses.
+        clock.return_value = 250
+        self.pool.db2
+        clock.return_value = 300
+        self.assertEqual(self.pool.reap_idle_clients(60), ['label1'])
+
+    @patch('pymongo.version_tuple', (4, 0, 0))
+    @patch('mongo_pool.mongo_pool._clock')
+    def test_pymongo_4_clients_are_not_closed(self, clock):
+        clock.return_value = 100
+        self.pool.db1
+        clock.return_value = 200
+        self.assertEqual(self.pool.reap_idle_clients(60), ['label1'])
+        # Closed pymongo 4 Clients would fail the databases held elsewhere.
+        self.created[0][1].close.assert_not_called()
+        self.assertEqual(len(self.pool._clients), 0)
+        self.pool.db1
+        self.assertEqual(len(self.created), 2)
+
+    @patch('mongo_pool.mongo_pool._clock')
+    def test_reap_timeout_variants(self, clock):
+        clock.return_value = 100
+        self.pool.with_timeout(60000).db1
+        self.assertEqual(len(self.pool._clients), 1)
+
+        clock.return_value = 200
+        self.assertEqual(self.pool.reap_idle_clients(60), ['label1'])
+        self.assertEqual(len(self.pool._clients), 0)
+        self.assertEqual(len(self.pool._databases), 0)
+
+    def test_background_reaper(self):
+        self.pool.db1
+        self.pool.start_idle_reaper(idle_timeout=0.01)
+        deadline = time.time() + 5
+        while self.pool.stats()['reaped'] < 1 and time.time() < deadline:
+            time.sleep(0.01)
+        self.assertEqual(self.pool.stats()['reaped'], 1)
+        self.created[0][1].close.assert_called_once_with()
+
+    def test_invalid_idle_timeout(self):
+        with self.assertRaises(ValueError):
+            self.pool.start_idle_reaper(idle_timeout=0)
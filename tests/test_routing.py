@@ -0,0 +1,77 @@
+from unittest import TestCase
+
+from mongo_pool.routing import Router
+
+
+def cluster(label, pattern, dbpaths):
+    return {'label': label, 'pattern': pattern, 'dbpaths': dbpaths}
+
+
+class RouterTestCase(TestCase):
+    def setUp(self):
+        self.clusters = [cluster('label1', '(db1)$', ['db1']),
+                         cluster('label2', r'(dbpattern\d*)$',
+                                 [r'dbpattern\d*']),
+                         cluster('label3', '(dbpattern12|other)$',
+                                 ['dbpattern12', 'other']),
+                         cluster('label4', '(.*)$', ['.*'])]
+
+    def test_literal_names_use_the_index(self):
+        router = Router(self.clusters)
+        # The index is built by the first match.
+        self.assertIsNone(router._literals)
+        self.assertIs(router.match('other'), self.clusters[2])
+        self.assertIs(router._literals['db1'], self.clusters[0])
+        self.assertIs(router._literals['other'], self.clusters[2])
+
+    def test_literals_respect_first_match_order(self):
+        """
+        Ensure that a literal shadowed by an earlier, more general pattern is
+        routed to the earlier cluster.
+        """
+        router = Router(self.clusters)
+        self.assertIs(router.match('dbpattern12'), self.clusters[1])
+        self.assertIs(router._literals['dbpattern12'], self.clusters[1])
+
+    def test_patterns_are_combined(self):
+        router = Router(self.clusters)
+        self.assertIsNotNone(router._combined)
+        self.assertIs(router.match('dbpattern7'), self.clusters[1])
+        self.assertIs(router.match('anything'), self.clusters[3])
+
+    def test_many_patterns_are_split_into_small_alternations(self):
+        clusters = [cluster('label%d' % index, r'(db%d_\d+)$' % index,
+                            [r'db%d_\d+' % index])
+                    for index in range(120)]
+        clusters.append(cluster('fallback', '(.*)$', ['.*']))
+        router = Router(clusters)
+        # 2 groups per pattern.
+        self.assertEqual(len(router._combined), 7)
+        for combined, _ in router._combined:
+            self.assertLessEqual(combined.groups, 40)
+        self.assertIs(router.match('db0_1'), clusters[0])
+        self.assertIs(router.match('db77_1'), clusters[77])
+        self.assertIs(router.match('db119_1'), clusters[119])
+        self.assertIs(router.match('db120_1'), clusters[120])
+
+    def test_falls_back_for_backreferences(self):
+        clusters = [cluster('label1', '(a)\\1$', ['a\\1']),
+                    cluster('label2', '(b.*)$', ['b.*'])]
+        router = Router(clusters)
+        self.assertIsNone(router._combined)
+        self.assertIs(router.match('aa'), clusters[0])
+        self.assertIs(router.match('bcd'), clusters[1])
+        self.assertIsNone(router.match('c'))
+
+    def test_memoizes_resolved_names(self):
+        router = Router(self.clusters, memo_size=2)
+        router.match('dbpattern1')
+        self.assertIn('dbpattern1', router._memo)
+        router.match('dbpattern2')
+        router.match('dbpattern3')
+        self.assertEqual(len(router._memo), 1)
+
+    def test_does_not_memoize_misses(self):
+        router = Router(self.clusters[:1])
+        self.assertIsNone(router.match('nope'))
+        self.assertNotIn('nope', router._memo)
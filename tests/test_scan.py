@@ -0,0 +1,188 @@
+import numbers
+from unittest import TestCase
+
+import pymongo
+import six
+
+from mongo_pool import MongoPool
+from mongo_pool.scan import partition_filters, split_points
+
+from .fakes import FakeCursor
+
+
+def _comparable(value, bound):
+    # Like MongoDB, ranges only match values of the bound's type.
+    for group in (numbers.Number, six.string_types):
+        if isinstance(bound, group):
+            return isinstance(value, group)
+    return type(value) is type(bound)
+
+
+def _in_range(value, condition):
+    for operator, bound in condition.items():
+        if operator == '$not':
+            if _in_range(value, bound):
+                return False
+        elif not _comparable(value, bound):
+            return False
+        elif operator == '$gte' and not value >= bound:
+            return False
+        elif operator == '$lt' and not value < bound:
+            return False
+    return True
+
+
+def matches(document, filter):
+    for key, condition in filter.items():
+        if key == '$and':
+            if not all(matches(document, part) for part in condition):
+                return False
+        elif key == '_id':
+            if not _in_range(document['_id'], condition):
+                return False
+        elif document.get(key) != condition:
+            return False
+    return True
+
+
+def sort_key(value):
+    return (isinstance(value, six.string_types), value)
+
+
+class FakeCollection(object):
+    """Evaluates the filters built by the scans on a list of documents."""
+
+    def __init__(self, documents):
+        self.documents = documents
+        self.pipelines = []
+        self.finds = []
+        self.cursors = []
+
+    def aggregate(self, pipeline):
+        self.pipelines.append(pipeline)
+        documents = self.documents
+        if '$match' in pipeline[0]:
+            documents = [document for document in documents
+                         if matches(document, pipeline[0]['$match'])]
+        ids = sorted((document['_id'] for document in documents),
+                     key=sort_key)
+        stage = pipeline[-1]
+        if '$bucketAuto' in stage:
+            buckets = stage['$bucketAuto']['buckets']
+            size = -(-len(ids) // buckets)
+            return [{'_id': {'min': ids[index], 'max': ids[index + size - 1]}}
+                    for index in range(0, len(ids), size)]
+        return [{'_id': value} for value in ids]
+
+    def find(self, filter, projection, batch_size=0):
+        self.finds.append(filter)
+        cursor = FakeCursor([document for document in self.documents
+                             if matches(document, filter)])
+        self.cursors.append(cursor)
+        return cursor
+
+
+class FakeClient(object):
+    def __init__(self, collection, **kwargs):
+        self.kwargs = kwargs
+        self.collection = collection
+
+    def __getitem__(self, dbname):
+        return {'events': self.collection}
+
+
+class ParallelScanTestCase(TestCase):
+    def setUp(self):
+        documents = [{'_id': index, 'kind': index % 2} for index in range(100)]
+        # _ids of another type than most of the others.
+        documents.extend([{'_id': 'a', 'kind': 0}, {'_id': 'b', 'kind': 1}])
+        self.collection = FakeCollection(documents)
+        self.clients = []
+
+        def connection_class(**kwargs):
+            client = FakeClient(self.collection, **kwargs)
+            self.clients.append(client)
+            return client
+        config = [{'label1': {'host': '127.0.0.1', 'port': 27017,
+                              'dbpath': 'analytics',
+                              'read_preference': 'secondary_preferred'}}]
+        self.pool = MongoPool(config, connection_class=connection_class)
+
+    def ids(self, documents):
+        return sorted((document['_id'] for document in documents),
+                      key=sort_key)
+
+    def test_reads_every_document_once(self):
+        documents = list(self.pool.parallel_scan(
+            'analytics', 'events', partitions=4, workers=2, batch_size=7))
+        self.assertEqual(self.ids(documents),
+                         self.ids(self.collection.documents))
+        self.assertEqual(len(self.collection.finds), 4)
+        self.assertTrue(all(cursor.closed
+                            for cursor in self.collection.cursors))
+        # The cluster's Client is used, with its read preference.
+        self.assertEqual(len(self.clients), 1)
+        self.assertEqual(self.clients[0].kwargs['read_preference'],
+                         pymongo.ReadPreference.SECONDARY_PREFERRED)
+
+    def test_bucket_auto_split(self):
+        documents = list(self.pool.parallel_scan(
+            'analytics', 'events', {'kind': 1}, partitions=3,
+            split='bucket_auto'))
+        self.assertEqual(self.ids(documents),
+                         [index for index in range(100) if index % 2] + ['b'])
+        self.assertIn('$bucketAuto', self.collection.pipelines[0][-1])
+        self.assertEqual(self.collection.pipelines[0][0],
+                         {'$match': {'kind': 1}})
+
+    def test_callback_gets_batches(self):
+        batches = []
+        count = self.pool.parallel_scan(
+            'analytics', 'events', partitions=5, batch_size=10,
+            callback=lambda filter, batch: batches.append(batch))
+        self.assertEqual(count, 102)
+        self.assertTrue(all(0 < len(batch) <= 10 for batch in batches))
+        self.assertEqual(self.ids(sum(batches, [])),
+                         self.ids(self.collection.documents))
+
+    def test_callback_errors_are_raised(self):
+        def callback(filter, batch):
+            raise ValueError('failed')
+        with self.assertRaises(ValueError):
+            self.pool.parallel_scan('analytics', 'events', callback=callback)
+
+    def test_closing_the_generator_closes_cursors(self):
+        documents = self.pool.parallel_scan('analytics', 'events',
+                                            partitions=4, batch_size=1)
+        next(documents)
+        documents.close()
+        self.assertEqual(len(self.collection.cursors), 4)
+        self.assertTrue(all(cursor.closed
+                            for cursor in self.collection.cursors))
+
+    def test_single_partition(self):
+        documents = list(self.pool.parallel_scan('analytics', 'events',
+                                                 {'kind': 0}, partitions=1))
+        self.assertEqual(len(documents), 51)
+        self.assertEqual(self.collection.finds, [{'kind': 0}])
+        self.assertEqual(self.collection.pipelines, [])
+
+    def test_invalid_arguments(self):
+        for kwargs in ({'partitions': 0}, {'workers': 0},
+                       {'batch_size': 1.5}, {'split': 'random'}):
+            with self.assertRaises(ValueError):
+                self.pool.parallel_scan('analytics', 'events', **kwargs)
+
+
+class PartitionTestCase(TestCase):
+    def test_split_points_of_few_ids(self):
+        collection = FakeCollection([{'_id': 1}, {'_id': 2}])
+        self.assertEqual(split_points(collection, partitions=8), [2])
+        self.assertEqual(split_points(FakeCollection([]), partitions=8), [])
+
+    def test_partition_filters(self):
+        self.assertEqual(partition_filters(None, []), [{}])
+        self.assertEqual(partition_filters({'a': 1}, [5, 9]), [
+            {'$and': [{'a': 1}, {'_id': {'$not': {'$gte': 5}}}]},
+            {'$and': [{'a': 1}, {'_id': {'$gte': 5, '$lt': 9}}]},
+            {'$and': [{'a': 1}, {'_id': {'$gte': 9}}]}])
@@ -0,0 +1,161 @@
+import threading
+import time
+from unittest import TestCase
+
+from pymongo.errors import AutoReconnect, ConnectionFailure, NetworkTimeout
+
+from mongo_pool import MongoPool
+from mongo_pool.admission import ClusterSaturated
+from mongo_pool.simulation import Simulation, constant, lognormal
+
+
+class SimulationTestCase(TestCase):
+    def setUp(self):
+        self.config = [{'fast': {'host': '127.0.0.1', 'port': 27017,
+                                 'dbpath': 'fast_.*'}},
+                       {'slow': {'host': '127.0.0.1', 'port': 27018,
+                                 'dbpath': 'slow_.*'}}]
+
+    def make_pool(self, settings=None, **kwargs):
+        self.simulation = Simulation(self.config, settings, seed=1)
+        return MongoPool(self.config, connection_class=self.simulation,
+                         **kwargs)
+
+    def timed(self, function, *args):
+        start = time.time()
+        result = function(*args)
+        return result, time.time() - start
+
+    def test_documents_round_trip(self):
+        pool = self.make_pool()
+        events = pool.fast_1.events
+        events.insert_one({'_id': 1, 'type': 'click'})
+        events.insert_many([{'type': 'view'}, {'type': 'click'}])
+        self.assertEqual(events.find_one({'_id': 1}),
+                         {'_id': 1, 'type': 'click'})
+        self.assertEqual(events.count_documents({'type': 'click'}), 2)
+        events.update_one({'_id': 1}, {'$set': {'type': 'tap'}})
+        self.assertEqual([document['type'] for document in
+                          events.find({'_id': 1})], ['tap'])
+        events.delete_many({'type': 'view'})
+        self.assertEqual(events.count_documents({}), 2)
+        # Databases of other clusters are elsewhere.
+        self.assertIsNone(pool.slow_1.events.find_one())
+        self.assertEqual(pool.get_cluster('fast').list_database_names(),
+                         ['fast_1'])
+
+    def test_seed_lists(self):
+        self.config[0]['fast']['host'] = ['127.0.0.2', '127.0.0.1']
+        pool = self.make_pool({'fast': {'latency_ms': 0}})
+        pool.fast_1.events.insert_one({'_id': 1})
+        self.assertEqual(pool.fast_1.events.find_one(), {'_id': 1})
+        self.assertEqual(self.simulation.stats()['fast']['operations'], 2)
+
+    def test_hedged_reads(self):
+        self.config[0]['fast'].update(replicaSet='rs0', hedge_delay_ms=5,
+                                      read_preference='secondary')
+        pool = self.make_pool({'fast': {'secondaries': 2, 'latency_ms': 20}})
+        pool.fast_1.events.insert_one({'_id': 1})
+        results = []
+        thread = threading.Thread(target=lambda: results.append(
+            pool.hedged_find_one('fast_1', 'events', {'_id': 1})))
+        thread.daemon = True
+        thread.start()
+        thread.join(5)
+        self.assertFalse(thread.is_alive())
+        # Secondaries share the data of their replica set.
+        self.assertEqual(results, [{'_id': 1}])
+        self.assertEqual(pool.stats()['hedging']['fast']['hedged'], 1)
+        self.assertEqual(self.simulation.stats()['fast']['clients'], 3)
+        with self.assertRaises(TypeError):
+            list(pool.fast_1)
+
+    def test_latency_per_label(self):
+        pool = self.make_pool({'slow': {'latency_ms': 30},
+                               'fast': {'latency_ms': {'find_one': 0,
+                                                       'default': 1}}})
+        _, elapsed = self.timed(pool.slow_1.events.find_one)
+        self.assertGreaterEqual(elapsed, 0.03)
+        _, elapsed = self.timed(pool.fast_1.events.find_one)
+        self.assertLess(elapsed, 0.03)
+
+    def test_connections_are_opened_once(self):
+        pool = self.make_pool({'fast': {'connect_ms': 30}})
+        _, elapsed = self.timed(pool.fast_1.events.find_one)
+        self.assertGreaterEqual(elapsed, 0.03)
+        _, elapsed = self.timed(pool.fast_1.events.find_one)
+        self.assertLess(elapsed, 0.03)
+        stats = self.simulation.stats()['fast']
+        self.assertEqual((stats['clients'], stats['connections'],
+                          stats['operations']), (1, 1, 2))
+
+    def test_checkouts_wait_for_the_pool(self):
+        pool = self.make_pool({'fast': {'latency_ms': 50, 'pool_size': 1}})
+        thread = threading.Thread(target=pool.fast_1.events.find_one)
+        thread.start()
+        time.sleep(0.01)
+        _, elapsed = self.timed(pool.fast_1.events.find_one)
+        thread.join()
+        self.assertGreaterEqual(elapsed, 0.03)
+        stats = self.simulation.stats()['fast']
+        self.assertEqual(stats['checkout_waits'], 1)
+        self.assertEqual(stats['max_in_use'], 1)
+
+        pool = self.make_pool({'fast': {'latency_ms': 50, 'pool_size': 1}},
+                              client_options={'waitQueueTimeoutMS': 10})
+        thread = threading.Thread(target=pool.fast_1.events.find_one)
+        thread.start()
+        time.sleep(0.01)
+        with self.assertRaises(ConnectionFailure):
+            pool.fast_1.events.find_one()
+        thread.join()
+
+    def test_injected_failures(self):
+        pool = self.make_pool({'fast': {'failure_rate': 1}})
+        with self.assertRaises(AutoReconnect):
+            pool.fast_1.events.find_one()
+        self.simulation.update('fast', failure_rate=0, timeout_rate=1,
+                               timeout_ms=20)
+        with self.assertRaises(NetworkTimeout):
+            pool.fast_1.events.find_one()
+        self.simulation.update('fast', timeout_rate=0)
+        pool.fast_1.events.find_one()
+        stats = self.simulation.stats()['fast']
+        self.assertEqual((stats['failures'], stats['timeouts'],
+                          stats['operations']), (1, 1, 3))
+
+    def test_concurrency_limits_apply(self):
+        self.config[0]['fast'].update(max_concurrency=1, max_queue=0)
+        pool = self.make_pool({'fast': {'latency_ms': 50}})
+        thread = threading.Thread(target=pool.fast_1.events.find_one)
+        thread.start()
+        time.sleep(0.01)
+        with self.assertRaises(ClusterSaturated):
+            pool.fast_1.events.find_one()
+        thread.join()
+
+    def test_warmup_pays_the_connection_cost(self):
+        pool = self.make_pool({'fast': {'connect_ms': 30}})
+        results = pool.warmup(labels=['fast'])
+        self.assertIsNone(results['fast']['error'])
+        _, elapsed = self.timed(pool.fast_1.events.find_one)
+        self.assertLess(elapsed, 0.03)
+
+    def test_distributions(self):
+        simulation = Simulation(self.config, {
+            'fast': {'latency_ms': lognormal(10, 0.5)},
+            'slow': {'latency_ms': constant(20)}}, seed=1)
+        latencies = sorted(simulation.latency('fast', 'find')
+                           for _ in range(1000))
+        self.assertAlmostEqual(latencies[500], 0.01, delta=0.002)
+        self.assertEqual(simulation.latency('slow', 'find'), 0.02)
+
+    def test_validates_settings(self):
+        for settings, error in (({'latency': 1}, ValueError),
+                                ({'latency_ms': 'x'}, TypeError),
+                                ({'failure_rate': 2}, ValueError),
+                                ({'pool_size': 0}, ValueError),
+                                ({'connect_ms': None}, TypeError),
+                                ({'secondaries': -1}, ValueError)):
+            with self.assertRaises(error):
+                Simulation(self.config, {'fast': settings})
@@ -0,0 +1,125 @@
+import threading
+import time
+from unittest import TestCase
+
+from mock import MagicMock
+from pymongo.errors import AutoReconnect, BulkWriteError
+
+from mongo_pool import MongoPool
+from mongo_pool import writer as writer_module
+
+
+class BufferedWriterTestCase(TestCase):
+    def setUp(self):
+        self.client = MagicMock()
+        self.collection = self.client['logs']['requests']
+        self.inserted = []
+
+        def insert_many(documents, ordered):
+            self.inserted.append(list(documents))
+            return MagicMock(inserted_ids=[None] * len(documents))
+        self.collection.insert_many.side_effect = insert_many
+
+        config = [{'label1': {'host': '127.0.0.1', 'port': 27017,
+                              'dbpath': 'logs'}}]
+        self.pool = MongoPool(config, connection_class=lambda **kw: self.client)
+
+    def test_flushes_full_batches(self):
+        writer = self.pool.buffered_writer('logs', 'requests', max_batch=2,
+                                           max_delay_ms=60000)
+        for i in range(5):
+            writer.write({'i': i})
+        self.assertTrue(writer.flush(timeout=5))
+        writer.close()
+
+        self.assertEqual([len(batch) for batch in self.inserted], [2, 2, 1])
+        stats = writer.stats()
+        self.assertEqual(stats['written'], 5)
+        self.assertEqual(stats['flush_latency']['count'], 3)
+        self.collection.insert_many.assert_called_with([{'i': 4}],
+                                                       ordered=False)
+
+    def test_flushes_after_delay(self):
+        flushed = threading.Event()
+        self.collection.insert_many.side_effect = (
+            lambda documents, ordered: flushed.set() or
+            MagicMock(inserted_ids=documents))
+        writer = self.pool.buffered_writer('logs', 'requests', max_batch=100,
+                                           max_delay_ms=10)
+        writer.write({'i': 1})
+        self.assertTrue(flushed.wait(5))
+        writer.close()
+
+    def test_batching_resumes_after_a_flush_timeout(self):
+        release = threading.Event()
+        self.collection.insert_many.side_effect = (
+            lambda documents, ordered: release.wait(5) and
+            MagicMock(inserted_ids=documents))
+        writer = self.pool.buffered_writer('logs', 'requests', max_batch=100,
+                                           max_delay_ms=60000)
+        writer.write({'i': 1})
+        self.assertFalse(writer.flush(timeout=0.05))
+        release.set()
+        while self.collection.insert_many.call_count < 1:
+            time.sleep(0.01)
+        writer.write({'i': 2})
+        time.sleep(0.05)
+        # The document waits for a full batch or max_delay_ms again.
+        self.assertEqual(writer.stats()['buffered'], 1)
+        writer.close()
+        self.assertEqual(writer.stats()['written'], 2)
+
+    def test_closed_writers_are_not_closed_at_exit(self):
+        writer = self.pool.buffered_writer('logs', 'requests')
+        self.assertIn(writer, writer_module._writers)
+        writer.close()
+        self.assertNotIn(writer, writer_module._writers)
+
+    def test_close_flushes_and_rejects_writes(self):
+        with self.pool.buffered_writer('logs', 'requests',
+                                       max_delay_ms=60000) as writer:
+            writer.write({'i': 1})
+        self.assertEqual(self.inserted, [[{'i': 1}]])
+        with self.assertRaises(ValueError):
+            writer.write({'i': 2})
+
+    def test_drops_when_full_without_blocking(self):
+        release = threading.Event()
+        self.collection.insert_many.side_effect = (
+            lambda documents, ordered: release.wait(5) and
+            MagicMock(inserted_ids=documents))
+        writer = self.pool.buffered_writer('logs', 'requests', max_batch=1,
+                                           max_buffer=1, block=False)
+        results = [writer.write({'i': i}) for i in range(10)]
+        release.set()
+        writer.close()
+
+        self.assertFalse(all(results))
+        self.assertEqual(writer.stats()['dropped'], results.count(False))
+
+    def test_blocking_write_times_out(self):
+        release = threading.Event()
+        self.collection.insert_many.side_effect = (
+            lambda documents, ordered: release.wait(5) and
+            MagicMock(inserted_ids=documents))
+        writer = self.pool.buffered_writer('logs', 'requests', max_batch=1,
+                                           max_buffer=1)
+        writer.write({'i': 1})
+        writer.write({'i': 2})
+        self.assertFalse(writer.write({'i': 3}, timeout=0.05))
+        release.set()
+        writer.close()
+        self.assertEqual(writer.stats()['dropped'], 1)
+
+    def test_counts_failures(self):
+        self.collection.insert_many.side_effect = [
+            BulkWriteError({'nInserted': 1}), AutoReconnect('down')]
+        writer = self.pool.buffered_writer('logs', 'requests', max_batch=2,
+                                           max_delay_ms=60000)
+        for i in range(4):
+            writer.write({'i': i})
+        writer.close()
+
+        stats = writer.stats()
+        self.assertEqual(stats['written'], 1)
+        self.assertEqual(stats['failed'], 3)